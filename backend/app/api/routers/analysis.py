@@ -1,9 +1,87 @@
-from fastapi import APIRouter, HTTPException
-from app.schemas.analysis import AnalysisRequest, AnalysisResponse
+import asyncio
+import json
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.schemas.analysis import (
+    AnalysisRequest, AnalysisResponse, BatchAnalysisRequest, BatchAnalysisResponse, ProfileRequest, ProfileResponse
+)
 from app.services.analysis_service import analysis_service
+from app.services.execution_service import NDJSON_MEDIA_TYPE
+from app.services.profile_service import profile_service
+from app.services.executors import analysis_executor, query_executor
 
 router = APIRouter()
 
 @router.post("/analyze/stats", response_model=AnalysisResponse)
-def analyze_stats(req: AnalysisRequest):
-    return analysis_service.analyze_stats(req)
+async def analyze_stats(req: AnalysisRequest):
+    try:
+        return await analysis_executor.run(analysis_service.analyze_stats, req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(req: BatchAnalysisRequest, accept: Optional[str] = Header(None)):
+    """Many (column, type) analyses of one table with shared scans; NDJSON results as they finish if requested via Accept."""
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        return await _stream_batch(req)
+    try:
+        return await analysis_executor.run(analysis_service.analyze_batch, req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _stream_batch(req: BatchAnalysisRequest) -> StreamingResponse:
+    loop = asyncio.get_running_loop()
+    results: asyncio.Queue = asyncio.Queue()
+    task = asyncio.ensure_future(analysis_executor.run(
+        analysis_service.analyze_batch, req, lambda result: loop.call_soon_threadsafe(results.put_nowait, result)
+    ))
+    # Errors of the whole batch (unknown table, saturation, memory) still get their status code
+    first = asyncio.ensure_future(results.get())
+    await asyncio.wait({task, first}, return_when=asyncio.FIRST_COMPLETED)
+    if not first.done():
+        first.cancel()
+        try:
+            task.result()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        if first.done() and not first.cancelled():
+            yield (first.result().model_dump_json() + "\n").encode()
+        while not (task.done() and results.empty()):
+            getter = asyncio.ensure_future(results.get())
+            await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield (getter.result().model_dump_json() + "\n").encode()
+            else:
+                getter.cancel()
+        if task.exception() is not None:
+            yield (json.dumps({"error": str(task.exception())}) + "\n").encode()
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+@router.post("/profile", response_model=ProfileResponse)
+async def profile_table(req: ProfileRequest):
+    """Count/nulls/distinct/moments/quantiles/histogram for every column in two scans."""
+    try:
+        return await analysis_executor.run(profile_service.profile, req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/column-stats/{table_name}")
+async def column_stats(table_name: str, session_id: Optional[str] = None):
+    """Per-column count/nulls/distinct/min/max/mean/std/histogram from the stats index (no scan when fresh)."""
+    try:
+        return await query_executor.run(analysis_service.column_stats, table_name, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/column-values/{table_name}/{column}")
+async def column_values(table_name: str, column: str, session_id: Optional[str] = None,
+                        search: Optional[str] = None, limit: int = 1000):
+    """Distinct values with row counts for the grid's set filter, from the stats index."""
+    try:
+        return await query_executor.run(analysis_service.column_values, table_name, column, session_id, search, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
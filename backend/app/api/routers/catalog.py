@@ -1,12 +1,40 @@
 from fastapi import APIRouter, HTTPException
-from app.schemas.catalog import DatabaseSchema
+from typing import Optional
+from app.schemas.catalog import DatabaseSchema, SchemaList, TableList, TableSchema
 from app.services.catalog_service import catalog_service
+from app.services.executors import query_executor
 
 router = APIRouter()
 
 @router.get("/schema/{conn_id}", response_model=DatabaseSchema)
-def get_schema(conn_id: str):
-    schema = catalog_service.get_schema(conn_id)
-    if not schema:
-        raise HTTPException(status_code=404, detail="Schema not found or connection invalid")
-    return schema
+async def get_schema(conn_id: str, session_id: Optional[str] = None, columns: bool = False):
+    try:
+        return await query_executor.run(catalog_service.get_schema, conn_id, session_id, include_columns=columns)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/catalog/{conn_id}/schemas", response_model=SchemaList)
+async def list_schemas(conn_id: str, session_id: Optional[str] = None, refresh: bool = False):
+    try:
+        return await query_executor.run(catalog_service.list_schemas, conn_id, session_id, refresh=refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/catalog/{conn_id}/schemas/{schema}/tables", response_model=TableList)
+async def list_tables(conn_id: str, schema: str, session_id: Optional[str] = None, refresh: bool = False):
+    try:
+        return await query_executor.run(catalog_service.list_tables, conn_id, schema, session_id, refresh=refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/catalog/{conn_id}/schemas/{schema}/tables/{table}", response_model=TableSchema)
+async def get_table(conn_id: str, schema: str, table: str, session_id: Optional[str] = None, refresh: bool = False):
+    try:
+        return await query_executor.run(catalog_service.get_table, conn_id, schema, table, session_id, refresh=refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/catalog/{conn_id}/refresh")
+async def refresh_catalog(conn_id: str):
+    catalog_service.invalidate(conn_id)
+    return {"status": "ok"}
@@ -2,16 +2,19 @@ from fastapi import APIRouter, HTTPException
 from typing import List
 from app.schemas.connection import ConnectionCreate, ConnectionResponse
 from app.services.connection_service import connection_service
+from app.services.executors import ExecutorSaturated, query_executor
 
 router = APIRouter()
 
 @router.get("/connections", response_model=List[ConnectionResponse])
-def list_connections():
+async def list_connections():
     return connection_service.list_connections()
 
 @router.post("/connect", response_model=ConnectionResponse)
-def create_connection(conn: ConnectionCreate):
+async def create_connection(conn: ConnectionCreate):
     try:
-        return connection_service.create_connection(conn)
+        return await query_executor.run(connection_service.create_connection, conn)
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+from app.schemas.ingest import ImportRequest, IngestJob, IngestJobList
+from app.services.ingest_service import ingest_service
+
+router = APIRouter()
+
+@router.post("/import", response_model=IngestJob, status_code=202)
+async def import_files(req: ImportRequest):
+    """Start a background import of files/globs/directories already on the server."""
+    try:
+        return ingest_service.submit(req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/upload", response_model=IngestJob, status_code=202)
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    table_name: str = Form(...),
+    format: Optional[str] = Form(None),
+    mode: str = Form("table"),
+    if_exists: str = Form("replace"),
+):
+    """Store the uploaded file(s), then import them like `/import` does."""
+    paths = []
+    for upload in files:
+        paths.append(await run_in_threadpool(ingest_service.save_upload, upload.file, upload.filename))
+    try:
+        return ingest_service.submit(ImportRequest(
+            table_name=table_name, paths=paths, format=format, mode=mode, if_exists=if_exists,
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/jobs", response_model=IngestJobList)
+async def list_jobs():
+    return ingest_service.list_jobs()
+
+@router.get("/jobs/{job_id}", response_model=IngestJob)
+async def get_job(job_id: str):
+    try:
+        return ingest_service.get_job(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/jobs/{job_id}/cancel", response_model=IngestJob)
+async def cancel_job(job_id: str):
+    try:
+        return ingest_service.cancel(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -1,8 +1,11 @@
 
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict
 from app.services.python_service import python_service
+from app.services.kernel_pool import KernelError
+from app.services.executors import python_executor
 
 router = APIRouter()
 
@@ -14,27 +17,66 @@ class ExecuteResponse(BaseModel):
     status: str
     stdout: str
     error: Optional[str] = None
-    variables: List[Dict[str, Any]]
+    variables: List[Dict[str, Any]] # DataFrames added/changed by this cell ("change": "added" | "changed")
+    removed: List[str] = [] # DataFrames deleted by this cell
 
 class PublishRequest(BaseModel):
     session_id: str
     var_name: str
     table_name: Optional[str] = None
+    materialize: bool = False # Snapshot into a table instead of a zero-copy view
+
+class SessionRequest(BaseModel):
+    session_id: str
 
 @router.post("/run", response_model=ExecuteResponse)
-def run_python(req: ExecuteRequest):
-    """Execute Python code in a persistent session."""
-    return python_service.execute_script(req.session_id, req.code)
+async def run_python(req: ExecuteRequest):
+    """Execute Python code in the session's kernel process."""
+    try:
+        return await python_executor.run(python_service.execute_script, req.session_id, req.code)
+    except KernelError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.post("/interrupt")
+async def interrupt_python(req: SessionRequest):
+    """Interrupt the cell currently running in the session (KeyboardInterrupt)."""
+    if not python_service.interrupt(req.session_id):
+        raise HTTPException(status_code=404, detail="No kernel for this session")
+    return {"status": "interrupted"}
+
+@router.post("/restart")
+async def restart_python(req: SessionRequest):
+    """Shut down the session's kernel, discarding its variables."""
+    # Not subject to admission control: this is how users free a stuck session
+    await run_in_threadpool(python_service.restart, req.session_id)
+    return {"status": "restarted"}
 
 @router.get("/variables", response_model=List[Dict[str, Any]])
-def get_variables(session_id: str):
+async def get_variables(session_id: str):
     """Get list of active DataFrame variables in the session."""
-    return python_service.get_variables(session_id)
+    try:
+        return await python_executor.run(python_service.get_variables, session_id)
+    except KernelError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/variables/{name}/preview")
+async def preview_variable(name: str, session_id: str, offset: int = 0, limit: int = 50):
+    """Page through a DataFrame variable ({"columns", "index", "data", "total_rows"})."""
+    try:
+        return await python_executor.run(python_service.preview_variable, session_id, name, offset, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except KernelError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 @router.post("/publish")
-def publish_variable(req: PublishRequest):
-    """Publish a Python variable to the SQL workspace (Mocked)."""
+async def publish_variable(req: PublishRequest):
+    """Publish a Python DataFrame to the SQL workspace."""
     try:
-        return python_service.publish_variable(req.session_id, req.var_name, req.table_name)
+        return await python_executor.run(
+            python_service.publish_variable, req.session_id, req.var_name, req.table_name, req.materialize
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except KernelError as e:
+        raise HTTPException(status_code=503, detail=str(e))
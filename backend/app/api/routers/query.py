@@ -1,19 +1,113 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from app.schemas.preview import PreviewRequest, PreviewResponse, QueryRequest
-from app.services.execution_service import execution_service
+from app.services.session_pool import SessionPoolExhausted
+from app.services.connection_service import connection_service
+from app.services.executors import ExecutorSaturated, query_executor
+from app.services.resource_governor import MemoryBudgetExceeded
+from app.services.result_cache import result_cache
+from app.services.execution_service import (
+    execution_service,
+    ARROW_STREAM_MEDIA_TYPE,
+    COLUMNAR_JSON_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+)
 
 router = APIRouter()
 
+
+def _encode(sql: str, limit: Optional[int], offset: int, accept: Optional[str],
+            session_id: Optional[str], timeout: Optional[float] = None) -> Optional[Response]:
+    """Binary/columnar encodings selected by the Accept header; None means default JSON records."""
+    accept = accept or ""
+    if ARROW_STREAM_MEDIA_TYPE in accept:
+        query_id, total_rows, chunks = execution_service.stream_sql(
+            sql, media_type=ARROW_STREAM_MEDIA_TYPE, limit=limit, offset=offset, timeout=timeout,
+            session_id=session_id
+        )
+        headers = {"X-Query-Id": query_id}
+        if total_rows is not None:
+            headers["X-Total-Rows"] = str(total_rows)
+        return StreamingResponse(chunks, media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers,
+                                 background=BackgroundTask(chunks.close))
+    if COLUMNAR_JSON_MEDIA_TYPE in accept:
+        body = execution_service.run_sql_columnar(sql, limit=limit, offset=offset, session_id=session_id,
+                                                  timeout=timeout)
+        return Response(json.dumps(body, default=str, allow_nan=False), media_type=COLUMNAR_JSON_MEDIA_TYPE)
+    return None
+
+
 @router.post("/preview", response_model=PreviewResponse)
-def preview_data(req: PreviewRequest):
+async def preview_data(req: PreviewRequest, accept: Optional[str] = Header(None)):
+    return await query_executor.run(_preview, req, accept)
+
+def _preview(req: PreviewRequest, accept: Optional[str]):
     try:
+        if connection_service.is_external(req.connection_id):
+            conn = connection_service.get_connection(req.connection_id)
+            if not conn.get("attached"):
+                return connection_service.preview(req)
+            # Attached sources are scanned by the local engine, encodings included
+            req = connection_service.preview_request(req)
+        sql = execution_service.preview_sql(req)
+        if sql is not None:
+            encoded = _encode(sql, req.limit, req.offset, accept, req.session_id, req.timeout)
+            if encoded is not None:
+                return encoded
         return execution_service.preview_table(req)
+    except SessionPoolExhausted as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except MemoryBudgetExceeded:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/run", response_model=PreviewResponse)
-def run_query(req: QueryRequest):
+async def run_query(req: QueryRequest, accept: Optional[str] = Header(None)):
+    return await query_executor.run(_run, req, accept)
+
+def _run(req: QueryRequest, accept: Optional[str]):
     try:
-        return execution_service.run_sql(req.sql)
+        encoded = _encode(req.sql, req.limit, req.offset, accept, req.session_id, req.timeout)
+        if encoded is not None:
+            return encoded
+        return execution_service.run_sql(req.sql, limit=req.limit, offset=req.offset, session_id=req.session_id,
+                                         timeout=req.timeout)
+    except SessionPoolExhausted as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except MemoryBudgetExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and memory use of the result cache."""
+    return result_cache.stats()
+
+@router.post("/stream")
+async def stream_query(req: QueryRequest, accept: Optional[str] = Header(None)):
+    """Stream the full result as it is produced: NDJSON rows, or Arrow IPC if requested via Accept."""
+    media_type = ARROW_STREAM_MEDIA_TYPE if accept and ARROW_STREAM_MEDIA_TYPE in accept else NDJSON_MEDIA_TYPE
+    try:
+        query_id, _, chunks = await query_executor.run(
+            execution_service.stream_sql, req.sql, media_type=media_type, timeout=req.timeout,
+            session_id=req.session_id
+        )
+    except (ExecutorSaturated, MemoryBudgetExceeded):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(chunks, media_type=media_type, headers={"X-Query-Id": query_id},
+                             background=BackgroundTask(chunks.close))
+
+@router.post("/{query_id}/cancel")
+async def cancel_query(query_id: str):
+    if not execution_service.cancel(query_id):
+        raise HTTPException(status_code=404, detail="Query not found or already finished")
+    return {"query_id": query_id, "status": "cancelled"}
@@ -0,0 +1,96 @@
+"""Runtime settings, overridable through DATASNAIL_* environment variables."""
+import os
+from typing import Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class Settings:
+    def __init__(self):
+        # DuckDB workspace: ":memory:" or a database file that survives restarts.
+        # Extra workers/replicas can open the same file read-only.
+        self.duckdb_path = os.getenv("DATASNAIL_DB_PATH") or ":memory:"
+        self.duckdb_read_only = os.getenv("DATASNAIL_DB_READ_ONLY", "").lower() in ("1", "true", "yes")
+
+        # DuckDB engine. threads/memory_limit are database-wide in DuckDB, so
+        # they apply to every session connection alike.
+        self.duckdb_threads: Optional[int] = _env_int("DATASNAIL_DUCKDB_THREADS", 0) or None
+        self.duckdb_memory_limit: Optional[str] = os.getenv("DATASNAIL_DUCKDB_MEMORY_LIMIT") or None
+
+        # Per-session connection pool
+        self.session_pool_size = _env_int("DATASNAIL_SESSION_POOL_SIZE", 32)
+        self.session_idle_timeout = _env_float("DATASNAIL_SESSION_IDLE_TIMEOUT", 1800.0)
+
+        # Result cache for SQL/analysis endpoints
+        self.result_cache_mb = _env_int("DATASNAIL_RESULT_CACHE_MB", 256)
+
+        # Catalog (sidebar tree) cache: entries older than this are served stale
+        # while they are refreshed in the background
+        self.catalog_ttl = _env_float("DATASNAIL_CATALOG_TTL", 300.0)
+        self.catalog_cache_entries = _env_int("DATASNAIL_CATALOG_CACHE_ENTRIES", 4096)
+
+        # Pooled connections to external databases (per connection)
+        self.external_pool_size = _env_int("DATASNAIL_EXTERNAL_POOL_SIZE", 5)
+        self.external_max_overflow = _env_int("DATASNAIL_EXTERNAL_MAX_OVERFLOW", 10)
+        self.external_pool_recycle = _env_int("DATASNAIL_EXTERNAL_POOL_RECYCLE", 1800)
+
+        # Worker threads and queue depth per workload class (see services/executors.py)
+        self.query_workers = _env_int("DATASNAIL_QUERY_WORKERS", 8)
+        self.query_queue = _env_int("DATASNAIL_QUERY_QUEUE", 64)
+        self.analysis_workers = _env_int("DATASNAIL_ANALYSIS_WORKERS", 4)
+        self.analysis_queue = _env_int("DATASNAIL_ANALYSIS_QUEUE", 16)
+        # Threads running the independent scan groups of batch analyses
+        self.analysis_batch_workers = _env_int("DATASNAIL_ANALYSIS_BATCH_WORKERS", 4)
+
+        # Out-of-process Python kernels, one per session
+        self.kernel_pool_size = _env_int("DATASNAIL_KERNEL_POOL_SIZE", 16)
+        self.kernel_idle_timeout = _env_float("DATASNAIL_KERNEL_IDLE_TIMEOUT", 3600.0)
+        self.kernel_timeout = _env_float("DATASNAIL_KERNEL_TIMEOUT", 600.0) # Per cell, seconds
+        self.kernel_memory_mb = _env_int("DATASNAIL_KERNEL_MEMORY_MB", 0) # 0 = no cap
+        self.python_workers = _env_int("DATASNAIL_PYTHON_WORKERS", self.kernel_pool_size)
+        self.python_queue = _env_int("DATASNAIL_PYTHON_QUEUE", 32)
+
+        # File imports run as background jobs (see services/ingest_service.py).
+        # Uploads are spooled to `upload_dir`; "parquet" imports are written to `parquet_dir`
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+        self.ingest_workers = _env_int("DATASNAIL_INGEST_WORKERS", 2)
+        self.ingest_job_history = _env_int("DATASNAIL_INGEST_JOB_HISTORY", 256)
+        self.upload_dir = os.getenv("DATASNAIL_UPLOAD_DIR") or os.path.join(data_dir, "uploads")
+        self.parquet_dir = os.getenv("DATASNAIL_PARQUET_DIR") or os.path.join(data_dir, "parquet")
+
+        # Memory budget of the API process (see services/resource_governor.py), in MB;
+        # 0 = three quarters of physical memory. Published DataFrames may use
+        # `published_memory_mb` of it (0 = a quarter), one session `session_memory_mb`
+        # (0 = no cap); DuckDB gets the rest unless DATASNAIL_DUCKDB_MEMORY_LIMIT is set.
+        # Frames of sessions idle for `spill_idle_timeout` seconds are spilled to
+        # `spill_dir`, which also holds DuckDB's temporary files
+        self.memory_budget_mb = _env_int("DATASNAIL_MEMORY_BUDGET_MB", 0)
+        self.published_memory_mb = _env_int("DATASNAIL_PUBLISHED_MEMORY_MB", 0)
+        self.session_memory_mb = _env_int("DATASNAIL_SESSION_MEMORY_MB", 0)
+        self.spill_idle_timeout = _env_float("DATASNAIL_SPILL_IDLE_TIMEOUT", 600.0)
+        self.spill_dir = os.getenv("DATASNAIL_SPILL_DIR") or os.path.join(data_dir, "spill")
+        self.spill_max_size: Optional[str] = os.getenv("DATASNAIL_SPILL_MAX_SIZE") or None
+
+        # Request tracing (Server-Timing header, /metrics). DuckDB query profiles
+        # are kept for requests sent with `X-Profile: 1`, or for every request
+        self.profile_queries = os.getenv("DATASNAIL_PROFILE_QUERIES", "").lower() in ("1", "true", "yes")
+        self.profile_history = _env_int("DATASNAIL_PROFILE_HISTORY", 64)
+
+    def duckdb_config(self) -> dict:
+        config = {}
+        if self.duckdb_threads:
+            config["threads"] = self.duckdb_threads
+        if self.duckdb_memory_limit:
+            config["memory_limit"] = self.duckdb_memory_limit
+        return config
+
+
+settings = Settings()
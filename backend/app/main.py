@@ -1,8 +1,34 @@
-from fastapi import FastAPI
+import re
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routers import connections, catalog, query, analysis, python
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api.routers import connections, catalog, query, analysis, python, ingest
+from app.services import tracing
+from app.services.execution_service import execution_service
+from app.services.executors import ExecutorSaturated, query_executor, analysis_executor, python_executor
+from app.services.kernel_pool import kernel_pool
+from app.services.query_builder import query_builder
+from app.services.resource_governor import MemoryBudgetExceeded
+from app.services.result_cache import result_cache
 
-app = FastAPI(title="DataSnail API", version="0.1.0")
+class TracedJSONResponse(JSONResponse):
+    """JSON responses whose encoding time and size land in the request trace."""
+
+    def render(self, content) -> bytes:
+        with tracing.span("encode"):
+            body = super().render(content)
+        tracing.count("response_bytes", len(body))
+        return body
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    execution_service.close()
+
+app = FastAPI(title="DataSnail API", version="0.1.0", lifespan=lifespan,
+              default_response_class=TracedJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -11,8 +37,49 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Trace-Id", "X-Profile-Id", "X-Query-Id", "X-Total-Rows"],
 )
 
+def _route_template(scope) -> str:
+    """
+    Matched route template with its router prefix (`/api/query/{query_id}/cancel`):
+    templates, not raw paths, keep the metrics label set bounded. Recent FastAPI
+    versions keep the router-relative route in scope["route"], so the prefix is
+    recovered from the request path.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    params = scope.get("path_params", {})
+    rendered = re.sub(r"{(\w+)(?::\w+)?}", lambda m: str(params.get(m.group(1), m.group(0))), route.path)
+    path = scope["path"]
+    prefix = path[:-len(rendered)] if rendered and path.endswith(rendered) else ""
+    return prefix + route.path
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Per-phase timings of this request (see services/tracing.py); `X-Profile: 1`
+    # also captures the DuckDB profile of its queries
+    profile = request.headers.get("x-profile", "").lower() in ("1", "true", "yes")
+    trace, token = tracing.start(profile=profile)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        tracing.finish(token)
+        path = _route_template(request.scope)
+        tracing.metrics.inc("datasnail_requests_total", method=request.method, route=path, status=status)
+        tracing.metrics.observe("datasnail_request_duration_seconds",
+                                time.perf_counter() - trace.started, route=path)
+
+    response.headers["Server-Timing"] = trace.server_timing()
+    response.headers["Timing-Allow-Origin"] = "*"
+    response.headers["X-Trace-Id"] = trace.id
+    if trace.profiles:
+        response.headers["X-Profile-Id"] = trace.id
+    return response
+
 # Include Routers
 app.include_router(connections.router, prefix="/api", tags=["connections"])
 app.include_router(catalog.router, prefix="/api", tags=["catalog"])
@@ -20,7 +87,56 @@ app.include_router(query.router, prefix="/api/query", tags=["query"])
 app.include_router(analysis.router, prefix="/api/analysis", tags=["analysis"])
 app.include_router(connections.router, prefix="/api/connections", tags=["connections"])
 app.include_router(python.router, prefix="/api/python", tags=["python"])
+app.include_router(ingest.router, prefix="/api/ingest", tags=["ingest"])
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated(request: Request, exc: ExecutorSaturated):
+    # Backpressure: the client should retry rather than pile onto a full queue
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(MemoryBudgetExceeded)
+async def memory_budget_exceeded(request: Request, exc: MemoryBudgetExceeded):
+    # Refuse one query rather than let the process run out of memory
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok", "version": "0.1.0"}
+
+@app.get("/health/executors")
+async def executor_stats():
+    return {e.name: e.stats() for e in (query_executor, analysis_executor, python_executor)}
+
+@app.get("/health/memory")
+async def memory_stats():
+    """Process memory against the budget, and per session: published frames and kernel RSS."""
+    sessions = execution_service.governor.sessions()
+    for session_id, rss in kernel_pool.memory().items():
+        sessions.setdefault(session_id, {})["kernel_rss_bytes"] = rss
+    return {"process": execution_service.governor.stats(), "sessions": sessions}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    gauges = []
+    for e in (query_executor, analysis_executor, python_executor):
+        for key, value in e.stats().items():
+            gauges.append((f"datasnail_executor_{key}", {"executor": e.name}, value))
+    for prefix, stats in (("result_cache", result_cache.stats()), ("sessions", execution_service.pool.stats()),
+                          ("kernels", kernel_pool.stats()), ("prepared", query_builder.stats()),
+                          ("memory", execution_service.governor.stats())):
+        for key, value in stats.items():
+            gauges.append((f"datasnail_{prefix}_{key}", {}, value))
+    return PlainTextResponse(tracing.metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/profiles")
+async def list_profiles():
+    return tracing.profiles.list()
+
+@app.get("/metrics/profiles/{trace_id}")
+async def get_profile(trace_id: str):
+    captured = tracing.profiles.get(trace_id)
+    if captured is None:
+        raise HTTPException(status_code=404, detail=f"No profile captured for trace '{trace_id}'")
+    return captured
@@ -4,9 +4,82 @@ from typing import List, Dict, Any, Optional
 class AnalysisRequest(BaseModel):
     table_name: str
     column: str
-    type: str # 'distribution', 'stats', 'outlier'
+    type: str # 'distribution', 'outlier', 'missing', 'dupes', 'correlation', 'binning', 'woe', 'psi'
+    session_id: Optional[str] = "default"
+    # correlation only
+    method: Optional[str] = "pearson" # 'pearson' | 'spearman'
+    columns: Optional[List[str]] = None # Default: every numeric column
+    sample_size: Optional[int] = None # Reservoir-sample this many rows first (approximate: target sample rows)
+    # 'exact' | 'approximate' (sampled/sketched, with error bounds)
+    mode: str = "exact"
+    confidence: float = 0.95 # Of the reported error bounds
+    # binning / woe / psi
+    target: Optional[str] = None # Binary (0/1) target column
+    bins: int = 10
+    binning: str = "quantile" # 'quantile' | 'equal_width' | 'optimal' (monotonic event rate)
+    period_column: Optional[str] = None # psi: the column the periods are ranges of
+    baseline: Optional[List[Any]] = None # psi: [from, to) of the baseline period
+    current: Optional[List[Any]] = None # psi: [from, to) of the compared period
 
 class AnalysisResponse(BaseModel):
     title: str
     chart_type: str # 'bar', 'histogram', 'scalar'
     data: Dict[str, Any]
+
+class BatchAnalysisItem(BaseModel):
+    column: str
+    type: str # As in AnalysisRequest
+    # correlation only
+    method: Optional[str] = "pearson"
+    columns: Optional[List[str]] = None
+    sample_size: Optional[int] = None
+    # binning / woe / psi
+    target: Optional[str] = None
+    bins: int = 10
+    binning: str = "quantile"
+    period_column: Optional[str] = None
+    baseline: Optional[List[Any]] = None
+    current: Optional[List[Any]] = None
+
+class BatchAnalysisRequest(BaseModel):
+    table_name: str
+    items: List[BatchAnalysisItem]
+    session_id: Optional[str] = "default"
+    mode: str = "exact" # Of every item
+    confidence: float = 0.95
+
+class BatchAnalysisResult(BaseModel):
+    index: int # Position in `items`
+    column: str
+    type: str
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None # Set instead of `result` when this item failed
+
+class BatchAnalysisResponse(BaseModel):
+    table_name: str
+    results: List[BatchAnalysisResult] # In `items` order
+
+class ProfileRequest(BaseModel):
+    table_name: str
+    columns: Optional[List[str]] = None # Default: every column
+    bins: int = 20
+    session_id: Optional[str] = "default"
+
+class ColumnProfile(BaseModel):
+    name: str
+    type: str
+    count: int
+    nulls: int
+    null_pct: float
+    distinct: Optional[int] = None # approx_count_distinct
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    min: Optional[Any] = None
+    max: Optional[Any] = None
+    quantiles: Dict[str, Optional[float]] = {} # {"p25": .., "p50": .., "p75": ..}
+    histogram: Optional[Dict[str, List[Any]]] = None # {"edges": [...], "counts": [...]}
+
+class ProfileResponse(BaseModel):
+    table_name: str
+    row_count: int
+    columns: List[ColumnProfile]
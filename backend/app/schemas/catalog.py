@@ -9,7 +9,20 @@ class ColumnSchema(BaseModel):
 
 class TableSchema(BaseModel):
     name: str
+    schema_name: Optional[str] = None
+    table_type: Optional[str] = None # BASE TABLE, VIEW, ...
     columns: List[ColumnSchema] = []
 
 class DatabaseSchema(BaseModel):
     tables: List[TableSchema]
+
+class SchemaInfo(BaseModel):
+    name: str
+    table_count: Optional[int] = None # Unknown until the schema is expanded, for some engines
+
+class SchemaList(BaseModel):
+    schemas: List[SchemaInfo]
+
+class TableList(BaseModel):
+    schema_name: str
+    tables: List[TableSchema]
@@ -0,0 +1,34 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+class ImportRequest(BaseModel):
+    table_name: str
+    path: Optional[str] = None # File, glob (`tapes/2024-*.csv`, `lake/**/*.parquet`) or directory
+    paths: Optional[List[str]] = None # Several files/globs instead of `path`
+    format: Optional[str] = None # 'csv' | 'parquet' | 'json', default: from the file extension
+    mode: str = "table" # 'table' (native copy) | 'parquet' (convert, then view) | 'view' (read in place)
+    if_exists: str = "replace" # 'replace' | 'append' | 'fail'
+    hive_partitioning: Optional[bool] = None # key=value directories as columns, default: auto-detect
+    union_by_name: bool = True # Files with differing column sets/orders
+    options: Dict[str, Any] = {} # Extra reader options, e.g. {"delim": "|", "dateformat": "%d/%m/%Y"}
+
+class IngestJob(BaseModel):
+    id: str
+    status: str # 'queued' | 'running' | 'done' | 'failed' | 'cancelled'
+    table_name: str
+    source: List[str]
+    format: Optional[str] = None
+    mode: str
+    files: int = 0
+    bytes: Optional[int] = None # Total size of the matched local files
+    progress: float = 0.0 # 0..1, from DuckDB's query progress
+    rows: Optional[int] = None
+    output: Optional[str] = None # Directory of Parquet files written by 'parquet' mode
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    elapsed: Optional[float] = None # Seconds spent running
+
+class IngestJobList(BaseModel):
+    jobs: List[IngestJob]
@@ -1,12 +1,34 @@
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 
+class ColumnFilter(BaseModel):
+    # Same shape as the grid's column filter model; `type` uses the grid's names
+    # (equals, notEqual, contains, lessThan, inRange, blank, ...)
+    filter_type: str = "text" # text | number | date | set
+    type: Optional[str] = None
+    filter: Optional[Any] = None
+    filter_to: Optional[Any] = None # Upper bound of inRange
+    values: Optional[List[Any]] = None # Set filter: accepted values, null for blanks
+    operator: Optional[str] = None # AND | OR over `conditions`
+    conditions: List["ColumnFilter"] = []
+
+class SortKey(BaseModel):
+    column: str
+    direction: str = "asc" # asc | desc
+
 class PreviewRequest(BaseModel):
     connection_id: Optional[str] = None
+    session_id: Optional[str] = "default"
     table_name: str
     limit: int = 1000
     offset: int = 0
+    timeout: Optional[float] = None # Seconds before the query is interrupted (streams: default 300)
     filter: Optional[str] = None # SQL Where Clause
+    filters: Dict[str, ColumnFilter] = {} # Per-column filters, ANDed together and with `filter`
+    sort: List[SortKey] = []
+    group_by: List[str] = [] # Row grouping levels
+    group_keys: List[Any] = [] # Values of the expanded levels: rows of the next level (or leaves) are returned
+    aggregates: Dict[str, str] = {} # Column -> sum | avg | min | max | count, computed per group
 
 class PreviewResponse(BaseModel):
     columns: List[Dict[str, Any]] # [{"field": "id", "headerName": "ID"}]
@@ -17,3 +39,5 @@ class QueryRequest(BaseModel):
     session_id: Optional[str] = "default"
     sql: str
     limit: int = 1000
+    offset: int = 0
+    timeout: Optional[float] = None # Seconds before the query is interrupted (streams: default 300)
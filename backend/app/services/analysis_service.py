@@ -1,52 +1,532 @@
-from app.schemas.analysis import AnalysisRequest, AnalysisResponse
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from math import sqrt
+from statistics import NormalDist
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import duckdb
-import os
+from app.config import settings
+from app.schemas.analysis import (
+    AnalysisRequest, AnalysisResponse, BatchAnalysisRequest, BatchAnalysisResponse, BatchAnalysisResult
+)
+from app.services.execution_service import execution_service, is_numeric_type, quote_ident, quote_table
+from app.services.query_builder import query_builder
+from app.services.result_cache import result_cache, table_versions
+from app.services.stats_index import stats_index
+from app.services import feature_stats, tracing
+import numpy as np
+import warnings
+
+# DuckDB vectors (2048 rows each) fetched per chunk by the correlation scan
+CORRELATION_CHUNK_VECTORS = 64
+
+# Analyses answered (fully or partly) from the column statistics index
+INDEXED_TYPES = ("distribution", "outlier", "missing")
+DISTRIBUTION_BINS = 10
+
+# Approximate mode: rows sampled per pass unless the request says otherwise
+APPROX_SAMPLE_ROWS = 100_000
+# Approximate duplicates: keys counted in 1 of this many hash buckets, unless
+# that slice has fewer distinct keys than DUPES_EXACT_BELOW (then exact is cheap)
+DUPES_HASH_BUCKETS = 64
+DUPES_EXACT_BELOW = 1024
+# Set filter lists: values returned per request
+SET_FILTER_VALUES = 1000
+
+# Scratch TEMP table holding the sample (the session's connection is held
+# exclusively); a stable name lets its prepared templates be reused
+APPROX_SAMPLE_TABLE = "__approx_sample"
+
+# Analysis templates: identifiers are validated against the catalog and
+# quoted before formatting, values are `$n` parameters (see query_builder)
+_COUNT_SQL = "SELECT COUNT(*) FROM {table}"
+_MOMENTS_SQL = """
+    SELECT
+        COUNT(*) as total,
+        COUNT({col}) as filled,
+        AVG({col}) as mean,
+        STDDEV({col}) as std,
+        MIN({col}) as min_val,
+        MAX({col}) as max_val
+    FROM {table}
+"""
+_QUARTILES_SQL = "SELECT quantile_cont({col}::DOUBLE, 0.25), quantile_cont({col}::DOUBLE, 0.75) FROM {table}"
+_OUTLIER_COUNT_SQL = "SELECT COUNT(*) FROM {table} WHERE {col} < $1::DOUBLE OR {col} > $2::DOUBLE"
+_MIN_MAX_SQL = "SELECT MIN({col}), MAX({col}) FROM {table}"
+# Same binning rule as the stats index: the max falls into the last bin, not a bin of its own
+_HISTOGRAM_SQL = """
+    SELECT
+        LEAST(FLOOR(({col}::DOUBLE - $1::DOUBLE) / $2::DOUBLE)::INTEGER, $3::INTEGER) as bin,
+        COUNT(*) as count
+    FROM {table}
+    WHERE {col} IS NOT NULL
+    GROUP BY 1
+"""
+_DISTINCT_SQL = "SELECT COUNT(*) FROM (SELECT {select} FROM {table} GROUP BY {group})"
+_DUPES_SLICE_SQL = (
+    "SELECT COUNT(*), COUNT(DISTINCT _h) FILTER (WHERE _h % $1::UBIGINT = 0) "
+    "FROM (SELECT {key} AS _h FROM {table})"
+)
+_TOP_VALUES_SQL = """
+    SELECT {col}, COUNT(*) AS n
+    FROM {table}
+    WHERE {col} IS NOT NULL AND contains(lower({col}::VARCHAR), $1)
+    GROUP BY {col}
+    ORDER BY n DESC, {col}
+    LIMIT $2
+"""
+
+# A group of batch items and the function computing them on a connection:
+# {item index: response, or the exception that item failed with}
+_Group = Tuple[List[int], Callable[[Any], Dict[int, Any]]]
 
 class AnalysisService:
     def __init__(self):
-        # In a real app, this would be managed by ConnectionService
-        # Here we just point to our mock data folder
-        self.data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", "loans.csv")
+        # Independent scan groups of batch analyses (see analyze_batch)
+        self._batch_pool = ThreadPoolExecutor(max_workers=settings.analysis_batch_workers,
+                                              thread_name_prefix="analysis-batch")
 
     def analyze_stats(self, req: AnalysisRequest) -> AnalysisResponse:
-        conn = duckdb.connect(database=':memory:')
-        # Register the CSV as a table
-        conn.execute(f"CREATE TABLE loans AS SELECT * FROM read_csv_auto('{self.data_path}')")
-        
+        # Analyses run against the live engine catalog (ingested files, session
+        # tables, published DataFrames) on the caller's session connection.
+        # File-backed tables are only re-parsed when the file changed on disk.
+        execution_service.refresh_file_source(req.table_name)
+
+        cache_key = self._cache_key(req)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            tracing.count("result_cache_hits", 1)
+            return cached
+
+        execution_service.governor.admit()
+        with tracing.span(f"analysis_{req.type}"):
+            response = self._analyze(req)
+        result_cache.put(cache_key, response, len(response.model_dump_json()))
+        return response
+
+    @staticmethod
+    def _cache_key(req: AnalysisRequest) -> tuple:
+        return ("analysis", req.model_dump_json(), table_versions.snapshot([req.table_name.split(".")[-1]]))
+
+    def analyze_batch(self, req: BatchAnalysisRequest,
+                      on_result: Optional[Callable[[BatchAnalysisResult], None]] = None) -> BatchAnalysisResponse:
+        """
+        Run many analyses of one table as one plan instead of one scan each.
+        Cached items are answered first, then the rest by what they read:
+
+        * `missing`, `distribution` and `dupes` of columns with few values:
+          the stats index (one lookup for all);
+        * `outlier` and per-column `dupes`: one SELECT with every column's
+          quartiles and distinct count side by side, then one with every
+          outlier count;
+        * `correlation`, whole-row `dupes` and approximate items: a group each.
+
+        Groups run in parallel, each on a cursor of its own, unless the table
+        is private to the session. Failed items carry their error, the others
+        still succeed. `on_result` gets every result as soon as it is known.
+        """
+        if req.mode not in ("exact", "approximate"):
+            raise ValueError(f"Unknown analysis mode '{req.mode}'")
+        execution_service.refresh_file_source(req.table_name)
+        requests = [
+            AnalysisRequest(table_name=req.table_name, session_id=req.session_id, mode=req.mode,
+                            confidence=req.confidence, **item.model_dump())
+            for item in req.items
+        ]
+        results: List[BatchAnalysisResult] = []
+        lock = threading.Lock()
+
+        def emit(index: int, response: Optional[AnalysisResponse] = None, error: Optional[str] = None):
+            item = requests[index]
+            result = BatchAnalysisResult(index=index, column=item.column, type=item.type,
+                                         result=response, error=error)
+            with lock:
+                results.append(result)
+            if on_result is not None:
+                on_result(result)
+
+        with execution_service.session(req.session_id) as conn:
+            if not execution_service.table_exists(conn, req.table_name.split(".")[-1]):
+                raise ValueError(f"Table '{req.table_name}' not found")
+            pending = []
+            for i, item in enumerate(requests):
+                cached = result_cache.get(self._cache_key(item))
+                if cached is not None:
+                    tracing.count("result_cache_hits", 1)
+                    emit(i, cached)
+                else:
+                    pending.append(i)
+
+            if pending:
+                execution_service.governor.admit()
+                with tracing.span("analysis_batch"):
+                    groups = self._plan_batch(conn, req, requests, pending, emit)
+                    self._run_groups(conn, req.table_name, groups, requests, emit)
+
+        return BatchAnalysisResponse(table_name=req.table_name, results=sorted(results, key=lambda r: r.index))
+
+    def _plan_batch(self, conn, req: BatchAnalysisRequest, requests: List[AnalysisRequest],
+                    pending: List[int], emit: Callable) -> List[_Group]:
+        """Answer what the stats index holds and group the rest by the scan they need."""
+        table_name = req.table_name
+        groups: List[_Group] = []
+        if req.mode == "approximate":
+            for i in pending:
+                column = requests[i].column
+                if requests[i].type in feature_stats.TYPES:
+                    emit(i, error=f"'{requests[i].type}' has no approximate mode: its bin edges already come from a sample")
+                    continue
+                if column and column != "*" and requests[i].type != "correlation":
+                    try:
+                        # Checked here: the approximate analysis runs against the sample table
+                        query_builder.column(conn, table_name, column)
+                    except ValueError as e:
+                        emit(i, error=str(e))
+                        continue
+                groups.append(([i], lambda c, i=i: {i: self._analyze_approximate(c, table_name, requests[i])}))
+            return groups
+
+        indexed = {}
+        if any(requests[i].type in INDEXED_TYPES + ("dupes",) for i in pending):
+            entry = stats_index.get(conn, table_name, req.session_id)
+            indexed = {column["name"]: column for column in stats_index.column_stats(entry)}
+
+        shared = {}
+        for i in pending:
+            item = requests[i]
+            whole_row = item.type == "dupes" and (not item.column or item.column == "*")
+            if item.type not in INDEXED_TYPES and (item.type != "dupes" or whole_row):
+                groups.append(([i], lambda c, i=i: {i: self._dispatch(c, table_name, requests[i])}))
+                continue
+            try:
+                query_builder.column(conn, table_name, item.column)
+                column = indexed.get(item.column)
+                if item.type == "missing":
+                    emit(i, self._cache(item, self._compute_missing(conn, table_name, item.column, column)))
+                elif item.type == "distribution" and column["histogram"] is not None:
+                    emit(i, self._cache(item, self._indexed_histogram(item.column, column)))
+                elif item.type == "distribution":
+                    groups.append(([i], lambda c, i=i, column=column: {
+                        i: self._compute_histogram(c, table_name, requests[i].column, column)
+                    }))
+                elif item.type == "dupes" and entry["columns"][item.column].get("values") is not None:
+                    # Every value is counted in the index; NULL is one more key, as in GROUP BY
+                    unique = len(entry["columns"][item.column]["values"]) + (column["nulls"] > 0)
+                    emit(i, self._cache(item, self._dupes_response(item.column, entry["row_count"], unique)))
+                elif item.type == "outlier" and not is_numeric_type(column["type"]):
+                    raise ValueError(f"Column '{item.column}' is not numeric")
+                else:
+                    shared[i] = item
+            except ValueError as e:
+                emit(i, error=str(e))
+
+        if shared:
+            # Scanned first: it usually holds most of the items
+            groups.insert(0, (list(shared), lambda c: self._shared_scans(c, table_name, shared, indexed)))
+        return groups
+
+    def _run_groups(self, conn, table_name: str, groups: List[_Group],
+                    requests: List[AnalysisRequest], emit: Callable):
+        """Run the groups, in parallel on cursors of their own if other connections see the table."""
+        def run(group: _Group, cur):
+            indices, compute = group
+            try:
+                responses = compute(cur)
+            except (ValueError, duckdb.Error) as e:
+                responses = {i: e for i in indices}
+            for i in indices:
+                response = responses[i]
+                if isinstance(response, Exception):
+                    emit(i, error=str(response))
+                else:
+                    emit(i, self._cache(requests[i], response))
+
+        # TEMP tables and published frames exist on the session's connection only
+        private = execution_service.table_exists(conn, f"temp.{table_name.split('.')[-1]}")
+        if private or len(groups) < 2:
+            for group in groups:
+                run(group, conn)
+            return
+
+        def on_cursor(group: _Group):
+            with execution_service.conn.cursor() as cur:
+                run(group, cur)
+
+        # Each worker carries the request's context (its trace) along
+        futures = [self._batch_pool.submit(contextvars.copy_context().run, on_cursor, group) for group in groups]
+        for future in futures:
+            future.result()
+
+    def _cache(self, req: AnalysisRequest, response: AnalysisResponse) -> AnalysisResponse:
+        result_cache.put(self._cache_key(req), response, len(response.model_dump_json()))
+        return response
+
+    def _shared_scans(self, conn, table_name: str, items: Dict[int, AnalysisRequest],
+                      indexed: Dict[str, Dict[str, Any]]) -> Dict[int, Any]:
+        """Outlier and per-column duplicate analyses of many columns in (at most) two scans."""
+        table = quote_table(table_name)
+        # Pass 1: every column's quartiles / distinct count (NULL counts as a value, as in GROUP BY)
+        exprs = ["COUNT(*)"]
+        for item in items.values():
+            col = quote_ident(item.column)
+            if item.type == "outlier":
+                exprs.append(f"quantile_cont({col}::DOUBLE, [0.25, 0.75])")
+            else:
+                exprs.append(f"COUNT(DISTINCT {col}) + (COUNT(*) > COUNT({col}))::BIGINT")
+        row = conn.execute(f"SELECT {', '.join(exprs)} FROM {table}").fetchone()
+        total, values = row[0], dict(zip(items, row[1:]))
+
+        responses: Dict[int, Any] = {}
+        fences = {}
+        for i, item in items.items():
+            if item.type == "dupes":
+                responses[i] = self._dupes_response(item.column, total, values[i])
+            elif values[i] is None or values[i][0] is None:
+                responses[i] = ValueError(f"Column '{item.column}' has no values")
+            else:
+                q1, q3 = values[i]
+                fences[i] = (q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1))
+        if not fences:
+            return responses
+
+        # Pass 2: every outlier count against its column's IQR fences
+        exprs, params = [], []
+        for i, (lower_bound, upper_bound) in fences.items():
+            col = quote_ident(items[i].column)
+            exprs.append(f"COUNT(*) FILTER (WHERE {col} < ?::DOUBLE OR {col} > ?::DOUBLE)")
+            params += [lower_bound, upper_bound]
+        row = conn.execute(f"SELECT {', '.join(exprs)} FROM {table}", params).fetchone()
+        for i, outliers in zip(fences, row):
+            column = indexed[items[i].column]
+            responses[i] = self._outliers_response(
+                items[i].column, column["count"] + column["nulls"], outliers,
+                column["mean"], column["std"], column["min"], column["max"]
+            )
+        return responses
+
+    def column_stats(self, table_name: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Header stats of every column, read from the stats index."""
+        execution_service.refresh_file_source(table_name)
+        with execution_service.session(session_id) as conn:
+            if not execution_service.table_exists(conn, table_name.split(".")[-1]):
+                raise ValueError(f"Table '{table_name}' not found")
+            entry = stats_index.get(conn, table_name, session_id)
+        return {
+            "table_name": table_name,
+            "row_count": entry["row_count"],
+            "columns": stats_index.column_stats(entry),
+        }
+
+    def column_values(self, table_name: str, column: str, session_id: Optional[str] = None,
+                      search: Optional[str] = None, limit: int = SET_FILTER_VALUES) -> Dict[str, Any]:
+        """
+        Distinct values of a column with their row counts, for the grid's set
+        filter. Read from the stats index; for a column with too many values
+        to index, the most frequent ones come from one GROUP BY (result-cached).
+        """
+        execution_service.refresh_file_source(table_name)
+        needle = (search or "").lower()
+        limit = max(min(limit, SET_FILTER_VALUES), 1)
+        with execution_service.session(session_id) as conn:
+            if not execution_service.table_exists(conn, table_name.split(".")[-1]):
+                raise ValueError(f"Table '{table_name}' not found")
+            col = query_builder.column(conn, table_name, column)
+            entry = stats_index.get(conn, table_name, session_id)
+            indexed = entry["columns"][column].get("values")
+            if indexed is not None:
+                source = "index"
+                values = [(v, n) for v, n in indexed.items() if needle in str(v).lower()]
+                complete = len(values) <= limit
+                values = sorted(values, key=lambda item: -item[1])[:limit]
+            else:
+                source = "scan"
+                cache_key = ("values", session_id or "default", table_name, column, needle, limit,
+                             table_versions.snapshot([table_name.split(".")[-1]]))
+                values = result_cache.get(cache_key)
+                if values is None:
+                    sql = _TOP_VALUES_SQL.format(col=col, table=quote_table(table_name))
+                    values = query_builder.execute(conn, sql, [needle, limit + 1]).fetchall()
+                    result_cache.put(cache_key, values, len(values) * 64)
+                complete = len(values) <= limit
+                values = values[:limit]
+
+        # Listed in value order like the grid's set filter (the most frequent ones when truncated)
+        try:
+            values = sorted(values, key=lambda item: item[0])
+        except TypeError:
+            values = sorted(values, key=lambda item: str(item[0]))
+        stats = entry["columns"][column]
+        return {
+            "table_name": table_name,
+            "column": column,
+            "values": [{"value": v, "count": n} for v, n in values],
+            "nulls": entry["row_count"] - stats["count"],
+            "complete": complete,
+            "source": source,
+        }
+
+    def _analyze(self, req: AnalysisRequest) -> AnalysisResponse:
+        if req.mode not in ("exact", "approximate"):
+            raise ValueError(f"Unknown analysis mode '{req.mode}'")
+        with execution_service.session(req.session_id) as conn:
+            if not execution_service.table_exists(conn, req.table_name.split(".")[-1]):
+                raise ValueError(f"Table '{req.table_name}' not found")
+            if req.mode == "approximate" and req.type in feature_stats.TYPES:
+                raise ValueError(f"'{req.type}' has no approximate mode: its bin edges already come from a sample")
+            if req.mode == "approximate":
+                return self._analyze_approximate(conn, req.table_name, req)
+            indexed = self._indexed_column(conn, req) if req.type in INDEXED_TYPES else None
+            return self._dispatch(conn, req.table_name, req, indexed)
+
+    @staticmethod
+    def _indexed_column(conn, req: AnalysisRequest) -> Dict[str, Any]:
+        """The column's entry in the stats index (built or caught up on demand)."""
+        entry = stats_index.get(conn, req.table_name, req.session_id)
+        for column in stats_index.column_stats(entry):
+            if column["name"] == req.column:
+                return column
+        raise ValueError(f"Column '{req.column}' not found in '{req.table_name}'")
+
+    def _dispatch(self, conn, table_name: str, req: AnalysisRequest,
+                  indexed: Optional[Dict[str, Any]] = None) -> AnalysisResponse:
         if req.type == 'distribution':
-            return self._compute_histogram(conn, req.column)
+            return self._compute_histogram(conn, table_name, req.column, indexed)
         elif req.type == 'outlier':
-            return self._compute_outliers(conn, req.column)
+            return self._compute_outliers(conn, table_name, req.column, indexed)
         elif req.type == 'missing':
-            return self._compute_missing(conn, req.column)
+            return self._compute_missing(conn, table_name, req.column, indexed)
         elif req.type == 'dupes':
-            return self._compute_dupes(conn, req.column)
+            return self._compute_dupes(conn, table_name, req.column)
         elif req.type == 'correlation':
-            return self._compute_correlation(conn)
-        
-        conn.close()
+            return self._compute_correlation(conn, quote_table(table_name), req.method or "pearson",
+                                             req.columns, req.sample_size)
+        elif req.type in feature_stats.TYPES:
+            return feature_stats.analyze(conn, table_name, req)
+
         return AnalysisResponse(title="Unknown", chart_type="none", data={})
 
-    def _compute_dupes(self, conn, column: str) -> AnalysisResponse:
+    def _analyze_approximate(self, conn, table_name: str, req: AnalysisRequest) -> AnalysisResponse:
+        """
+        Run the analysis on a block sample of ~`sample_size` rows (SYSTEM
+        sampling skips whole vectors, so the cost does not grow with the table)
+        and extrapolate counts to the full table with binomial error bounds.
+        Duplicates use a hash-partition distinct count instead. `refine` in the
+        response holds the request fields for the next, more precise step.
+        """
+        z = NormalDist().inv_cdf((1 + req.confidence) / 2)
+        if req.type == 'dupes':
+            return self._approximate_dupes(conn, table_name, req.column, z, req.confidence)
+
+        table = quote_table(table_name)
+        population = query_builder.execute(conn, _COUNT_SQL.format(table=table)).fetchone()[0]
+        target = req.sample_size or APPROX_SAMPLE_ROWS
+        if population <= target:
+            # Small enough to be exact at the same cost
+            response = self._dispatch(conn, table_name, req)
+            response.data["summary"]["approximate"] = False
+            return response
+
+        sample = quote_ident(APPROX_SAMPLE_TABLE)
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE {sample} AS SELECT * FROM {table} USING SAMPLE {100.0 * target / population}% (system)")
+        query_builder.forget(conn, APPROX_SAMPLE_TABLE)
+        try:
+            rows = query_builder.execute(conn, _COUNT_SQL.format(table=sample)).fetchone()[0]
+            if rows < target // 4:
+                # Too few vectors hit (tiny table slices): fall back to a row-level reservoir
+                conn.execute(f"CREATE OR REPLACE TEMP TABLE {sample} AS SELECT * FROM {table} USING SAMPLE {target} ROWS")
+                rows = query_builder.execute(conn, _COUNT_SQL.format(table=sample)).fetchone()[0]
+            response = self._dispatch(conn, APPROX_SAMPLE_TABLE, req.model_copy(update={"sample_size": None}))
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS {sample}")
+
+        if req.type == 'correlation':
+            self._correlation_bounds(response, rows, z)
+        else:
+            self._extrapolate(response, rows, population, z)
+        response.data["summary"].update(
+            approximate=True, sample_rows=rows, population_rows=population, confidence=req.confidence
+        )
+        response.data["refine"] = {"sample_size": target * 10} if target * 10 < population else {"mode": "exact"}
+        return response
+
+    @staticmethod
+    def _extrapolate(response: AnalysisResponse, rows: int, population: int, z: float):
+        """Scale sample counts to the population; bounds are the normal-approximation CI half-widths."""
+        def bound(count):
+            p = count / rows
+            return round(z * sqrt(p * (1 - p) / rows) * population)
+
+        data = response.data
+        scale = population / rows
+        bounds = {"series": []}
+        for series in data["series"]:
+            bounds["series"].append([bound(c) for c in series["data"]])
+            series["data"] = [round(c * scale) for c in series["data"]]
+
+        summary = data["summary"]
+        bounds["missing"] = bound(summary["missing"])
+        bounds["mean"] = round(z * (summary["std"] or 0) / sqrt(rows), 4)
+        summary["count"] = population
+        summary["missing"] = round(summary["missing"] * scale)
+        data["error_bounds"] = bounds
+
+    @staticmethod
+    def _correlation_bounds(response: AnalysisResponse, rows: int, z: float):
+        """Fisher z-transform CI half-width of every coefficient."""
+        half = z / sqrt(max(rows - 3, 1))
+        bounds = [
+            [round(float(np.tanh(np.arctanh(min(abs(r), 0.999999)) + half)) - abs(r), 3) for r in row]
+            for row in response.data["series"][0]["data"]
+        ]
+        response.data["error_bounds"] = {"series": [bounds]}
+
+    def _approximate_dupes(self, conn, table_name: str, column: str, z: float, confidence: float) -> AnalysisResponse:
+        """
+        Distinct count from a hash-partition sample: keys whose hash falls in
+        1/DUPES_HASH_BUCKETS of the hash space are counted exactly and scaled
+        up. All copies of a key share its hash, so duplicates are never split
+        the way they are by row sampling, and the hash table only holds that
+        slice of the keys. Low-cardinality keys are cheap to count exactly.
+        """
+        target = column if column and column != '*' else '*'
+        key = "hash(*COLUMNS(*))" if target == '*' else f"hash({query_builder.column(conn, table_name, target)})"
+        total, slice_distinct = query_builder.execute(
+            conn, _DUPES_SLICE_SQL.format(key=key, table=quote_table(table_name)), [DUPES_HASH_BUCKETS]
+        ).fetchone()
+
+        if slice_distinct < DUPES_EXACT_BELOW:
+            response = self._compute_dupes(conn, table_name, column)
+            response.data["summary"]["approximate"] = False
+            return response
+
+        fraction = 1 / DUPES_HASH_BUCKETS
+        distinct = min(round(slice_distinct / fraction), total)
+        bound = round(z * sqrt(distinct * (1 - fraction) / fraction))
+
+        response = self._dupes_response(target, total, distinct)
+        response.data["error_bounds"] = {"series": [[bound, bound]]}
+        response.data["summary"].update(
+            approximate=True, sample_rows=total, population_rows=total, confidence=confidence
+        )
+        response.data["refine"] = {"mode": "exact"}
+        return response
+
+    def _compute_dupes(self, conn, table_name: str, column: str) -> AnalysisResponse:
         # If column is * or None, check full row duplicates
         target = column if column and column != '*' else '*'
-        
-        group_sql = f"GROUP BY {target}" if target != '*' else "GROUP BY ALL"
-        select_sql = f"SELECT {target}" if target != '*' else "SELECT *"
-        
-        stats = conn.execute(f"SELECT COUNT(*) FROM loans").fetchone()
-        total_rows = stats[0]
-        
-        unique_rows = conn.execute(f"""
-            SELECT COUNT(*) FROM (
-                {select_sql} FROM loans {group_sql}
-            )
-        """).fetchone()[0]
-        
+        table = quote_table(table_name)
+        col = query_builder.column(conn, table_name, target) if target != '*' else None
+
+        total_rows = query_builder.execute(conn, _COUNT_SQL.format(table=table)).fetchone()[0]
+        unique_rows = query_builder.execute(
+            conn, _DISTINCT_SQL.format(select=col or "*", group=col or "ALL", table=table)
+        ).fetchone()[0]
+
+        return self._dupes_response(target, total_rows, unique_rows)
+
+    @staticmethod
+    def _dupes_response(target: str, total_rows: int, unique_rows: int) -> AnalysisResponse:
         dupes = total_rows - unique_rows
-        
-        conn.close()
-        
         return AnalysisResponse(
             title=f"Duplicate Analysis: {target}",
             chart_type="bar",
@@ -64,38 +544,48 @@ class AnalysisService:
             }
         )
 
-    def _compute_correlation(self, conn) -> AnalysisResponse:
+    def _compute_correlation(self, conn, table: str, method: str = "pearson",
+                             columns: Optional[List[str]] = None,
+                             sample_size: Optional[int] = None) -> AnalysisResponse:
         # 1. Select only numeric columns
-        schema = conn.execute("DESCRIBE loans").fetchall()
-        numeric_cols = [row[0] for row in schema if 'INT' in row[1] or 'DOUBLE' in row[1] or 'FLOAT' in row[1]]
-        
-        # 2. Compute Correlation Matrix
-        # DuckDB 0.9+ supports corr matrix via some tricks or just pair-wise
-        # For simplicity in this mocked/local version, we do pair-wise for up to 10 cols
-        
-        cols_to_use = numeric_cols[:10] # Limit to 10 for performance
-        labels = cols_to_use
-        
-        matrix_data = []
-        
-        for col_a in cols_to_use:
-            row_data = []
-            for col_b in cols_to_use:
-                val = conn.execute(f"SELECT CORR({col_a}, {col_b}) FROM loans").fetchone()[0]
-                row_data.append(round(val or 0, 2))
-            matrix_data.append(row_data)
-            
-        conn.close()
-        
+        schema = conn.execute(f"DESCRIBE {table}").fetchall()
+        numeric_cols = [row[0] for row in schema if is_numeric_type(row[1])]
+        if columns:
+            unknown = set(columns) - set(numeric_cols)
+            if unknown:
+                raise ValueError(f"Not numeric columns of {table}: {', '.join(sorted(unknown))}")
+            numeric_cols = [c for c in numeric_cols if c in set(columns)]
+        if method not in ("pearson", "spearman"):
+            raise ValueError(f"Unknown correlation method '{method}'")
+
+        labels = numeric_cols
+        if not labels:
+            matrix, rows = np.zeros((0, 0)), 0
+        else:
+            # 2. Whole matrix in one streamed scan (Spearman = Pearson over ranks)
+            source = f"SELECT * FROM {table}"
+            if sample_size:
+                source += f" USING SAMPLE {int(sample_size)} ROWS"
+            if method == "spearman":
+                exprs = [self._avg_rank_expr(quote_ident(c)) for c in labels]
+            else:
+                exprs = [f"{quote_ident(c)}::DOUBLE" for c in labels]
+            matrix, rows = self._correlation_matrix(conn, f"SELECT {', '.join(exprs)} FROM ({source}) AS _src")
+
+        matrix_data = [[round(float(v), 2) if np.isfinite(v) else 0 for v in row] for row in matrix]
+
         return AnalysisResponse(
-            title="Correlation Matrix",
+            title="Correlation Matrix" if method == "pearson" else "Correlation Matrix (Spearman)",
             chart_type="heatmap",
             data={
                 "xAxis": labels, # Cols
                 "yAxis": labels, # Rows
                 "series": [{"data": matrix_data, "type": "heatmap"}],
                 "summary": {
-                    "count": len(cols_to_use),
+                    "count": len(labels),
+                    "rows": rows,
+                    "method": method,
+                    "sampled": bool(sample_size),
                     "missing": 0,
                     "mean": 0,
                     "std": 0,
@@ -105,24 +595,73 @@ class AnalysisService:
             }
         )
 
-    def _compute_missing(self, conn, column: str) -> AnalysisResponse:
-        # 1. Count Total vs Missing
-        stats = conn.execute(f"""
-            SELECT 
-                COUNT(*) as total,
-                COUNT({column}) as filled,
-                AVG({column}) as mean,
-                STDDEV({column}) as std,
-                MIN({column}) as min_val,
-                MAX({column}) as max_val
-            FROM loans
-        """).fetchone()
-        
+    @staticmethod
+    def _avg_rank_expr(col: str) -> str:
+        # Average rank for ties (as in scipy/pandas), NULLs stay NULL
+        return (
+            f"CASE WHEN {col} IS NULL THEN NULL ELSE "
+            f"(RANK() OVER (ORDER BY {col}) + (COUNT(*) OVER (PARTITION BY {col}) - 1) / 2.0)::DOUBLE END"
+        )
+
+    @staticmethod
+    def _correlation_matrix(conn, sql: str):
+        """
+        Pairwise-complete Pearson matrix (same semantics as DuckDB CORR) from a
+        single pass over `sql`, accumulating per-chunk cross products:
+        N = M'M, Sx = X'M, Sxx = (X*X)'M and Sxy = X'X with X zero-filled and
+        M the not-null mask. Values are shifted by the first chunk's means for
+        numerical stability. Returns (matrix, rows scanned).
+        """
+        cur = conn.execute(sql)
+        shift = n = sx = sxx = sxy = None
+        rows = 0
+        while True:
+            chunk = cur.fetch_df_chunk(CORRELATION_CHUNK_VECTORS)
+            if chunk.empty:
+                break
+            x = chunk.to_numpy(dtype=float, na_value=np.nan)
+            rows += len(x)
+            if shift is None:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)  # all-NULL columns
+                    shift = np.nan_to_num(np.nanmean(x, axis=0))
+                k = x.shape[1]
+                n, sx, sxx, sxy = (np.zeros((k, k)) for _ in range(4))
+            x = x - shift
+            mask = ~np.isnan(x)
+            m = mask.astype(float)
+            x = np.where(mask, x, 0.0)
+            n += m.T @ m
+            sx += x.T @ m
+            sxx += (x * x).T @ m
+            sxy += x.T @ x
+
+        if n is None:
+            k = len(cur.description)
+            return np.full((k, k), np.nan), 0
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = sxy - sx * sx.T / n
+            var = sxx - sx * sx / n
+            matrix = cov / np.sqrt(var * var.T)
+        # Symmetrize away rounding noise between the two triangles
+        matrix = (matrix + matrix.T) / 2
+        return matrix, rows
+
+    def _compute_missing(self, conn, table_name: str, column: str,
+                         indexed: Optional[Dict[str, Any]] = None) -> AnalysisResponse:
+        # 1. Count Total vs Missing (a lookup when the stats index has the column)
+        if indexed is not None:
+            stats = (indexed["count"] + indexed["nulls"], indexed["count"], indexed["mean"], indexed["std"],
+                     indexed["min"], indexed["max"])
+        else:
+            col = query_builder.column(conn, table_name, column)
+            stats = query_builder.execute(conn, _MOMENTS_SQL.format(col=col, table=quote_table(table_name))).fetchone()
+
         total, filled = stats[0], stats[1]
         missing = total - filled
         mean, std, min_val, max_val = stats[2], stats[3], stats[4], stats[5]
         
-        conn.close()
         
         return AnalysisResponse(
             title=f"Missing Value Analysis: {column}",
@@ -141,20 +680,21 @@ class AnalysisService:
             }
         )
 
-    def _compute_outliers(self, conn, column: str) -> AnalysisResponse:
-        # 1. Calculate IQR
-        stats = conn.execute(f"""
-            SELECT 
-                quantile_cont({column}, 0.25) as q1,
-                quantile_cont({column}, 0.75) as q3,
-                AVG({column}) as mean,
-                STDDEV({column}) as std,
-                MIN({column}) as min_val,
-                MAX({column}) as max_val,
-                COUNT(*) as count
-            FROM loans
-        """).fetchone()
-        
+    def _compute_outliers(self, conn, table_name: str, column: str,
+                          indexed: Optional[Dict[str, Any]] = None) -> AnalysisResponse:
+        table = quote_table(table_name)
+        col = query_builder.numeric_column(conn, table_name, column)
+        # 1. Calculate IQR (moments/extremes come from the stats index when available)
+        q1, q3 = query_builder.execute(conn, _QUARTILES_SQL.format(col=col, table=table)).fetchone()
+        if indexed is not None:
+            stats = (q1, q3, indexed["mean"], indexed["std"], indexed["min"], indexed["max"],
+                     indexed["count"] + indexed["nulls"])
+        else:
+            total, _, mean, std, min_val, max_val = query_builder.execute(
+                conn, _MOMENTS_SQL.format(col=col, table=table)
+            ).fetchone()
+            stats = (q1, q3, mean, std, min_val, max_val, total)
+
         q1, q3 = stats[0], stats[1]
         mean, std, min_val, max_val, count = stats[2], stats[3], stats[4], stats[5], stats[6]
         iqr = q3 - q1
@@ -162,17 +702,20 @@ class AnalysisService:
         upper_bound = q3 + 1.5 * iqr
         
         # 2. Count Outliers
-        outliers = conn.execute(f"""
-            SELECT COUNT(*) FROM loans 
-            WHERE {column} < {lower_bound} OR {column} > {upper_bound}
-        """).fetchone()[0]
+        outliers = query_builder.execute(
+            conn, _OUTLIER_COUNT_SQL.format(col=col, table=table), [lower_bound, upper_bound]
+        ).fetchone()[0]
         
+        return self._outliers_response(column, count, outliers, mean, std, min_val, max_val)
+
+    @staticmethod
+    def _outliers_response(column: str, count: int, outliers: int, mean: float, std: float,
+                           min_val: Any, max_val: Any) -> AnalysisResponse:
         # 3. Visualization Data (Box Plot Parts)
         # Recharts doesn't natively support boxplots well with just 5 numbers in a simple way 
         # so we will return a distribution like chart for now highlighting outliers
         
         # Simplified: Return count of normal vs outliers
-        conn.close()
         
         return AnalysisResponse(
             title=f"Outlier Analysis: {column}",
@@ -191,46 +734,32 @@ class AnalysisService:
             }
         )
 
-    def _compute_histogram(self, conn, column: str) -> AnalysisResponse:
+    def _compute_histogram(self, conn, table_name: str, column: str,
+                           indexed: Optional[Dict[str, Any]] = None) -> AnalysisResponse:
+        if indexed is not None and indexed["histogram"] is not None:
+            return self._indexed_histogram(column, indexed)
+        table = quote_table(table_name)
+        col = query_builder.numeric_column(conn, table_name, column)
         # 1. Get Min/Max for binning
-        stats = conn.execute(f"SELECT MIN({column}), MAX({column}) FROM loans").fetchone()
+        stats = query_builder.execute(conn, _MIN_MAX_SQL.format(col=col, table=table)).fetchone()
         min_val, max_val = stats[0], stats[1]
-        
-        # 2. Compute Histogram (10 bins)
-        # Using DuckDB's width_bucket or just manual grouping
-        step = (max_val - min_val) / 10 if max_val > min_val else 1
-        
-        query = f"""
-            SELECT 
-                FLOOR(({column} - {min_val}) / {step}) * {step} + {min_val} as bin_start,
-                COUNT(*) as count
-            FROM loans
-            GROUP BY 1
-            ORDER BY 1
-        """
-        results = conn.execute(query).fetchall()
-        
+
+        # 2. Compute Histogram (DISTRIBUTION_BINS bins, empty ones kept, like the indexed path)
         bins = []
         counts = []
-        for row in results:
-            bin_start = row[0]
-            bin_label = f"{int(bin_start / 1000)}k"
-            bins.append(bin_label)
-            counts.append(row[1])
+        if min_val is not None:
+            lo, hi = float(min_val), float(max_val)
+            n_bins = DISTRIBUTION_BINS if hi > lo else 1
+            step = (hi - lo) / n_bins if hi > lo else 1.0
+            results = dict(query_builder.execute(
+                conn, _HISTOGRAM_SQL.format(col=col, table=table), [lo, step, n_bins - 1]
+            ).fetchall())
+            bins = [f"{int((lo + i * step) / 1000)}k" for i in range(n_bins)]
+            counts = [results.get(i, 0) for i in range(n_bins)]
 
         # 3. Compute Summary Stats separately
-        summary = conn.execute(f"""
-            SELECT 
-                COUNT(*), 
-                COUNT({column}), 
-                AVG({column}), 
-                STDDEV({column}),
-                MIN({column}),
-                MAX({column})
-            FROM loans
-        """).fetchone()
-        
-        conn.close()
+        summary = query_builder.execute(conn, _MOMENTS_SQL.format(col=col, table=table)).fetchone()
+
         
         return AnalysisResponse(
             title=f"Distribution of {column}",
@@ -249,4 +778,29 @@ class AnalysisService:
             }
         )
 
+    @staticmethod
+    def _indexed_histogram(column: str, indexed: Dict[str, Any]) -> AnalysisResponse:
+        """Distribution chart straight from the stats index: its bins merged into DISTRIBUTION_BINS."""
+        hist = indexed["histogram"]
+        group = max(len(hist["counts"]) // DISTRIBUTION_BINS, 1)
+        counts = [sum(hist["counts"][i:i + group]) for i in range(0, len(hist["counts"]), group)]
+        bins = [f"{int(edge / 1000)}k" for edge in hist["edges"][:-1:group]]
+        total = indexed["count"] + indexed["nulls"]
+        return AnalysisResponse(
+            title=f"Distribution of {column}",
+            chart_type="bar",
+            data={
+                "xAxis": bins,
+                "series": [{"data": counts, "type": "bar"}],
+                "summary": {
+                    "count": total,
+                    "missing": indexed["nulls"],
+                    "mean": round(indexed["mean"] or 0, 2),
+                    "std": round(indexed["std"] or 0, 2),
+                    "min": indexed["min"],
+                    "max": indexed["max"]
+                }
+            }
+        )
+
 analysis_service = AnalysisService()
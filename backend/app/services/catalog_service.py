@@ -1,26 +1,259 @@
-from typing import List, Dict, Any
-from app.schemas.catalog import DatabaseSchema, TableSchema, ColumnSchema
-
-# In-memory mock schema cache
-_SCHEMAS: Dict[str, DatabaseSchema] = {
-    "mock-conn-1": DatabaseSchema(tables=[
-        TableSchema(name="loan_data_v2", columns=[
-            ColumnSchema(name="user_id", type="INT", is_pk=True),
-            ColumnSchema(name="annual_inc", type="FLOAT"),
-            ColumnSchema(name="loan_status", type="VARCHAR"),
-            ColumnSchema(name="risk_score", type="FLOAT"),
-        ]),
-        TableSchema(name="app_logs", columns=[
-            ColumnSchema(name="id", type="INT", is_pk=True),
-            ColumnSchema(name="action", type="VARCHAR"),
-            ColumnSchema(name="timestamp", type="DATETIME"),
-        ])
-    ])
-}
+"""
+Metadata scanner behind the sidebar tree.
+
+The catalog is loaded lazily, one node at a time (schema list, tables of one
+schema, columns of one table), from `information_schema` for DuckDB (the
+local engine with its attached databases and the session's published
+frames, and sources attached to it) and from the SQLAlchemy inspector for external
+connections. Every node is cached:
+
+* entries older than `catalog_ttl` are served as-is while a background
+  worker refreshes just that node (stale-while-revalidate);
+* entries of the local engine also carry the table versions they were read
+  at, so a CREATE/DROP/publish is visible on the next request.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from sqlalchemy import inspect
+
+from app.config import settings
+from app.schemas.catalog import ColumnSchema, DatabaseSchema, SchemaInfo, SchemaList, TableList, TableSchema
+from app.services.connection_service import connection_service
+from app.services.execution_service import execution_service, SOURCES_SCHEMA
+from app.services.result_cache import table_versions
+
+# DuckDB catalogs/schemas that only hold engine internals
+_SYSTEM_CATALOGS = ("system",)
+_SYSTEM_SCHEMAS = ("information_schema", "pg_catalog", SOURCES_SCHEMA)
+
+
+class _DuckDBSource:
+    """Catalog of a DuckDB database; schemas are named `catalog.schema`."""
+
+    def __init__(self, connect: Callable, version: Optional[Callable] = None, catalog: Optional[str] = None):
+        self._connect = connect
+        # Only list this catalog (an attached database) when set
+        self._catalog = catalog
+        # Current table versions, for sources whose changes go through the API
+        self.version = version or (lambda *_: None)
+
+    def schemas(self) -> List[SchemaInfo]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT s.catalog_name || '.' || s.schema_name, COUNT(t.table_name) "
+                "FROM information_schema.schemata s LEFT JOIN information_schema.tables t "
+                "  ON t.table_catalog = s.catalog_name AND t.table_schema = s.schema_name "
+                "WHERE s.catalog_name NOT IN ? AND s.schema_name NOT IN ? AND s.catalog_name = COALESCE(?, s.catalog_name) "
+                "GROUP BY ALL ORDER BY 1",
+                [list(_SYSTEM_CATALOGS), list(_SYSTEM_SCHEMAS), self._catalog],
+            ).fetchall()
+        return [SchemaInfo(name=name, table_count=count) for name, count in rows]
+
+    def tables(self, schema: str) -> List[TableSchema]:
+        catalog, schema_name = self._split(schema)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT table_name, table_type FROM information_schema.tables "
+                "WHERE table_catalog = ? AND table_schema = ? ORDER BY table_name",
+                [catalog, schema_name],
+            ).fetchall()
+        return [TableSchema(name=name, schema_name=schema, table_type=kind) for name, kind in rows]
+
+    def columns(self, schema: str, table: str) -> List[ColumnSchema]:
+        catalog, schema_name = self._split(schema)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT column_name, data_type, is_nullable = 'YES' FROM information_schema.columns "
+                "WHERE table_catalog = ? AND table_schema = ? AND table_name = ? ORDER BY ordinal_position",
+                [catalog, schema_name, table],
+            ).fetchall()
+            pk = conn.execute(
+                "SELECT constraint_column_names FROM duckdb_constraints() "
+                "WHERE database_name = ? AND schema_name = ? AND table_name = ? AND constraint_type = 'PRIMARY KEY'",
+                [catalog, schema_name, table],
+            ).fetchone()
+        pk_columns = set(pk[0]) if pk else set()
+        return [
+            ColumnSchema(name=name, type=dtype, nullable=nullable, is_pk=name in pk_columns)
+            for name, dtype, nullable in rows
+        ]
+
+    @staticmethod
+    def _split(schema: str):
+        catalog, _, schema_name = schema.partition(".")
+        if not schema_name:
+            raise ValueError(f"Schema '{schema}' must be qualified as catalog.schema")
+        return catalog, schema_name
+
+
+class _SQLAlchemySource:
+    """Catalog of an external database through the SQLAlchemy inspector."""
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    @staticmethod
+    def version(*_):
+        return None # Changes happen outside the API: rely on the TTL
+
+    def schemas(self) -> List[SchemaInfo]:
+        return [SchemaInfo(name=name) for name in inspect(self._engine).get_schema_names()
+                if name not in _SYSTEM_SCHEMAS]
+
+    def tables(self, schema: str) -> List[TableSchema]:
+        inspector = inspect(self._engine)
+        tables = [TableSchema(name=name, schema_name=schema, table_type="BASE TABLE")
+                  for name in inspector.get_table_names(schema=schema)]
+        tables += [TableSchema(name=name, schema_name=schema, table_type="VIEW")
+                   for name in inspector.get_view_names(schema=schema)]
+        return sorted(tables, key=lambda t: t.name)
+
+    def columns(self, schema: str, table: str) -> List[ColumnSchema]:
+        inspector = inspect(self._engine)
+        pk_columns = set(inspector.get_pk_constraint(table, schema=schema).get("constrained_columns") or [])
+        return [
+            ColumnSchema(name=c["name"], type=self._type_name(c["type"]),
+                         nullable=c.get("nullable", True), is_pk=c["name"] in pk_columns)
+            for c in inspector.get_columns(table, schema=schema)
+        ]
+
+    @staticmethod
+    def _type_name(sa_type) -> str:
+        try:
+            return str(sa_type)
+        except Exception:
+            return type(sa_type).__name__.upper() # Type without a generic SQL rendering
+
+
+class CatalogCache:
+    """
+    LRU of catalog nodes: key -> (value, fetched_at, version). Stale entries
+    are returned immediately and refreshed by a background worker, one
+    refresh per key at a time.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="catalog-refresh")
+
+    def get(self, key: Hashable, load: Callable[[], Any], version: Any = None, force: bool = False) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None or force or entry[2] != version:
+            return self._load(key, load, version)
+        if time.monotonic() - entry[1] > self.ttl:
+            self._refresh_later(key, load, version)
+        return entry[0]
+
+    def _load(self, key: Hashable, load: Callable[[], Any], version: Any) -> Any:
+        value = load()
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def _refresh_later(self, key: Hashable, load: Callable[[], Any], version: Any):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._load(key, load, version)
+            except Exception as e:
+                print(f"Catalog refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+
+    def invalidate(self, conn_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == conn_id]:
+                del self._entries[key]
+
 
 class CatalogService:
-    def get_schema(self, conn_id: str) -> DatabaseSchema:
-        # TODO: Implement metadata scanner for SQL engines
-        return _SCHEMAS.get(conn_id, DatabaseSchema(tables=[]))
+    def __init__(self):
+        self.cache = CatalogCache(settings.catalog_ttl, settings.catalog_cache_entries)
+
+    def _source(self, conn_id: str, session_id: Optional[str]):
+        conn = connection_service.get_connection(conn_id)
+        if conn is None:
+            raise ValueError(f"Connection '{conn_id}' not found")
+
+        if connection_service.is_local(conn):
+            # The session's connection also sees its published frames (temp views)
+            return _DuckDBSource(
+                lambda: execution_service.session(session_id),
+                version=lambda *tables: (table_versions.generation if not tables
+                                         else table_versions.snapshot(tables)),
+            )
+        if conn.get("attached"):
+            # Attached to the local engine (DuckDB file, or a federated scan)
+            return _DuckDBSource(lambda: execution_service.session(session_id), catalog=conn["attached"])
+        return _SQLAlchemySource(connection_service.get_engine(conn_id))
+
+    @staticmethod
+    def _key(conn_id: str, session_id: Optional[str], *parts) -> tuple:
+        conn = connection_service.get_connection(conn_id)
+        # Local catalogs differ per session (published frames live in its TEMP schema)
+        scope = (session_id or "default") if conn and connection_service.is_local(conn) else None
+        return (conn_id, scope) + parts
+
+    def list_schemas(self, conn_id: str, session_id: Optional[str] = None, refresh: bool = False) -> SchemaList:
+        source = self._source(conn_id, session_id)
+        schemas = self.cache.get(self._key(conn_id, session_id, "schemas"), source.schemas,
+                                 version=source.version(), force=refresh)
+        return SchemaList(schemas=schemas)
+
+    def list_tables(self, conn_id: str, schema: str, session_id: Optional[str] = None,
+                    refresh: bool = False) -> TableList:
+        source = self._source(conn_id, session_id)
+        tables = self.cache.get(self._key(conn_id, session_id, "tables", schema),
+                                lambda: source.tables(schema), version=source.version(), force=refresh)
+        return TableList(schema_name=schema, tables=tables)
+
+    def get_table(self, conn_id: str, schema: str, table: str, session_id: Optional[str] = None,
+                  refresh: bool = False) -> TableSchema:
+        source = self._source(conn_id, session_id)
+        columns = self.cache.get(self._key(conn_id, session_id, "columns", schema, table),
+                                 lambda: source.columns(schema, table),
+                                 version=source.version(table), force=refresh)
+        if not columns:
+            raise ValueError(f"Table '{schema}.{table}' not found")
+        return TableSchema(name=table, schema_name=schema, columns=columns)
+
+    def get_schema(self, conn_id: str, session_id: Optional[str] = None, include_columns: bool = False) -> DatabaseSchema:
+        """
+        Tables of every schema, built from the per-schema cache entries. Columns
+        are only loaded on request; large databases should use the lazy
+        per-schema/per-table endpoints instead.
+        """
+        tables = []
+        for schema in self.list_schemas(conn_id, session_id).schemas:
+            for table in self.list_tables(conn_id, schema.name, session_id).tables:
+                if include_columns:
+                    columns = self.get_table(conn_id, schema.name, table.name, session_id).columns
+                    table = table.model_copy(update={"columns": columns})
+                tables.append(table)
+        return DatabaseSchema(tables=tables)
+
+    def invalidate(self, conn_id: str):
+        self.cache.invalidate(conn_id)
 
 catalog_service = CatalogService()
@@ -1,6 +1,52 @@
+import operator
+import re
+import threading
 import uuid
-from typing import List, Dict, Any
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+import pandas as pd
+from sqlalchemy import (Date, String, and_, cast, column, create_engine, false, func, inspect, literal_column,
+                        not_, or_, select, table, text)
+from sqlalchemy.engine import URL, Engine
+from app.config import settings
 from app.schemas.connection import ConnectionCreate, ConnectionResponse
+from app.schemas.preview import ColumnFilter, PreviewRequest, PreviewResponse
+from app.services.execution_service import execution_service, quote_ident
+from app.services import tracing
+
+# SQLAlchemy dialect for connection types whose name differs from it
+_DIALECTS = {
+    "postgres": "postgresql",
+    "mysql": "mysql+pymysql",
+}
+
+# Sources DuckDB can ATTACH and scan in place (federated queries)
+_ATTACH_TYPES = {"duckdb", "sqlite", "postgres", "mysql"}
+
+# Grid model fields of PreviewRequest only compiled for the local engine (see grid_sql);
+# `filters` is also compiled for SQLAlchemy sources, with bound values
+_GRID_FIELDS = ("sort", "group_by", "group_keys", "aggregates")
+
+# A raw `filter` for a remote source must be one expression: no statement separator or
+# comment outside string literals (drivers may run several statements)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_UNSAFE_FILTER = re.compile(r";|--|/\*")
+
+# Column filters of the grid (see grid_sql), as SQLAlchemy operators
+_COMPARISONS = {
+    "equals": operator.eq, "notEqual": operator.ne,
+    "lessThan": operator.lt, "lessThanOrEqual": operator.le,
+    "greaterThan": operator.gt, "greaterThanOrEqual": operator.ge,
+}
+_TEXT_MATCHES = {
+    "equals": lambda col, v: col == v,
+    "notEqual": lambda col, v: col != v,
+    "contains": lambda col, v: col.contains(v, autoescape=True),
+    "notContains": lambda col, v: not_(col.contains(v, autoescape=True)),
+    "startsWith": lambda col, v: col.startswith(v, autoescape=True),
+    "endsWith": lambda col, v: col.endswith(v, autoescape=True),
+}
+_FILTER_TYPES = ("text", "number", "date", "set")
 
 # In-memory storage for MVP
 _CONNECTIONS: Dict[str, Dict[str, Any]] = {
@@ -15,6 +61,26 @@ _CONNECTIONS: Dict[str, Dict[str, Any]] = {
 }
 
 class ConnectionService:
+    """
+    External databases, reached one of two ways:
+
+    * through a pooled SQLAlchemy engine per connection id; previews are
+      compiled to the source's dialect with the filters, LIMIT and OFFSET
+      pushed down (paged in primary key order), so only the requested page
+      crosses the wire;
+    * ATTACHed to the local DuckDB engine (DuckDB files always, sqlite/
+      postgres/mysql with `"attach": true` in the config) so their tables can
+      be joined with local data; DuckDB's scanners push filters to the source.
+    """
+
+    def __init__(self):
+        # SQLAlchemy engines by connection id, created on first use
+        self._engines: Dict[str, Engine] = {}
+        self._engines_lock = threading.Lock()
+        # Columns and paging order of remote tables by (connection id, schema, table),
+        # reflected on first preview
+        self._remote_tables: Dict[tuple, Dict[str, List[str]]] = {}
+
     def list_connections(self) -> List[ConnectionResponse]:
         return [
             ConnectionResponse(
@@ -28,18 +94,248 @@ class ConnectionService:
 
     def create_connection(self, conn: ConnectionCreate) -> ConnectionResponse:
         conn_id = str(uuid.uuid4())
-        # TODO: Real validation and connection test
         new_conn = {
             "id": conn_id,
             "type": conn.type,
             "name": conn.name,
             "config": conn.config,
-            "status": "connected" # Mock success
+            "secret": conn.secret or {},
+            "status": "connected"
         }
+        if not self.is_local(new_conn):
+            # Open the connection once so bad configs fail here, not on first preview
+            if self._wants_attach(new_conn):
+                new_conn["attached"] = self._attach(new_conn)
+            else:
+                self._test(conn_id, new_conn)
         _CONNECTIONS[conn_id] = new_conn
         return ConnectionResponse(**new_conn)
 
     def get_connection(self, conn_id: str) -> Dict[str, Any]:
         return _CONNECTIONS.get(conn_id)
 
+    @staticmethod
+    def is_local(conn: Dict[str, Any]) -> bool:
+        """True for connections served by the in-process DuckDB engine."""
+        return conn["type"] == "duckdb" and conn["config"].get("path", ":memory:") == ":memory:"
+
+    # ------------------------------------------------------------------
+    # SQLAlchemy engines
+    # ------------------------------------------------------------------
+
+    def get_engine(self, conn_id: str) -> Engine:
+        """Pooled SQLAlchemy engine for an external connection."""
+        with self._engines_lock:
+            engine = self._engines.get(conn_id)
+            if engine is None:
+                conn = _CONNECTIONS.get(conn_id)
+                if conn is None:
+                    raise ValueError(f"Connection '{conn_id}' not found")
+                engine = self._create_engine(conn)
+                self._engines[conn_id] = engine
+            return engine
+
+    def _test(self, conn_id: str, conn: Dict[str, Any]):
+        engine = self._create_engine(conn)
+        try:
+            with engine.connect() as c:
+                c.execute(text("SELECT 1"))
+        except Exception:
+            engine.dispose()
+            raise
+        with self._engines_lock:
+            self._engines[conn_id] = engine
+
+    @staticmethod
+    def _create_engine(conn: Dict[str, Any]) -> Engine:
+        url = ConnectionService._url(conn)
+        options = {"pool_pre_ping": True, "pool_recycle": settings.external_pool_recycle}
+        if not str(url).startswith("sqlite"):
+            # SQLite uses a per-thread/null pool of its own
+            options.update(pool_size=settings.external_pool_size,
+                           max_overflow=settings.external_max_overflow)
+        return create_engine(url, **options)
+
+    @staticmethod
+    def _url(conn: Dict[str, Any]):
+        config = conn["config"]
+        if config.get("url"):
+            return config["url"]
+        return URL.create(
+            drivername=config.get("driver") or _DIALECTS.get(conn["type"], conn["type"]),
+            username=config.get("user") or config.get("username"),
+            password=(conn.get("secret") or {}).get("password"),
+            host=config.get("host"),
+            port=config.get("port"),
+            database=config.get("database") or config.get("path"),
+        )
+
+    # ------------------------------------------------------------------
+    # DuckDB ATTACH
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _wants_attach(conn: Dict[str, Any]) -> bool:
+        return conn["type"] == "duckdb" or (conn["type"] in _ATTACH_TYPES and bool(conn["config"].get("attach")))
+
+    @staticmethod
+    def _attach(conn: Dict[str, Any]) -> str:
+        """ATTACH the source read-only to the local engine; returns its catalog alias."""
+        config = conn["config"]
+        alias = config.get("alias") or re.sub(r"\W+", "_", conn["name"]).strip("_").lower() or "ext"
+        if conn["type"] in ("duckdb", "sqlite"):
+            target = config["path"]
+        else:
+            # libpq-style connection string, understood by the postgres and mysql scanners
+            parts = {
+                "host": config.get("host"),
+                "port": config.get("port"),
+                "user": config.get("user") or config.get("username"),
+                "password": (conn.get("secret") or {}).get("password"),
+                ("dbname" if conn["type"] == "postgres" else "database"): config.get("database"),
+            }
+            target = " ".join(f"{k}={v}" for k, v in parts.items() if v is not None)
+        db_type = "" if conn["type"] == "duckdb" else f"TYPE {conn['type']}, "
+        literal = "'" + str(target).replace("'", "''") + "'"
+        with execution_service.conn.cursor() as cur:
+            cur.execute(f"ATTACH {literal} AS {quote_ident(alias)} ({db_type}READ_ONLY)")
+        return alias
+
+    # ------------------------------------------------------------------
+    # Previews
+    # ------------------------------------------------------------------
+
+    def is_external(self, conn_id: Optional[str]) -> bool:
+        conn = _CONNECTIONS.get(conn_id) if conn_id else None
+        return conn is not None and not self.is_local(conn)
+
+    def preview_request(self, req: PreviewRequest) -> PreviewRequest:
+        """For attached sources: the same preview, addressed to the local engine."""
+        conn = _CONNECTIONS[req.connection_id]
+        return req.model_copy(update={"table_name": f"{conn['attached']}.{req.table_name}", "connection_id": None})
+
+    def preview(self, req: PreviewRequest) -> PreviewResponse:
+        """One page of a remote table: COUNT(*) and the page itself both run at the source."""
+        conn = _CONNECTIONS.get(req.connection_id)
+        if conn is None:
+            raise ValueError(f"Connection '{req.connection_id}' not found")
+        if conn.get("attached"):
+            return execution_service.preview_table(self.preview_request(req))
+        unsupported = [field for field in _GRID_FIELDS if getattr(req, field)]
+        if unsupported:
+            # Only compiled to DuckDB SQL; attach the source to use them
+            raise ValueError(
+                f"{', '.join(unsupported)} not supported on connection '{req.connection_id}' "
+                "unless it is attached; use `filter` or `filters` instead"
+            )
+
+        schema, _, name = req.table_name.rpartition(".")
+        source = table(name, schema=schema or None)
+        remote = self._remote_table(req.connection_id, schema or None, name)
+        conditions = []
+        if req.filter and req.filter.strip():
+            if _UNSAFE_FILTER.search(_STRING_LITERAL.sub("''", req.filter)):
+                raise ValueError("'filter' must be a single expression, without ';' or comments")
+            conditions.append(text(req.filter))
+        for field, column_filter in req.filters.items():
+            if field not in remote["columns"]:
+                raise ValueError(f"Column '{field}' not found in '{req.table_name}'")
+            condition = _remote_condition(column(field), column_filter)
+            if condition is not None:
+                conditions.append(condition)
+
+        page = select(literal_column("*")).select_from(source)
+        count = select(func.count()).select_from(source)
+        if conditions:
+            page, count = page.where(*conditions), count.where(*conditions)
+        # Without ORDER BY pages may overlap or skip rows (and MSSQL rejects OFFSET)
+        page = page.order_by(*(column(c) for c in remote["order"]))
+        page = page.limit(max(req.limit, 0)).offset(max(req.offset, 0))
+
+        with tracing.span("remote"), self.get_engine(req.connection_id).connect() as c:
+            total_rows = c.execute(count).scalar()
+            result = c.execute(page)
+            df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+        tracing.count("rows", len(df))
+        return execution_service.to_response(df, total_rows)
+
+    def _remote_table(self, conn_id: str, schema: Optional[str], name: str) -> Dict[str, List[str]]:
+        """
+        Column names of a remote table, and the order to page it by: its primary
+        key, else its first column.
+        """
+        key = (conn_id, schema, name)
+        remote = self._remote_tables.get(key)
+        if remote is None:
+            inspector = inspect(self.get_engine(conn_id))
+            columns = [c["name"] for c in inspector.get_columns(name, schema=schema)]
+            order = list(inspector.get_pk_constraint(name, schema=schema).get("constrained_columns") or [])
+            remote = {"columns": columns, "order": order or columns[:1]}
+            self._remote_tables[key] = remote
+        return remote
+
+
+def _remote_condition(col, column_filter: ColumnFilter):
+    """SQLAlchemy condition of one grid column filter, values bound as parameters (None: no restriction)."""
+    f = column_filter
+    if f.conditions:
+        combine = {"AND": and_, "OR": or_}.get((f.operator or "AND").upper())
+        if combine is None:
+            raise ValueError(f"Unknown filter operator '{f.operator}'")
+        parts = [c for c in (_remote_condition(col, condition) for condition in f.conditions) if c is not None]
+        return combine(*parts) if parts else None
+    if f.filter_type not in _FILTER_TYPES:
+        raise ValueError(f"Unknown filter type '{f.filter_type}' (expected one of {', '.join(_FILTER_TYPES)})")
+
+    if f.filter_type == "set":
+        if f.values is None:
+            return None
+        present = [v for v in f.values if v is not None]
+        parts = [col.in_(present)] if present else []
+        if len(present) < len(f.values):
+            parts.append(col.is_(None))
+        return or_(*parts) if parts else false()
+
+    if f.type in ("blank", "notBlank"):
+        blank = or_(col.is_(None), cast(col, String) == "") if f.filter_type == "text" else col.is_(None)
+        return blank if f.type == "blank" else not_(blank)
+
+    if f.filter_type == "text":
+        if f.type not in _TEXT_MATCHES:
+            raise ValueError(f"Unknown text filter '{f.type}'")
+        if f.filter is None:
+            return None
+        return _TEXT_MATCHES[f.type](func.lower(cast(col, String)), str(f.filter).lower())
+
+    # number / date
+    if f.filter_type == "date":
+        col = cast(col, Date)
+    value = _remote_bound(f.filter_type, f.filter)
+    if value is None:
+        return None
+    if f.type == "inRange":
+        upper = _remote_bound(f.filter_type, f.filter_to)
+        if upper is None:
+            raise ValueError("inRange filter needs 'filter_to'")
+        return col.between(value, upper)
+    if f.type not in _COMPARISONS:
+        raise ValueError(f"Unknown {f.filter_type} filter '{f.type}'")
+    return _COMPARISONS[f.type](col, value)
+
+
+def _remote_bound(filter_type: str, value):
+    """Checked value of a number or date filter."""
+    if value is None:
+        return None
+    if filter_type == "number":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Number filter value {value!r} is not a number")
+        return value
+    try:
+        # '2024-03-01' or '2024-03-01 00:00:00' (the grid's date format)
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        raise ValueError(f"Date filter value {value!r} is not an ISO date")
+
+
 connection_service = ConnectionService()
@@ -1,13 +1,128 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, NamedTuple, Optional, Iterator, Tuple, Union
+from uuid import uuid4
+from app.config import settings
 from app.schemas.preview import PreviewRequest, PreviewResponse
+from app.services.session_pool import SessionBusy, SessionConnectionPool
+from app.services.query_builder import literal
+from app.services.resource_governor import MemoryBudgetExceeded, ResourceGovernor, frame_bytes
+from app.services.result_cache import result_cache, table_versions, normalize_sql, is_volatile
+from app.services.sql_utils import quote_ident, quote_table, is_numeric_type
+from app.services.stats_index import stats_index
+from app.services import grid_sql, tracing
+from contextlib import ExitStack, contextmanager
+from functools import partial
 import duckdb
+import io
+import json
+import math
 import os
+import re
+import threading
+import time
 import pandas as pd
 
+# Alternative result encodings, negotiated through the Accept header
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.datasnail.columnar+json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_BATCH_SIZE = 65536
+
+# Estimated bytes per cached result cell, for the result cache memory budget
+CACHED_CELL_BYTES = 64
+
+# Table functions whose result only depends on their arguments; any other (read_csv,
+# read_parquet, glob, ...) reads files or remote data and makes a result uncacheable
+_PURE_TABLE_FUNCTIONS = frozenset({"range", "generate_series", "unnest", "generate_subscripts"})
+
+# Table written by a DDL/DML statement, used to bump its version for the result cache
+_MUTATION_TARGET = re.compile(
+    r"""^\s*(?:
+        CREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:TEMP|TEMPORARY)\s+)?(?:TABLE|VIEW)\s+(?:IF\s+NOT\s+EXISTS\s+)?
+      | INSERT\s+(?:OR\s+\w+\s+)?INTO\s+
+      | UPDATE\s+
+      | DELETE\s+FROM\s+
+      | DROP\s+(?:TABLE|VIEW)\s+(?:IF\s+EXISTS\s+)?
+      | TRUNCATE\s+(?:TABLE\s+)?
+      | COPY\s+
+    )(?P<name>(?:"(?:[^"]|"")+"|\w+)(?:\.(?:"(?:[^"]|"")+"|\w+))*)""",
+    re.IGNORECASE | re.VERBOSE,
+)
+
+# Writes that only add rows (the stats index merges them in) and persistent table creation
+_APPEND_ONLY = re.compile(r"^\s*(?:INSERT\s+INTO\s|COPY\s+\S+\s+FROM\s)", re.IGNORECASE)
+_CREATE_TABLE = re.compile(r"^\s*CREATE\s+(?:OR\s+REPLACE\s+)?TABLE\s", re.IGNORECASE)
+
+# Streamed queries are interrupted after this many seconds unless the request says otherwise
+DEFAULT_QUERY_TIMEOUT = 300.0
+
+
+# Registry of file-backed tables, kept inside the database so a persistent
+# workspace knows at startup which sources are already ingested
+SOURCES_SCHEMA = "_datasnail"
+SOURCES_TABLE = f"{SOURCES_SCHEMA}.sources"
+
+
+def _json_safe(value):
+    """JSON has no NaN/Infinity: non-finite floats (also nested in lists/structs) become null."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, list):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    return value
+
+
+def _float_columns(description) -> List[int]:
+    """Positions of the result columns that may hold NaN/Infinity (floats, or types nesting them)."""
+    return [i for i, d in enumerate(description) if re.search(r"\b(?:DOUBLE|FLOAT|REAL)\b", str(d[1]).upper())]
+
+
+class SpilledFrame(NamedTuple):
+    """A published DataFrame moved to a Parquet file by the resource governor."""
+    path: str
+    rows: int
+
+
+def _out_of_memory(e: duckdb.OutOfMemoryException) -> MemoryBudgetExceeded:
+    return MemoryBudgetExceeded(
+        f"The query needs more memory than the server allows ({str(e).splitlines()[0]}); "
+        "narrow it down with filters or a LIMIT, or retry later"
+    )
+
+
 class ExecutionService:
     def __init__(self):
-        # Initialize persistent DuckDB connection
-        self.conn = duckdb.connect(':memory:')
+        # DuckDB database: in memory by default, or a persistent workspace file
+        # (DATASNAIL_DB_PATH). `self.conn` is only used for admin work;
+        # requests run on their session's pooled connection.
+        self.read_only = settings.duckdb_read_only and settings.duckdb_path != ":memory:"
+        self.conn = duckdb.connect(settings.duckdb_path, read_only=self.read_only,
+                                   config=settings.duckdb_config())
+        # Memory limit and spill directory of the engine, accounting of published frames
+        self.governor = ResourceGovernor(
+            budget_mb=settings.memory_budget_mb,
+            published_mb=settings.published_memory_mb,
+            session_mb=settings.session_memory_mb,
+            idle_timeout=settings.spill_idle_timeout,
+            spill=self._spill_frame,
+        )
+        self.governor.configure(self.conn)
+        self.pool = SessionConnectionPool(
+            self.conn,
+            max_sessions=settings.session_pool_size,
+            idle_timeout=settings.session_idle_timeout,
+            on_connect=self._restore_published,
+        )
+        # DataFrames registered per session: session_id -> {table name: DataFrame or SpilledFrame}
+        self._published: Dict[str, Dict[str, Union[pd.DataFrame, SpilledFrame]]] = {}
+        # Streamed queries in flight, by query id, so they can be cancelled
+        self._running: Dict[str, Any] = {}
+        self._running_lock = threading.Lock()
+        # File-backed tables: table name -> {"path", "mtime", "size"} of the ingested file
+        self._file_sources: Dict[str, Dict[str, Any]] = {}
+        self._sources_lock = threading.Lock()
+        self._load_sources()
         self._init_data()
 
     def _init_data(self):
@@ -16,48 +131,615 @@ class ExecutionService:
             base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
             data_path = os.path.join(base_dir, "data", "loans.csv")
             if os.path.exists(data_path):
-                self.conn.execute(f"CREATE TABLE loans AS SELECT * FROM read_csv_auto('{data_path}')")
-                print(f"Loaded {data_path} into 'loans' table.")
+                self.register_file_source("loans", data_path)
             else:
                 print(f"Warning: {data_path} not found.")
         except Exception as e:
             print(f"Failed to init data: {e}")
 
+    def _load_sources(self):
+        """Read the source registry of a persistent workspace (no-op for a fresh one)."""
+        with self.conn.cursor() as cur:
+            if not self.read_only:
+                cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SOURCES_SCHEMA}")
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} "
+                    "(table_name VARCHAR PRIMARY KEY, path VARCHAR, mtime DOUBLE, size BIGINT)"
+                )
+            try:
+                rows = cur.execute(f"SELECT table_name, path, mtime, size FROM {SOURCES_TABLE}").fetchall()
+            except duckdb.CatalogException:
+                rows = [] # Read-only replica of a workspace created before the registry existed
+        for table_name, path, mtime, size in rows:
+            if self.table_exists(self.conn, table_name):
+                self._file_sources[table_name] = {"path": path, "mtime": mtime, "size": size}
+
+    def register_file_source(self, table_name: str, path: str):
+        """
+        Ingest a CSV file into `table_name` once. The file's mtime and size are
+        recorded (in the workspace itself), so neither `refresh_file_source` nor
+        a restart on a persistent workspace re-parses an unchanged file.
+        """
+        with self._sources_lock:
+            source = self._file_sources.get(table_name)
+            if source is not None and source["path"] == path and not self._file_changed(source):
+                print(f"Reusing '{table_name}' table ingested from {path}.")
+                return
+            self._ingest_file(table_name, path)
+
+    def refresh_file_source(self, table_name: str) -> bool:
+        """Re-ingest `table_name` if it is backed by a file that changed since it was loaded."""
+        source = self._file_sources.get(table_name)
+        if source is None:
+            return False
+        with self._sources_lock:
+            if not self._file_changed(source):
+                return False
+            self._ingest_file(table_name, source["path"])
+            return True
+
+    @staticmethod
+    def _file_changed(source: Dict[str, Any]) -> bool:
+        try:
+            stat = os.stat(source["path"])
+        except OSError:
+            return False  # File went away, keep serving the last snapshot
+        return stat.st_mtime != source["mtime"] or stat.st_size != source["size"]
+
+    def _ingest_file(self, table_name: str, path: str):
+        if self.read_only:
+            print(f"Read-only workspace: not ingesting {path} into '{table_name}'.")
+            return
+        stat = os.stat(path)
+        with self.conn.cursor() as cur:
+            cur.execute("BEGIN")
+            cur.execute(f"CREATE OR REPLACE TABLE {quote_table(table_name)} AS SELECT * FROM read_csv_auto(?)", [path])
+            cur.execute(
+                f"INSERT OR REPLACE INTO {SOURCES_TABLE} VALUES (?, ?, ?, ?)",
+                [table_name, path, stat.st_mtime, stat.st_size],
+            )
+            cur.execute("COMMIT")
+        table_versions.bump(table_name)
+        stats_index.schedule_build(self.conn.cursor, table_name)
+        self._file_sources[table_name] = {"path": path, "mtime": stat.st_mtime, "size": stat.st_size}
+        print(f"Loaded {path} into '{table_name}' table.")
+
+    def close(self):
+        """Checkpoint a persistent workspace so the next start does not replay the WAL."""
+        if not self.read_only and settings.duckdb_path != ":memory:":
+            self.conn.execute("CHECKPOINT")
+        self.conn.close()
+        self.governor.close()
+
+    def publish_frame(self, session_id: Optional[str], table_name: str, df: pd.DataFrame,
+                      materialize: bool = False) -> str:
+        """
+        Make a DataFrame queryable as `table_name`.
+
+        By default the frame is registered on the session's connection: DuckDB
+        scans the pandas buffers in place (zero-copy for numeric columns), so
+        nothing is copied or written to disk. With `materialize` a snapshot is
+        copied into a regular table visible to every session instead.
+        Returns the publish mode.
+        """
+        session_id = session_id or "default"
+        if materialize:
+            with self.conn.cursor() as cur:
+                cur.register("__publish_src", df)
+                cur.execute(f"CREATE OR REPLACE TABLE {quote_table(table_name)} AS SELECT * FROM __publish_src")
+                cur.unregister("__publish_src")
+            previous = self._published.get(session_id, {}).pop(table_name, None)
+            if previous is not None:
+                # Drop the session view that would otherwise shadow the snapshot
+                with self.session(session_id) as conn:
+                    self._unregister(conn, table_name, previous)
+                self.governor.forget(session_id, table_name)
+            mode = "table"
+        else:
+            published = self._published.setdefault(session_id, {})
+            previous = published.get(table_name)
+            published[table_name] = df
+            with self.session(session_id) as conn:
+                if isinstance(previous, SpilledFrame):
+                    self._unregister(conn, table_name, previous)
+                conn.register(table_name, df)
+            self.governor.track(session_id, table_name, frame_bytes(df))
+            mode = "view"
+        table_versions.bump(table_name)
+        if materialize:
+            stats_index.schedule_build(self.conn.cursor, table_name)
+        else:
+            stats_index.schedule_build(lambda: self.session(session_id), table_name, session_id)
+            # Keep the published frames within their budget (may spill older ones)
+            self.governor.rebalance()
+        return mode
+
+    def _restore_published(self, session_id: str, conn):
+        # A session connection was recreated (e.g. after idle eviction): re-register its frames
+        for table_name, frame in self._published.get(session_id, {}).items():
+            if isinstance(frame, SpilledFrame):
+                conn.execute(self._spilled_view_sql(table_name, frame))
+            else:
+                conn.register(table_name, frame)
+
+    @staticmethod
+    def _spilled_view_sql(table_name: str, frame: SpilledFrame) -> str:
+        # Read lazily: only the row groups and columns a query needs come back from disk
+        return f"CREATE OR REPLACE TEMP VIEW {quote_ident(table_name)} AS SELECT * FROM read_parquet({literal(frame.path)})"
+
+    @staticmethod
+    def _unregister(conn, table_name: str, frame: Union[pd.DataFrame, SpilledFrame]):
+        if isinstance(frame, SpilledFrame):
+            conn.execute(f"DROP VIEW IF EXISTS temp.main.{quote_ident(table_name)}")
+            try:
+                os.remove(frame.path)
+            except OSError:
+                pass
+        else:
+            conn.unregister(table_name)
+
+    def _spill_frame(self, session_id: str, table_name: str) -> Optional[int]:
+        """
+        Move a published frame to a Parquet file and point the session's view at
+        it; returns the file size, or None if the session is busy (see ResourceGovernor).
+        """
+        try:
+            with self.pool.acquire_idle(session_id) as conn:
+                df = self._published.get(session_id, {}).get(table_name)
+                if not isinstance(df, pd.DataFrame):
+                    return None
+                path = os.path.join(self.governor.frames_dir, f"{uuid4().hex}.parquet")
+                with self.conn.cursor() as cur:
+                    cur.register("__spill_src", df)
+                    cur.execute(f"COPY __spill_src TO {literal(path + '.tmp')} (FORMAT parquet, COMPRESSION zstd)")
+                    cur.unregister("__spill_src")
+                published = self._published.get(session_id, {})
+                if published.get(table_name) is not df:
+                    os.remove(path + ".tmp") # Republished meanwhile
+                    return None
+                os.replace(path + ".tmp", path)
+                frame = SpilledFrame(path, len(df))
+                published[table_name] = frame
+                if conn is not None:
+                    conn.unregister(table_name)
+                    conn.execute(self._spilled_view_sql(table_name, frame))
+        except SessionBusy:
+            return None
+        print(f"Spilled '{table_name}' of session {session_id} to {path}")
+        return os.path.getsize(path)
+
+    @contextmanager
+    def session(self, session_id: Optional[str] = None):
+        """Borrow the DuckDB connection of `session_id` (shared database, private TEMP schema)."""
+        session_id = session_id or "default"
+        self.governor.touch(session_id)
+        with self.pool.acquire(session_id) as conn:
+            try:
+                yield conn
+            except duckdb.OutOfMemoryException as e:
+                raise _out_of_memory(e) from e
+
     def preview_table(self, req: PreviewRequest) -> PreviewResponse:
-        # Legacy/Mock support wrapper around run_query or specialized preview logic
-        if req.table_name == "loans":
-             return self.run_sql(f"SELECT * FROM loans LIMIT {req.limit}")
-             
+        # Windowed fetch straight from the engine: only `limit` rows starting at
+        # `offset` are materialized, `total_rows` comes from a COUNT(*).
+        sql = self.preview_sql(req)
+        if sql is not None:
+            return self.run_sql(sql, limit=req.limit, offset=req.offset, session_id=req.session_id,
+                                timeout=req.timeout)
+
         # Fallback for other mock tables if they don't exist in DuckDB
         return self._mock_logs(req.limit) if req.table_name == "app_logs" else PreviewResponse(columns=[], data=[])
 
-    def run_sql(self, sql: str) -> PreviewResponse:
+    def preview_sql(self, req: PreviewRequest) -> Optional[str]:
+        """SELECT statement backing a table preview, or None if the table is not in the engine."""
+        with self.session(req.session_id) as conn:
+            if not self.table_exists(conn, req.table_name):
+                return None
+            # Filters, sort and grouping are compiled into the one query (see grid_sql)
+            return grid_sql.preview_query(conn, req)
+
+    @staticmethod
+    def table_exists(conn, table_name: str) -> bool:
+        # `table`, `schema_or_catalog.table` or `catalog.schema.table`
+        parts = table_name.split(".")
+        sql = "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?"
+        if len(parts) == 2:
+            sql += " AND ? IN (table_schema, table_catalog)"
+        elif len(parts) > 2:
+            sql += " AND table_schema = ? AND table_catalog = ?"
+        row = conn.execute(sql, [parts[-1]] + parts[-2::-1][:2]).fetchone()
+        return row[0] > 0
+
+    def _execute_window(self, conn, sql: str, limit: Optional[int], offset: int,
+                        count_key: Optional[tuple] = None):
+        """
+        Execute a SQL script on `conn`, leaving the last statement's result pending.
+
+        Leading statements run as-is. If the last statement is a SELECT it is
+        wrapped in LIMIT/OFFSET (so only the requested block is ever fetched)
+        and counted with a separate COUNT(*). Returns the cursor holding the
+        result (None for an empty script) and the total row count, or None when
+        it is only known once the result has been fetched. With `count_key` the
+        count is cached, so paging through one filter state counts it once.
+        """
+        statements = duckdb.extract_statements(sql)
+        if not statements:
+            return None, 0
+
+        for stmt in statements[:-1]:
+            conn.execute(stmt.query)
+            self._note_write(stmt)
+
+        last = statements[-1]
+        query = last.query.strip().rstrip(";")
+        if last.type == duckdb.StatementType.SELECT and limit is not None:
+            total_rows = result_cache.get(count_key) if count_key is not None else None
+            if total_rows is None:
+                total_rows = conn.execute(f"SELECT COUNT(*) FROM ({query}\n) AS _q").fetchone()[0]
+                if count_key is not None:
+                    result_cache.put(count_key, total_rows, CACHED_CELL_BYTES)
+            else:
+                tracing.count("count_cache_hits", 1)
+            conn.execute(
+                f"SELECT * FROM ({query}\n) AS _q LIMIT ? OFFSET ?",
+                [limit, max(offset, 0)],
+            )
+            return conn, total_rows
+
+        conn.execute(query)
+        self._note_write(last)
+        return conn, None
+
+    def _note_write(self, stmt):
+        """Bump the version of the table a non-SELECT statement writes to."""
+        if stmt.type in (duckdb.StatementType.SELECT, duckdb.StatementType.EXPLAIN):
+            return
+        match = _MUTATION_TARGET.match(stmt.query)
+        if match:
+            table_name = match.group("name").split(".")[-1].strip('"').replace('""', '"')
+            table_versions.bump(table_name)
+            # Keep the column statistics index in step: appends are merged in, new tables indexed
+            if _APPEND_ONLY.match(stmt.query) and not re.search(r"\bON\s+CONFLICT\b", stmt.query, re.I):
+                stats_index.note_append(table_name)
+            elif _CREATE_TABLE.match(stmt.query):
+                stats_index.schedule_build(self.conn.cursor, table_name)
+        else:
+            # ALTER/ATTACH/SET/...: we cannot tell what changed, invalidate everything
+            table_versions.bump_all()
+
+    @staticmethod
+    def referenced_tables(conn, query: str, _depth: int = 0) -> Optional[set]:
+        """
+        Tables a SELECT reads, following views down to their base tables. None if
+        it reads data table versions do not track: files or remote sources through
+        table functions or replacement scans (FROM 'x.csv'), or attached catalogs.
+        """
+        relations = ExecutionService._relations(conn, query)
+        if relations is None or _depth >= 8:
+            return None
+        external = {
+            row[0].lower() for row in conn.execute(
+                "SELECT database_name FROM duckdb_databases() WHERE NOT internal AND database_name <> current_database()"
+            ).fetchall()
+        }
+        names = set()
+        for catalog, schema, table in relations:
+            if catalog in external or (not catalog and schema in external):
+                return None
+            names.add(table)
+        if not names:
+            return names
+
+        placeholders = ", ".join("?" for _ in names)
+        found = conn.execute(
+            "SELECT lower(table_name), NULL FROM duckdb_tables() "
+            f"WHERE database_name IN (current_database(), 'temp') AND lower(table_name) IN ({placeholders}) "
+            "UNION ALL SELECT lower(view_name), sql FROM duckdb_views() "
+            f"WHERE NOT internal AND database_name IN (current_database(), 'temp') AND lower(view_name) IN ({placeholders})",
+            list(names) * 2,
+        ).fetchall()
+        if not names <= {name for name, _ in found}:
+            return None  # Replacement scan of a file
+        for _, view_sql in found:
+            if not view_sql:
+                continue  # Base table, or a registered DataFrame
+            body = re.split(r"\bAS\b", view_sql, maxsplit=1, flags=re.IGNORECASE)[-1]
+            inner = ExecutionService.referenced_tables(conn, body, _depth + 1)
+            if inner is None:
+                return None
+            names |= inner
+        return names
+
+    @staticmethod
+    def _relations(conn, query: str) -> Optional[set]:
+        """
+        (catalog, schema, table) of every table or view named in a SELECT, CTEs
+        excluded, from its parsed tree. None if it calls a table function other
+        than a pure generator (read_csv, read_parquet, glob, ...).
+        """
+        tree = json.loads(conn.execute("SELECT json_serialize_sql(?)", [query]).fetchone()[0])
+        if tree.get("error"):
+            return None
+        relations, ctes = set(), set()
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+                continue
+            if not isinstance(node, dict):
+                continue
+            if node.get("type") == "BASE_TABLE":
+                relations.add(tuple(str(node.get(key) or "").lower() for key in ("catalog_name", "schema_name", "table_name")))
+            elif node.get("type") == "TABLE_FUNCTION":
+                function = node.get("function") or {}
+                if str(function.get("function_name", "")).lower() not in _PURE_TABLE_FUNCTIONS:
+                    return None
+            elif "cte_map" in node:
+                ctes |= {str(entry.get("key", "")).lower() for entry in (node["cte_map"] or {}).get("map", [])}
+            stack.extend(node.values())
+        return {relation for relation in relations if relation[0] or relation[1] or relation[2] not in ctes}
+
+    def run_sql(self, sql: str, limit: Optional[int] = None, offset: int = 0,
+                session_id: Optional[str] = None, timeout: Optional[float] = None) -> PreviewResponse:
+        """
+        Execute a SQL script and return a window of the last statement's result
+        as records. With `timeout` (seconds) it is interrupted once that elapses.
+        """
         try:
-            # Execute SQL
-            df = self.conn.execute(sql).df()
-            
-            # Convert to Dictionary
-            data = df.to_dict(orient='records')
-            
-            # Map columns
-            columns = []
-            for col in df.columns:
-                dtype = str(df[col].dtype)
-                col_type = "numeric" if "int" in dtype or "float" in dtype else "text"
-                if "datetime" in dtype: col_type = "datetime"
-                columns.append({
-                    "field": col,
-                    "headerName": col,
-                    "type": col_type
-                })
-                
-            return PreviewResponse(columns=columns, data=data, total_rows=len(data))
-            
+            with self.session(session_id) as conn:
+                cache_key = self._cache_key(conn, sql, limit, offset, session_id)
+                if cache_key is not None:
+                    cached = result_cache.get(cache_key)
+                    if cached is not None:
+                        tracing.count("result_cache_hits", 1)
+                        return cached
+
+                self.governor.admit()
+                with tracing.profiled(conn), self._time_limit(conn, timeout):
+                    with tracing.span("execute"):
+                        cur, total_rows = self._execute_window(conn, sql, limit, offset,
+                                                               self._count_key(cache_key))
+                    if cur is None:
+                        return PreviewResponse(columns=[], data=[], total_rows=0)
+
+                    with tracing.span("fetch_df"):
+                        df = cur.df()
+            tracing.count("rows", len(df))
+            response = self.to_response(df, len(df) if total_rows is None else total_rows)
+            if cache_key is not None:
+                result_cache.put(cache_key, response, CACHED_CELL_BYTES * max(df.size, 1))
+            return response
+
         except Exception as e:
             print(f"SQL Execution Error: {e}")
             # Return empty response with error logging (or raise HTTP exception in router)
             raise e
 
+    def _cache_key(self, conn, sql: str, limit: Optional[int], offset: int, session_id: Optional[str]):
+        """
+        Result cache key for a single deterministic SELECT: normalized SQL, the
+        window, the session (TEMP tables are per session) and the current version
+        of every table it reads. None if the script must not be cached.
+        """
+        statements = duckdb.extract_statements(sql)
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT or is_volatile(sql):
+            return None
+        try:
+            tables = self.referenced_tables(conn, statements[0].query)
+        except duckdb.Error:
+            return None  # Let execution report the error
+        if tables is None:
+            return None  # Reads files or external catalogs, whose changes we cannot see
+        # Registered DataFrames are invisible to get_table_names, match them by name
+        tables |= {
+            name.lower() for name in self._published.get(session_id or "default", {})
+            if re.search(rf"\b{re.escape(name)}\b", sql, re.IGNORECASE)
+        }
+        return ("sql", session_id or "default", normalize_sql(sql), limit, offset, table_versions.snapshot(tables))
+
+    @staticmethod
+    def _count_key(cache_key: Optional[tuple]) -> Optional[tuple]:
+        """Row count key of a result cache key: the same query and versions, any window."""
+        if cache_key is None:
+            return None
+        _, session_id, sql, _, _, versions = cache_key
+        return ("count", session_id, sql, versions)
+
+    def run_sql_columnar(self, sql: str, limit: Optional[int] = None, offset: int = 0,
+                         session_id: Optional[str] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Same window as `run_sql`, encoded column-oriented: one list of values per
+        column instead of one dict per row, and no pandas round trip.
+        """
+        self.governor.admit()
+        with self.session(session_id) as conn, tracing.profiled(conn), self._time_limit(conn, timeout):
+            count_key = self._count_key(self._cache_key(conn, sql, limit, offset, session_id))
+            with tracing.span("execute"):
+                cur, total_rows = self._execute_window(conn, sql, limit, offset, count_key)
+            if cur is None or cur.description is None:
+                return {"columns": [], "data": {}, "total_rows": 0}
+
+            description = cur.description
+            with tracing.span("fetch"):
+                rows = cur.fetchall()
+
+        tracing.count("rows", len(rows))
+        with tracing.span("to_columns"):
+            names = [d[0] for d in description]
+            values = [list(col) for col in zip(*rows)] if rows else [[] for _ in names]
+            for i in _float_columns(description):
+                values[i] = [_json_safe(v) for v in values[i]]
+            return {
+                "columns": [self._column_def(d[0], str(d[1])) for d in description],
+                "data": dict(zip(names, values)),
+                "total_rows": len(rows) if total_rows is None else total_rows,
+            }
+
+    def stream_sql(self, sql: str, media_type: str = NDJSON_MEDIA_TYPE, limit: Optional[int] = None,
+                   offset: int = 0, timeout: Optional[float] = None, batch_size: int = ARROW_BATCH_SIZE,
+                   session_id: Optional[str] = None) -> Tuple[str, Optional[int], "QueryStream"]:
+        """
+        Execute on the session's connection and return (query_id, total_rows,
+        body). The body yields chunks as DuckDB emits batches, either NDJSON
+        rows or an Arrow IPC stream. The connection stays borrowed until the
+        body is exhausted or closed, or is garbage collected without ever being
+        read (its TEMP tables and published frames are not visible from other
+        cursors). The query is interrupted when `timeout` elapses, when
+        `cancel(query_id)` is called, or when the client stops consuming it.
+        """
+        self.governor.admit()
+        query_id = str(uuid4())
+        seconds = timeout or DEFAULT_QUERY_TIMEOUT
+        deadline = time.monotonic() + seconds
+        interrupted = partial(self._interrupted, query_id)
+        borrowed = ExitStack()
+        cur = borrowed.enter_context(self.session(session_id))
+        with self._running_lock:
+            # `reason` records why it was interrupted: "timeout" or "cancelled"
+            self._running[query_id] = {"cursor": cur, "timeout": seconds, "reason": None}
+        # Covers the execution itself; the body re-arms it for the fetch
+        timer = self._interrupt_at(query_id, deadline)
+        try:
+            with tracing.span("execute"):
+                result, total_rows = self._execute_window(cur, sql, limit, offset)
+            if result is None:
+                result = cur.execute("SELECT NULL WHERE FALSE")
+            if media_type == ARROW_STREAM_MEDIA_TYPE:
+                chunks = self._arrow_chunks(result, batch_size)
+            else:
+                chunks = self._ndjson_chunks(result, batch_size, interrupted)
+        except duckdb.OutOfMemoryException as e:
+            self._finish(query_id, borrowed)
+            raise _out_of_memory(e) from e
+        except duckdb.InterruptException as e:
+            message = interrupted()
+            self._finish(query_id, borrowed)
+            raise ValueError(message) from e
+        except Exception:
+            self._finish(query_id, borrowed)
+            raise
+        finally:
+            timer.cancel()
+
+        return query_id, total_rows, QueryStream(self, query_id, borrowed, chunks, deadline)
+
+    @contextmanager
+    def _time_limit(self, conn, timeout: Optional[float]):
+        """Interrupt what `conn` runs inside the block once `timeout` seconds elapse (no limit if None)."""
+        if not timeout:
+            yield
+            return
+        query_id = str(uuid4())
+        with self._running_lock:
+            self._running[query_id] = {"cursor": conn, "timeout": timeout, "reason": None}
+        timer = self._interrupt_at(query_id, time.monotonic() + timeout)
+        try:
+            yield
+        except duckdb.InterruptException as e:
+            raise ValueError(self._interrupted(query_id)) from e
+        finally:
+            timer.cancel()
+            with self._running_lock:
+                self._running.pop(query_id, None)
+
+    def _interrupt_at(self, query_id: str, deadline: float) -> threading.Timer:
+        timer = threading.Timer(max(deadline - time.monotonic(), 0), self.cancel, [query_id, "timeout"])
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _finish(self, query_id: str, borrowed: ExitStack, interrupt: bool = False):
+        """Forget a streamed query and give its session connection back."""
+        with self._running_lock:
+            running = self._running.pop(query_id, None)
+            if interrupt and running is not None:
+                running["cursor"].interrupt()
+        borrowed.close()
+
+    def cancel(self, query_id: str, reason: str = "cancelled") -> bool:
+        """Interrupt a running streamed query. Returns False if it is unknown or already done."""
+        with self._running_lock:
+            # Under the lock: a finished query's connection may already run someone else's
+            running = self._running.get(query_id)
+            if running is None:
+                return False
+            running["reason"] = running["reason"] or reason
+            running["cursor"].interrupt()
+        return True
+
+    def _interrupted(self, query_id: str) -> str:
+        """Error message of an interrupted streamed query, after why it was interrupted."""
+        running = self._running.get(query_id) or {}
+        if running.get("reason") == "timeout":
+            return f"Query timed out after {running['timeout']:g}s"
+        return "Query cancelled"
+
+    @staticmethod
+    def _arrow_chunks(result, batch_size: int) -> Iterator[bytes]:
+        import pyarrow as pa
+
+        to_reader = getattr(result, "to_arrow_reader", None) or result.fetch_record_batch
+        reader = to_reader(batch_size)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                yield sink.getvalue()
+                sink.seek(0)
+                sink.truncate()
+        yield sink.getvalue()  # end-of-stream marker
+
+    @staticmethod
+    def _ndjson_chunks(result, batch_size: int, interrupted: Callable[[], str]) -> Iterator[bytes]:
+        names = [d[0] for d in result.description or []]
+        floats = _float_columns(result.description or [])
+        while True:
+            try:
+                rows = result.fetchmany(batch_size)
+            except duckdb.InterruptException:
+                yield (json.dumps({"error": interrupted()}) + "\n").encode()
+                return
+            if not rows:
+                return
+            if floats:
+                rows = [list(row) for row in rows]
+                for row in rows:
+                    for i in floats:
+                        row[i] = _json_safe(row[i])
+            yield "".join(
+                json.dumps(dict(zip(names, row)), default=str, allow_nan=False) + "\n" for row in rows
+            ).encode()
+
+    @staticmethod
+    def _column_def(name: str, duck_type: str) -> Dict[str, Any]:
+        col_type = "text"
+        if is_numeric_type(duck_type):
+            col_type = "numeric"
+        elif "TIMESTAMP" in duck_type.upper() or "DATE" in duck_type.upper():
+            col_type = "datetime"
+        return {"field": name, "headerName": name, "type": col_type}
+
+    def to_response(self, df: pd.DataFrame, total_rows: int) -> PreviewResponse:
+        # Convert to Dictionary
+        with tracing.span("to_dict"):
+            data = df.to_dict(orient='records')
+
+        # Map columns
+        columns = []
+        for col in df.columns:
+            dtype = str(df[col].dtype)
+            col_type = "numeric" if "int" in dtype or "float" in dtype else "text"
+            if "datetime" in dtype: col_type = "datetime"
+            columns.append({
+                "field": col,
+                "headerName": col,
+                "type": col_type
+            })
+
+        with tracing.span("validate"):
+            return PreviewResponse(columns=columns, data=data, total_rows=total_rows)
+
     def _mock_logs(self, limit: int) -> PreviewResponse:
         columns = [
             {"field": "id", "headerName": "ID", "type": "numeric"},
@@ -67,4 +749,56 @@ class ExecutionService:
         data = [{"id": i, "action": "LOGIN", "timestamp": "2023-01-01T12:00:00"} for i in range(limit)]
         return PreviewResponse(columns=columns, data=data, total_rows=500)
 
+class QueryStream:
+    """
+    Body of a streamed query (see `ExecutionService.stream_sql`). Iterating it
+    yields the chunks; its timeout only runs once the first chunk is pulled.
+    `close()` ends the query and returns the session connection; it also runs
+    when the body is dropped unread, e.g. the client left before the response
+    started, so the connection is never left borrowed.
+    """
+
+    def __init__(self, service: ExecutionService, query_id: str, borrowed: ExitStack,
+                 chunks: Iterator[bytes], deadline: float):
+        self.query_id = query_id
+        self._service = service
+        self._borrowed = borrowed
+        self._chunks = chunks
+        self._deadline = deadline
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        with self._lock:
+            if self._closed:
+                raise StopIteration
+            if self._timer is None:
+                self._timer = self._service._interrupt_at(self.query_id, self._deadline)
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close(interrupt=False)
+            raise
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self, interrupt: bool = True):
+        """Stop the query (unless it completed) and return its connection. Idempotent."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+        # Client went away or the stream errored: stop burning cores
+        self._service._finish(self.query_id, self._borrowed, interrupt=interrupt)
+
+    def __del__(self):
+        self.close()
+
 execution_service = ExecutionService()
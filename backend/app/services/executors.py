@@ -0,0 +1,76 @@
+"""
+Bounded executors for blocking work, one per workload class.
+
+Handlers are `async def` and hand their DuckDB/kernel calls to the executor
+of their class, so a burst of heavy analysis requests queues behind the
+analysis workers instead of starving previews, the catalog or `/health`
+(which never leave the event loop). Each executor admits at most
+`workers + max_queue` calls; past that `ExecutorSaturated` is raised and
+answered with 429 + Retry-After (see main.py).
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.config import settings
+from app.services import tracing
+
+
+class ExecutorSaturated(RuntimeError):
+    """Every worker is busy and the queue is full."""
+
+    def __init__(self, name: str, retry_after: int = 1):
+        super().__init__(f"The {name} workers are saturated, retry shortly")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-worker")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run `fn` on a worker thread, or raise ExecutorSaturated if admission fails."""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self.name)
+            self._pending += 1
+        submitted = time.perf_counter()
+
+        def call():
+            tracing.record(f"{self.name}_queue", time.perf_counter() - submitted)
+            return fn(*args, **kwargs)
+
+        # The request's context (its trace) goes along to the worker thread
+        future = self._pool.submit(contextvars.copy_context().run, call)
+        # Released when the work finishes, even if the client went away meanwhile
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": min(self._pending, self.workers),
+                "queued": max(self._pending - self.workers, 0),
+                "max_queue": self.max_queue,
+                "rejected": self.rejected,
+            }
+
+
+query_executor = BoundedExecutor("query", settings.query_workers, settings.query_queue)
+analysis_executor = BoundedExecutor("analysis", settings.analysis_workers, settings.analysis_queue)
+python_executor = BoundedExecutor("python", settings.python_workers, settings.python_queue)
@@ -0,0 +1,153 @@
+"""
+Structured filter/sort/group model of the data grid, compiled to DuckDB SQL.
+
+Column names are checked against the table's catalog entry and quoted, and
+values are rendered as typed literals, so the model can come straight from
+the client. The whole model becomes one query against the underlying
+table: filters are a WHERE clause that DuckDB pushes into the scan, sorting
+with the page LIMIT is a top-N, and a grouping level is a GROUP BY, so the
+client never holds more than the page it shows.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.schemas.preview import ColumnFilter, PreviewRequest, SortKey
+from app.services.query_builder import literal, query_builder
+from app.services.sql_utils import quote_ident, quote_table
+
+_COMPARISONS = {
+    "equals": "=", "notEqual": "<>",
+    "lessThan": "<", "lessThanOrEqual": "<=",
+    "greaterThan": ">", "greaterThanOrEqual": ">=",
+}
+# Text filters are case-insensitive, like the grid's own
+_TEXT_MATCHES = {
+    "equals": "{col} = {value}",
+    "notEqual": "{col} <> {value}",
+    "contains": "contains({col}, {value})",
+    "notContains": "NOT contains({col}, {value})",
+    "startsWith": "starts_with({col}, {value})",
+    "endsWith": "ends_with({col}, {value})",
+}
+_FILTER_TYPES = ("text", "number", "date", "set")
+AGGREGATES = ("sum", "avg", "min", "max", "count")
+# Name of the per-group row count in grouped results
+GROUP_COUNT = "count"
+
+
+def preview_query(conn, req: PreviewRequest) -> str:
+    """SELECT for one grid view of `req.table_name`: filtered rows, or the groups of the next level."""
+    table_name = req.table_name
+    conditions = []
+    if req.filter and req.filter.strip():
+        conditions.append(f"({req.filter})")
+    for column, column_filter in req.filters.items():
+        condition = filter_condition(query_builder.column(conn, table_name, column), column_filter)
+        if condition is not None:
+            conditions.append(condition)
+
+    if len(req.group_keys) > len(req.group_by):
+        raise ValueError(f"{len(req.group_keys)} group keys for {len(req.group_by)} grouping levels")
+    group_cols = [query_builder.column(conn, table_name, column) for column in req.group_by]
+    for col, key in zip(group_cols, req.group_keys):
+        conditions.append(f"{col} IS NULL" if key is None else f"{col} = {literal(key)}")
+
+    table = quote_table(table_name)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    level = len(req.group_keys)
+    if level == len(req.group_by):
+        columns = {name: quote_ident(name) for name in query_builder.columns(conn, table_name)}
+        return f"SELECT * FROM {table}{where}{_order_by(req.sort, columns)}"
+
+    # Rows of the next grouping level: one per value, with its row count and aggregates
+    group = req.group_by[level]
+    selects = {group: group_cols[level], GROUP_COUNT: f"COUNT(*) AS {quote_ident(GROUP_COUNT)}"}
+    for column, func in req.aggregates.items():
+        if func.lower() not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{func}' (expected one of {', '.join(AGGREGATES)})")
+        if column not in selects:
+            col = query_builder.column(conn, table_name, column)
+            selects[column] = f"{func.upper()}({col}) AS {col}"
+    order = _order_by(req.sort, {name: quote_ident(name) for name in selects}, skip_unknown=True)
+    return (
+        f"SELECT {', '.join(selects.values())} FROM {table}{where} GROUP BY {group_cols[level]}"
+        f"{order or f' ORDER BY {group_cols[level]} NULLS LAST'}"
+    )
+
+
+def filter_condition(col: str, column_filter: ColumnFilter) -> Optional[str]:
+    """SQL condition of one column filter on the quoted column `col` (None: no restriction)."""
+    f = column_filter
+    if f.conditions:
+        operator = (f.operator or "AND").upper()
+        if operator not in ("AND", "OR"):
+            raise ValueError(f"Unknown filter operator '{f.operator}'")
+        parts = [c for c in (filter_condition(col, condition) for condition in f.conditions) if c is not None]
+        return "(" + f" {operator} ".join(parts) + ")" if parts else None
+    if f.filter_type not in _FILTER_TYPES:
+        raise ValueError(f"Unknown filter type '{f.filter_type}' (expected one of {', '.join(_FILTER_TYPES)})")
+
+    if f.filter_type == "set":
+        if f.values is None:
+            return None
+        present = [v for v in f.values if v is not None]
+        parts = [f"{col} IN ({', '.join(literal(v) for v in present)})"] if present else []
+        if len(present) < len(f.values):
+            parts.append(f"{col} IS NULL")
+        return "(" + " OR ".join(parts) + ")" if parts else "FALSE"
+
+    if f.type in ("blank", "notBlank"):
+        blank = f"({col} IS NULL OR {col}::VARCHAR = '')" if f.filter_type == "text" else f"{col} IS NULL"
+        return blank if f.type == "blank" else f"NOT {blank}"
+
+    if f.filter_type == "text":
+        if f.type not in _TEXT_MATCHES:
+            raise ValueError(f"Unknown text filter '{f.type}'")
+        if f.filter is None:
+            return None
+        return _TEXT_MATCHES[f.type].format(col=f"lower({col}::VARCHAR)", value=literal(str(f.filter).lower()))
+
+    # number / date
+    if f.filter_type == "date":
+        col = f"{col}::DATE"
+    value = _bound(f.filter_type, f.filter)
+    if value is None:
+        return None
+    if f.type == "inRange":
+        upper = _bound(f.filter_type, f.filter_to)
+        if upper is None:
+            raise ValueError(f"inRange filter on {col} needs 'filter_to'")
+        return f"{col} BETWEEN {value} AND {upper}"
+    if f.type not in _COMPARISONS:
+        raise ValueError(f"Unknown {f.filter_type} filter '{f.type}'")
+    return f"{col} {_COMPARISONS[f.type]} {value}"
+
+
+def _bound(filter_type: str, value) -> Optional[str]:
+    """Typed literal of a number or date filter value."""
+    if value is None:
+        return None
+    if filter_type == "number":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Number filter value {value!r} is not a number")
+        return literal(value)
+    try:
+        # '2024-03-01' or '2024-03-01 00:00:00' (the grid's date format)
+        return literal(datetime.fromisoformat(str(value)).date())
+    except ValueError:
+        raise ValueError(f"Date filter value {value!r} is not an ISO date")
+
+
+def _order_by(sort: List[SortKey], columns: Dict[str, str], skip_unknown: bool = False) -> str:
+    """ORDER BY over `columns` (name -> SQL); keys on other columns raise, or are skipped for groups."""
+    keys = []
+    for key in sort:
+        direction = key.direction.lower()
+        if direction not in ("asc", "desc"):
+            raise ValueError(f"Unknown sort direction '{key.direction}'")
+        if key.column not in columns:
+            if skip_unknown:
+                continue # Leaf columns while rows are grouped
+            raise ValueError(f"Column '{key.column}' not found")
+        keys.append(f"{columns[key.column]} {direction.upper()} NULLS LAST")
+    return f" ORDER BY {', '.join(keys)}" if keys else ""
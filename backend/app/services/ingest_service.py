@@ -0,0 +1,314 @@
+"""
+Bulk file imports as background jobs.
+
+A job reads CSV, Parquet or JSON files (a single file, a glob such as
+`tapes/2024-*.csv.gz`, a list of them, or a hive-partitioned directory)
+with DuckDB's parallel readers, on a worker of its own pool so the request
+that started it returns immediately. The result is either
+
+* `table`: a native DuckDB table (replaced, appended to, or refused if it exists);
+* `parquet`: the data converted to ZSTD Parquet under `parquet_dir/<table>/`
+  (appends add a part file) and a view over that directory;
+* `view`: a view reading the files in place, nothing copied.
+
+Progress comes from DuckDB's own query progress; running jobs can be cancelled.
+"""
+import glob
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional
+from uuid import uuid4
+
+import duckdb
+
+from app.config import settings
+from app.schemas.ingest import ImportRequest, IngestJob, IngestJobList
+from app.services.execution_service import execution_service
+from app.services.query_builder import literal
+from app.services.result_cache import table_versions
+from app.services.sql_utils import quote_table
+from app.services.stats_index import stats_index
+
+# File extension -> format; compression suffixes are looked through
+_FORMATS = {
+    ".csv": "csv", ".tsv": "csv", ".txt": "csv",
+    ".parquet": "parquet", ".pq": "parquet",
+    ".json": "json", ".jsonl": "json", ".ndjson": "json",
+}
+_COMPRESSION_SUFFIXES = (".gz", ".zst")
+_READERS = {"csv": "read_csv", "parquet": "read_parquet", "json": "read_json_auto"}
+_MODES = ("table", "parquet", "view")
+_IF_EXISTS = ("replace", "append", "fail")
+_OPTION_NAME = re.compile(r"^[A-Za-z_]\w*$")
+# `table`, `schema.table` or `catalog.schema.table`; also names the Parquet directory
+_TABLE_NAME = re.compile(r"^[A-Za-z_]\w*(?:\.[A-Za-z_]\w*){0,2}$")
+
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+
+def _format_of(path: str) -> Optional[str]:
+    name = path.lower()
+    for suffix in _COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return _FORMATS.get(os.path.splitext(name)[1])
+
+
+def _suffix(path: str) -> str:
+    """Extension including a compression suffix: `.csv.gz`, `.parquet`."""
+    root, ext = os.path.splitext(path)
+    if ext.lower() in _COMPRESSION_SUFFIXES:
+        ext = os.path.splitext(root)[1] + ext
+    return ext
+
+
+def _value_literal(value: Any) -> str:
+    """Reader option value: scalars via `literal`, lists and dicts (e.g. `columns`) recursively."""
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_value_literal(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{literal(str(k))}: {_value_literal(v)}" for k, v in value.items()) + "}"
+    return literal(value)
+
+
+class IngestService:
+    def __init__(self):
+        # job id -> job state (the IngestJob fields plus the running cursor)
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=settings.ingest_workers, thread_name_prefix="ingest")
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def submit(self, req: ImportRequest) -> IngestJob:
+        """Validate the request and queue its import; returns the job right away."""
+        if not req.path and not req.paths:
+            raise ValueError("Set 'path' or 'paths'")
+        if not _TABLE_NAME.match(req.table_name):
+            raise ValueError(f"Invalid table name '{req.table_name}' (expected [catalog.][schema.]table)")
+        if req.mode not in _MODES:
+            raise ValueError(f"Unknown import mode '{req.mode}' (expected one of {', '.join(_MODES)})")
+        if req.if_exists not in _IF_EXISTS:
+            raise ValueError(f"Unknown if_exists '{req.if_exists}' (expected one of {', '.join(_IF_EXISTS)})")
+        if req.mode == "view" and req.if_exists == "append":
+            raise ValueError("A view cannot be appended to: import in 'table' or 'parquet' mode")
+        if req.format is not None and req.format not in _READERS:
+            raise ValueError(f"Unknown format '{req.format}' (expected one of {', '.join(_READERS)})")
+        unknown = [name for name in req.options if not _OPTION_NAME.match(name)]
+        if unknown:
+            raise ValueError(f"Invalid reader option names: {', '.join(unknown)}")
+        if execution_service.read_only:
+            raise ValueError("The workspace is read-only")
+
+        job = {
+            "id": uuid4().hex,
+            "status": "queued",
+            "table_name": req.table_name,
+            "source": req.paths or [req.path],
+            "format": req.format,
+            "mode": req.mode,
+            "created_at": time.time(),
+            "cursor": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._trim()
+        self._executor.submit(self._run, job, req)
+        return self._view(job)
+
+    def get_job(self, job_id: str) -> IngestJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Import job '{job_id}' not found")
+        return self._view(job)
+
+    def list_jobs(self) -> IngestJobList:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return IngestJobList(jobs=[self._view(job) for job in reversed(jobs)])
+
+    def cancel(self, job_id: str) -> IngestJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Import job '{job_id}' not found")
+        with self._lock:
+            if job["status"] in ("queued", "running"):
+                job["status"] = "cancelled"
+                if job["cursor"] is not None:
+                    job["cursor"].interrupt()
+        return self._view(job)
+
+    def _trim(self):
+        """Forget the oldest finished jobs past `ingest_job_history`."""
+        finished = [k for k, j in self._jobs.items() if j["status"] not in ("queued", "running")]
+        for job_id in finished[:max(len(self._jobs) - settings.ingest_job_history, 0)]:
+            del self._jobs[job_id]
+
+    def _view(self, job: Dict[str, Any]) -> IngestJob:
+        fields = {k: v for k, v in job.items() if k != "cursor"}
+        cursor = job["cursor"]
+        if job["status"] == "running" and cursor is not None:
+            try:
+                # Percentage of the running statement, -1 between statements
+                progress = cursor.query_progress()
+                if progress >= 0:
+                    fields["progress"] = job["progress"] = round(min(progress / 100, 0.99), 4)
+            except duckdb.Error:
+                pass
+        if job.get("started_at"):
+            fields["elapsed"] = round((job.get("finished_at") or time.time()) - job["started_at"], 3)
+        return IngestJob(**fields)
+
+    # ------------------------------------------------------------------
+    # Uploads
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def save_upload(fileobj: BinaryIO, filename: Optional[str]) -> str:
+        """Copy an uploaded file to `upload_dir` in chunks; returns its path."""
+        os.makedirs(settings.upload_dir, exist_ok=True)
+        name = re.sub(r"[^\w.-]+", "_", os.path.basename(filename or "upload")) or "upload"
+        path = os.path.join(settings.upload_dir, f"{uuid4().hex[:8]}_{name}")
+        with open(path, "wb") as out:
+            shutil.copyfileobj(fileobj, out, UPLOAD_CHUNK_BYTES)
+        return path
+
+    # ------------------------------------------------------------------
+    # Import
+    # ------------------------------------------------------------------
+
+    def _run(self, job: Dict[str, Any], req: ImportRequest):
+        with self._lock:
+            if job["status"] == "cancelled":
+                return
+            job.update(status="running", started_at=time.time())
+        try:
+            with execution_service.conn.cursor() as cur:
+                cur.execute("SET enable_progress_bar = true")
+                cur.execute("SET enable_progress_bar_print = false")
+                with self._lock:
+                    # From here on cancel() can interrupt the running statement
+                    job["cursor"] = cur
+                self._import(cur, job, req)
+            status, error = "done", None
+        except Exception as e:
+            # An interrupt from cancel() surfaces as an error of the running statement
+            status, error = ("cancelled", None) if job["status"] == "cancelled" else ("failed", str(e))
+            print(f"Import into '{req.table_name}' {status}: {e}")
+        with self._lock:
+            if job["status"] == "cancelled":
+                status, error = "cancelled", None  # Cancelled after its last statement
+            job.update(status=status, error=error, cursor=None, finished_at=time.time())
+            if status == "done":
+                job["progress"] = 1.0
+
+    def _check_cancelled(self, job: Dict[str, Any]):
+        """Stop before the next statement if the job was cancelled between statements."""
+        with self._lock:
+            if job["status"] == "cancelled":
+                raise RuntimeError("Import cancelled")
+
+    def _execute(self, cur, job: Dict[str, Any], sql: str, params: Optional[list] = None):
+        self._check_cancelled(job)
+        return cur.execute(sql, params)
+
+    def _import(self, cur, job: Dict[str, Any], req: ImportRequest):
+        sources = [self._pattern(p, req.format) for p in job["source"]]
+        files = [f for pattern in sources
+                 for (f,) in self._execute(cur, job, "SELECT file FROM glob(?)", [pattern]).fetchall()]
+        if not files:
+            raise ValueError(f"No files match {', '.join(job['source'])}")
+        fmt = req.format or _format_of(files[0])
+        if fmt is None:
+            raise ValueError(f"Cannot tell the format of '{files[0]}', set 'format'")
+        job.update(format=fmt, files=len(files),
+                   bytes=sum(os.path.getsize(f) for f in files if os.path.isfile(f)))
+
+        table = quote_table(req.table_name)
+        exists = execution_service.table_exists(cur, req.table_name)
+        if exists and req.if_exists == "fail":
+            raise ValueError(f"Table '{req.table_name}' already exists")
+        append = exists and req.if_exists == "append"
+        reader = self._reader(fmt, sources, req)
+
+        if req.mode == "table":
+            if append:
+                self._execute(cur, job, f"INSERT INTO {table} BY NAME SELECT * FROM {reader}")
+            else:
+                self._execute(cur, job, f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM {reader}")
+        elif req.mode == "parquet":
+            self._check_cancelled(job)
+            job["output"] = self._to_parquet(cur, req.table_name, reader, append)
+            self._execute(
+                cur, job,
+                f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM "
+                f"read_parquet({literal(os.path.join(job['output'], '*.parquet'))}, union_by_name = true)"
+            )
+        else:
+            self._execute(cur, job, f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM {reader}")
+
+        if req.mode != "view":
+            # Parquet/native row counts are cheap; a view over raw files would need a full scan
+            job["rows"] = self._execute(cur, job, f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+        table_versions.bump(req.table_name)
+        if req.mode == "table":
+            if append:
+                stats_index.note_append(req.table_name)
+            else:
+                stats_index.schedule_build(execution_service.conn.cursor, req.table_name)
+
+    @staticmethod
+    def _pattern(path: str, fmt: Optional[str]) -> str:
+        """Glob for a source: directories stand for every data file below them (hive layout)."""
+        if not os.path.isdir(path):
+            return path
+        # Data files only (no _SUCCESS/.crc markers), of the requested or first-seen format
+        files = [f for f in glob.iglob(os.path.join(path, "**", "*"), recursive=True)
+                 if os.path.isfile(f) and _format_of(f)]
+        fmt = fmt or (_format_of(files[0]) if files else None)
+        suffixes = Counter(_suffix(f) for f in files if _format_of(f) == fmt)
+        if not suffixes:
+            return os.path.join(path, "**", "*")
+        # DuckDB globs have no alternation: match the suffix the data files use
+        return os.path.join(path, "**", f"*{suffixes.most_common(1)[0][0]}")
+
+    @staticmethod
+    def _reader(fmt: str, sources: List[str], req: ImportRequest) -> str:
+        """Table function call reading every source in parallel, options rendered as literals."""
+        source = literal(sources[0]) if len(sources) == 1 else _value_literal(sources)
+        options = {"union_by_name": req.union_by_name}
+        if req.hive_partitioning is not None:
+            options["hive_partitioning"] = req.hive_partitioning
+        options.update(req.options)
+        args = ", ".join(f"{name} = {_value_literal(value)}" for name, value in options.items())
+        return f"{_READERS[fmt]}({source}, {args})"
+
+    @staticmethod
+    def _to_parquet(cur, table_name: str, reader: str, append: bool) -> str:
+        """Write the data as a Parquet part file of the table's directory; returns the directory."""
+        # Never `.` or `..`: leading dots are dropped, and the result must stay below parquet_dir
+        name = re.sub(r"[^\w.-]+", "_", table_name).lstrip(".") or "_"
+        root = os.path.realpath(settings.parquet_dir)
+        directory = os.path.realpath(os.path.join(root, name))
+        if os.path.dirname(directory) != root:
+            raise ValueError(f"Invalid table name '{table_name}'")
+        if not append and os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory, exist_ok=True)
+        part = os.path.join(directory, f"part-{int(time.time() * 1000)}-{uuid4().hex[:6]}.parquet")
+        tmp = part + ".tmp"
+        cur.execute(f"COPY (SELECT * FROM {reader}) TO {literal(tmp)} (FORMAT parquet, COMPRESSION zstd)")
+        # Readers of the directory never see a half-written part
+        os.replace(tmp, part)
+        return directory
+
+
+ingest_service = IngestService()
@@ -0,0 +1,361 @@
+"""
+Out-of-process Python kernels, one per session.
+
+Each kernel is a worker process forked from a fork server that already has
+pandas/numpy/duckdb imported, so a new kernel is ready in milliseconds. The API
+process talks to it over a pipe: cells run truly in parallel across sessions,
+stdout is per-process, and a runaway cell can be interrupted (SIGINT) or the
+kernel killed without touching the API workers.
+"""
+import io
+import multiprocessing as mp
+import os
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from app.config import settings
+from app.services.resource_governor import process_rss
+
+
+# Seconds a kernel gets to honour SIGINT before it is killed
+KERNEL_INTERRUPT_GRACE = 5.0
+
+
+class KernelError(RuntimeError):
+    """The kernel could not run the request (timeout, crash, pool full)."""
+
+
+# --------------------------------------------------------------------------
+# Kernel side (runs in the worker process)
+# --------------------------------------------------------------------------
+
+# Metadata of the DataFrames seen by the last scan, by name: (fingerprint, metadata)
+_known_variables: Dict[str, Any] = {}
+
+
+def _variable_fingerprint(val: pd.DataFrame):
+    # O(1): a new object, new column Index or new shape means the metadata changed
+    return (id(val), id(val.columns), val.shape)
+
+
+def _variable_metadata(name: str, val: pd.DataFrame) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "type": "DataFrame",
+        "rows": len(val),
+        "cols": len(val.columns),
+        "columns": [str(c) for c in val.columns],
+    }
+
+
+def _scan_variables(scope: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Incrementally scans the scope for Pandas DataFrames. Metadata is only
+    rebuilt for frames whose fingerprint changed since the previous scan;
+    returns the delta as {"added": [...], "changed": [...], "removed": [names]}.
+    """
+    delta = {"added": [], "changed": [], "removed": []}
+    seen = set()
+    for name, val in scope.items():
+        if name.startswith("_"): continue # Skip internal vars
+
+        # Identify DataFrames
+        if isinstance(val, pd.DataFrame):
+            seen.add(name)
+            fingerprint = _variable_fingerprint(val)
+            known = _known_variables.get(name)
+            if known is not None and known[0] == fingerprint:
+                continue
+            meta = _variable_metadata(name, val)
+            _known_variables[name] = (fingerprint, meta)
+            delta["changed" if known is not None else "added"].append(meta)
+
+    for name in list(_known_variables):
+        if name not in seen:
+            del _known_variables[name]
+            delta["removed"].append(name)
+    return delta
+
+
+def _cmd_exec(scope: Dict[str, Any], code: str) -> Dict[str, Any]:
+    old_stdout = sys.stdout
+    redirected_output = sys.stdout = io.StringIO()
+
+    error_msg = None
+    status = "success"
+
+    try:
+        # Execute code in the session's namespace
+        exec(code, scope)
+    except KeyboardInterrupt:
+        error_msg = "Execution interrupted"
+        status = "error"
+    except Exception as e:
+        error_msg = str(e)
+        status = "error"
+    finally:
+        sys.stdout = old_stdout
+
+    delta = _scan_variables(scope)
+    return {
+        "status": status,
+        "stdout": redirected_output.getvalue(),
+        "error": error_msg,
+        "variables": [
+            dict(meta, change=change) for change in ("added", "changed") for meta in delta[change]
+        ],
+        "removed": delta["removed"],
+    }
+
+
+def _cmd_preview(scope: Dict[str, Any], name: str, offset: int, limit: int) -> Dict[str, Any]:
+    val = _cmd_get_frame(scope, name)
+    page = val.iloc[offset:offset + limit]
+    return dict(page.to_dict(orient="split"), name=name, offset=offset, total_rows=len(val))
+
+
+def _cmd_get_frame(scope: Dict[str, Any], name: str) -> pd.DataFrame:
+    val = scope.get(name)
+    if not isinstance(val, pd.DataFrame):
+        raise ValueError(f"Variable '{name}' is not a DataFrame")
+    return val
+
+
+def _cmd_fingerprints(scope: Dict[str, Any], names: List[str]) -> Dict[str, Any]:
+    """
+    Fingerprints of DataFrame variables, to detect reassignment and structural
+    edits of published frames after every cell. Cheap by design (identity,
+    columns, shape and dtypes, no pass over the values): an in-place edit of
+    values is picked up by publishing the variable again.
+    """
+    out = {}
+    for name in names:
+        val = scope.get(name)
+        if isinstance(val, pd.DataFrame):
+            out[name] = (_variable_fingerprint(val), tuple(str(dtype) for dtype in val.dtypes))
+    return out
+
+
+_COMMANDS = {
+    "exec": _cmd_exec,
+    "get_frame": _cmd_get_frame,
+    "fingerprints": _cmd_fingerprints,
+    "preview": _cmd_preview,
+}
+
+
+def _kernel_main(conn, memory_limit_mb: int):
+    if memory_limit_mb:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    scope: Dict[str, Any] = {}
+    while True:
+        try:
+            cmd, payload = conn.recv()
+        except KeyboardInterrupt:
+            continue # Interrupt arrived between cells
+        except EOFError:
+            return
+        try:
+            conn.send(("ok", _COMMANDS[cmd](scope, **payload)))
+        except KeyboardInterrupt:
+            conn.send(("error", "Execution interrupted"))
+        except BaseException as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+# --------------------------------------------------------------------------
+# API side
+# --------------------------------------------------------------------------
+
+def _context():
+    if "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        # Imported once in the fork server, inherited by every kernel
+        ctx.set_forkserver_preload(["pandas", "numpy", "duckdb", __name__])
+        return ctx
+    return mp.get_context("spawn")
+
+
+class Kernel:
+    def __init__(self, ctx, memory_limit_mb: int):
+        self._conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_kernel_main, args=(child_conn, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # One request at a time per kernel
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        # Callers holding the kernel (guarded by the pool lock); never evicted while > 0
+        self.in_use = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def call(self, cmd: str, timeout: Optional[float] = None, **payload) -> Any:
+        timed_out = False
+        with self.lock:
+            try:
+                self._conn.send((cmd, payload))
+                if not self._conn.poll(timeout):
+                    # Ask nicely, then kill: the session's state is lost in that case
+                    timed_out = True
+                    self.interrupt()
+                    if not self._conn.poll(KERNEL_INTERRUPT_GRACE):
+                        self.shutdown()
+                        raise KernelError(f"Execution timed out after {timeout}s; kernel restarted")
+                status, result = self._conn.recv()
+            except (EOFError, OSError):
+                self.shutdown()
+                raise KernelError("Kernel died (out of memory?); session state was lost")
+            finally:
+                self.last_used = time.monotonic()
+        if timed_out:
+            if status == "error" or not isinstance(result, dict):
+                raise KernelError(f"Execution timed out after {timeout}s")
+            result["error"] = f"Execution timed out after {timeout}s"
+        if status == "error":
+            raise KernelError(result)
+        return result
+
+    def interrupt(self):
+        if self.alive:
+            os.kill(self.process.pid, signal.SIGINT)
+
+    def shutdown(self):
+        if self.alive:
+            self.process.kill()
+        self.process.join(timeout=1)
+        self._conn.close()
+
+
+class KernelPool:
+    """
+    Routes sessions to their kernel. Bounded by `max_kernels`; idle kernels
+    are shut down after `idle_timeout`, and one spare kernel is kept warm so
+    a new session does not wait for a process start.
+    """
+
+    def __init__(self, max_kernels: int, idle_timeout: float, memory_limit_mb: int,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.max_kernels = max_kernels
+        self.idle_timeout = idle_timeout
+        self.memory_limit_mb = memory_limit_mb
+        # Called with the session_id whenever a kernel (and the session's variables) goes away
+        self.on_evict = on_evict
+        self._ctx = None
+        self._kernels: "OrderedDict[str, Kernel]" = OrderedDict()
+        self._spare: Optional[Kernel] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, session_id: str, create: bool = True) -> Iterator[Optional[Kernel]]:
+        """
+        Borrow the session's kernel for the duration of the block; yields None
+        if it has none and `create` is False. Eviction leaves it alone until then.
+        """
+        kernel = self._checkout(session_id, create)
+        if kernel is None:
+            yield None
+            return
+        try:
+            yield kernel
+        finally:
+            with self._lock:
+                kernel.in_use -= 1
+                kernel.last_used = time.monotonic()
+
+    def _checkout(self, session_id: str, create: bool) -> Optional[Kernel]:
+        with self._lock:
+            self._evict_idle()
+            kernel = self._kernels.get(session_id)
+            if kernel is not None and not kernel.alive:
+                self._discard(session_id)
+                kernel = None
+            if kernel is None and create:
+                if len(self._kernels) >= self.max_kernels:
+                    self._evict_lru()
+                kernel = self._take_spare()
+                self._kernels[session_id] = kernel
+            if kernel is not None:
+                self._kernels.move_to_end(session_id)
+                kernel.in_use += 1
+                kernel.last_used = time.monotonic()
+            return kernel
+
+    def _take_spare(self) -> Kernel:
+        kernel, self._spare = self._spare, None
+        if kernel is None or not kernel.alive:
+            kernel = self._start()
+        threading.Thread(target=self._warm_spare, daemon=True).start()
+        return kernel
+
+    def _warm_spare(self):
+        kernel = self._start()
+        with self._lock:
+            if self._spare is None:
+                self._spare = kernel
+                return
+        kernel.shutdown()
+
+    def _start(self) -> Kernel:
+        if self._ctx is None:
+            self._ctx = _context()
+        return Kernel(self._ctx, self.memory_limit_mb)
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.idle_timeout
+        for session_id, kernel in list(self._kernels.items()):
+            if kernel.last_used < deadline and not kernel.in_use:
+                self._discard(session_id)
+
+    def _evict_lru(self):
+        for session_id, kernel in self._kernels.items():
+            if not kernel.in_use:
+                self._discard(session_id)
+                return
+        raise KernelError(f"All {self.max_kernels} Python kernels are busy, retry shortly")
+
+    def _discard(self, session_id: str):
+        self._kernels.pop(session_id).shutdown()
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+    def shutdown(self, session_id: str):
+        with self._lock:
+            kernel = self._kernels.pop(session_id, None)
+        if kernel is not None:
+            kernel.shutdown()
+
+    def memory(self) -> Dict[str, int]:
+        """Resident memory of each session's kernel process, in bytes."""
+        with self._lock:
+            kernels = list(self._kernels.items())
+        return {session_id: process_rss(kernel.process.pid) for session_id, kernel in kernels}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kernels": len(self._kernels),
+                "busy": sum(1 for k in self._kernels.values() if k.in_use),
+                "max_kernels": self.max_kernels,
+                "rss_bytes": sum(process_rss(k.process.pid) for k in self._kernels.values()),
+            }
+
+
+kernel_pool = KernelPool(
+    max_kernels=settings.kernel_pool_size,
+    idle_timeout=settings.kernel_idle_timeout,
+    memory_limit_mb=settings.kernel_memory_mb,
+)
@@ -0,0 +1,141 @@
+from typing import List, Dict, Any, Optional, Tuple
+from app.schemas.analysis import ProfileRequest, ProfileResponse, ColumnProfile
+from app.services.execution_service import execution_service, is_numeric_type, quote_ident, quote_table
+from app.services.result_cache import result_cache, table_versions
+from app.services import tracing
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+class ProfileService:
+    """
+    Column profiling for a whole table in two vectorized scans:
+
+    1. One SELECT with count/nulls/distinct/min/max (+ mean/std/quantiles for
+       numeric columns) for every column side by side.
+    2. One SELECT with a `histogram()` aggregate per numeric column over
+       fixed-width bins derived from the min/max of pass 1.
+    """
+
+    def profile(self, req: ProfileRequest) -> ProfileResponse:
+        execution_service.refresh_file_source(req.table_name)
+
+        cache_key = ("profile", req.model_dump_json(), table_versions.snapshot([req.table_name.split(".")[-1]]))
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            tracing.count("result_cache_hits", 1)
+            return cached
+
+        execution_service.governor.admit()
+        with tracing.span("profile"):
+            response = self._profile(req)
+        result_cache.put(cache_key, response, len(response.model_dump_json()))
+        return response
+
+    def _profile(self, req: ProfileRequest) -> ProfileResponse:
+        with execution_service.session(req.session_id) as conn:
+            if not execution_service.table_exists(conn, req.table_name.split(".")[-1]):
+                raise ValueError(f"Table '{req.table_name}' not found")
+            table = quote_table(req.table_name)
+
+            schema = [(row[0], row[1]) for row in conn.execute(f"DESCRIBE {table}").fetchall()]
+            if req.columns:
+                wanted = set(req.columns)
+                missing = wanted - {name for name, _ in schema}
+                if missing:
+                    raise ValueError(f"Unknown columns: {', '.join(sorted(missing))}")
+                schema = [(name, dtype) for name, dtype in schema if name in wanted]
+
+            row_count, stats = self._scan_stats(conn, table, schema)
+            histograms = self._scan_histograms(conn, table, schema, stats, max(req.bins, 1))
+
+        columns = []
+        for name, dtype in schema:
+            s = stats[name]
+            columns.append(ColumnProfile(
+                name=name,
+                type=dtype,
+                count=s["count"],
+                nulls=row_count - s["count"],
+                null_pct=round((row_count - s["count"]) / row_count * 100, 2) if row_count else 0.0,
+                distinct=s["distinct"],
+                mean=s.get("mean"),
+                std=s.get("std"),
+                min=s["min"],
+                max=s["max"],
+                quantiles=s.get("quantiles", {}),
+                histogram=histograms.get(name),
+            ))
+        return ProfileResponse(table_name=req.table_name, row_count=row_count, columns=columns)
+
+    @staticmethod
+    def _scan_stats(conn, table: str, schema: List[Tuple[str, str]]) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+        """Pass 1: every per-column aggregate in a single SELECT."""
+        exprs = ["COUNT(*)"]
+        for name, dtype in schema:
+            col = quote_ident(name)
+            exprs += [f"COUNT({col})", f"approx_count_distinct({col})"]
+            if is_numeric_type(dtype):
+                exprs += [
+                    f"MIN({col})::DOUBLE",
+                    f"MAX({col})::DOUBLE",
+                    f"AVG({col})::DOUBLE",
+                    f"STDDEV_SAMP({col})::DOUBLE",
+                    f"approx_quantile({col}, {list(QUANTILES)})::DOUBLE[]",
+                ]
+            else:
+                exprs += [f"MIN({col})::VARCHAR", f"MAX({col})::VARCHAR"]
+
+        row = conn.execute(f"SELECT {', '.join(exprs)} FROM {table}").fetchone()
+
+        values = iter(row[1:])
+        stats = {}
+        for name, dtype in schema:
+            s = {"count": next(values), "distinct": next(values), "min": next(values), "max": next(values)}
+            # The HyperLogLog estimate can overshoot on small inputs
+            s["distinct"] = min(s["distinct"], s["count"])
+            if is_numeric_type(dtype):
+                s["mean"] = next(values)
+                s["std"] = next(values)
+                qs = next(values) or [None] * len(QUANTILES)
+                s["quantiles"] = {f"p{int(q * 100)}": v for q, v in zip(QUANTILES, qs)}
+            stats[name] = s
+        return row[0], stats
+
+    @staticmethod
+    def _scan_histograms(conn, table: str, schema: List[Tuple[str, str]],
+                         stats: Dict[str, Dict[str, Any]], bins: int) -> Dict[str, Dict[str, List[Any]]]:
+        """Pass 2: fixed-width histograms for all numeric columns in a single SELECT."""
+        targets = []
+        exprs = []
+        params: List[Any] = []
+        for name, dtype in schema:
+            s = stats[name]
+            if not is_numeric_type(dtype) or s["min"] is None:
+                continue
+            lo, hi = s["min"], s["max"]
+            n_bins = bins if hi > lo else 1
+            step = (hi - lo) / n_bins if hi > lo else 1.0
+            col = quote_ident(name)
+            exprs.append(
+                f"histogram(LEAST(FLOOR(({col}::DOUBLE - ?) / ?)::INTEGER, ?)) FILTER (WHERE {col} IS NOT NULL)"
+            )
+            params += [lo, step, n_bins - 1]
+            targets.append((name, lo, step, n_bins))
+
+        if not targets:
+            return {}
+
+        row = conn.execute(f"SELECT {', '.join(exprs)} FROM {table}", params).fetchone()
+
+        histograms = {}
+        for (name, lo, step, n_bins), counts_by_bin in zip(targets, row):
+            counts_by_bin = counts_by_bin or {}
+            histograms[name] = {
+                "edges": [lo + i * step for i in range(n_bins + 1)],
+                "counts": [counts_by_bin.get(i, 0) for i in range(n_bins)],
+            }
+        return histograms
+
+
+profile_service = ProfileService()
@@ -1,105 +1,138 @@
 
-import pandas as pd
-import io
 from typing import Dict, Any, List, Optional
-from uuid import uuid4
+from app.config import settings
+from app.services.execution_service import execution_service
+from app.services.kernel_pool import kernel_pool, Kernel, KernelError
+from app.services import tracing
 
-# Singleton storage for active sessions (MVP: In-memory)
-# Structure: { session_id: { "globals": {...}, "history": [...] } }
+# Singleton storage for active sessions (MVP: In-memory). The session's Python
+# globals live in its kernel process (see kernel_pool); only API-side
+# bookkeeping is kept here, and dropped when the pool evicts the kernel.
+# Structure: { session_id: { "history": [...], "variables": {name: {...}}, "published": {table: {...}} } }
 _sessions: Dict[str, Dict[str, Any]] = {}
 
 class PythonSessionService:
     def __init__(self):
-        # In a real app, this might connect to Jupyter Kernels or Ray
-        pass
+        # Cells run in per-session worker processes managed by `kernel_pool`
+        self.kernels = kernel_pool
+        self.kernels.on_evict = self._forget_session
+
+    @staticmethod
+    def _forget_session(session_id: str):
+        # The variables are gone with the kernel: published tables keep serving
+        # their last version (spilled to disk once idle, see resource_governor)
+        _sessions.pop(session_id, None)
 
     def _get_session(self, session_id: str) -> Dict[str, Any]:
         if session_id not in _sessions:
             # Initialize new session with some basics
             _sessions[session_id] = {
-                "globals": {}, 
-                "history": []
+                "history": [],
+                # name -> DataFrame metadata, kept up to date from the exec deltas
+                "variables": {},
+                # table_name -> {"var": var_name, "fingerprint": ..., "materialize": bool}
+                "published": {}
             }
         return _sessions[session_id]
 
     def execute_script(self, session_id: str, code: str) -> Dict[str, Any]:
         session = self._get_session(session_id)
-        local_scope = session["globals"]
-        
-        # Capture stdout
-        import sys
-        old_stdout = sys.stdout
-        redirected_output = sys.stdout = io.StringIO()
-
-        error_msg = None
-        status = "success"
-
-        try:
-            # Execute code in the session's namespace
-            exec(code, local_scope)
-        except Exception as e:
-            error_msg = str(e)
-            status = "error"
-        finally:
-            sys.stdout = old_stdout
-
-        output = redirected_output.getvalue()
-        
-        # Determine variables created/updated
-        variables = self._scan_variables(local_scope)
+        with self.kernels.acquire(session_id) as kernel:
+            with tracing.span("kernel_exec"):
+                result = kernel.call("exec", timeout=settings.kernel_timeout, code=code)
+            session["history"].append(code)
+            for meta in result["variables"]:
+                session["variables"][meta["name"]] = {k: v for k, v in meta.items() if k != "change"}
+            for name in result["removed"]:
+                session["variables"].pop(name, None)
 
-        return {
-            "status": status,
-            "stdout": output,
-            "error": error_msg,
-            "variables": variables
-        }
+            self._refresh_published(session_id, session, kernel)
+        return result
+
+    def interrupt(self, session_id: str) -> bool:
+        """Interrupt the cell currently running in the session's kernel."""
+        with self.kernels.acquire(session_id, create=False) as kernel:
+            if kernel is None:
+                return False
+            kernel.interrupt()
+        return True
 
-    def _scan_variables(self, scope: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Scans the scope for Pandas DataFrames and returns their metadata."""
-        vars_list = []
-        for name, val in scope.items():
-            if name.startswith("_"): continue # Skip internal vars
-            
-            # Identify DataFrames
-            if isinstance(val, pd.DataFrame):
-                vars_list.append({
-                    "name": name,
-                    "type": "DataFrame",
-                    "rows": len(val),
-                    "cols": len(val.columns),
-                    "columns": list(val.columns),
-                    "preview": val.head(5).to_dict(orient="split") # Optional: lightweight preview
-                })
-        return vars_list
+    def restart(self, session_id: str):
+        """Discard the session's kernel and its variables."""
+        self.kernels.shutdown(session_id)
+        _sessions.pop(session_id, None)
 
     def get_variables(self, session_id: str) -> List[Dict[str, Any]]:
-        session = self._get_session(session_id)
-        return self._scan_variables(session["globals"])
+        """
+        DataFrame variables as of the last finished cell. Served from the API-side
+        copy of the exec deltas, so it answers while a cell is still running.
+        """
+        with self.kernels.acquire(session_id, create=False) as kernel:
+            if kernel is None:
+                return []
+        return list(_sessions.get(session_id, {}).get("variables", {}).values())
 
-    def publish_variable(self, session_id: str, var_name: str, table_name: Optional[str] = None):
+    def preview_variable(self, session_id: str, var_name: str, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """One page of a DataFrame variable, computed on demand in the kernel."""
+        with self.kernels.acquire(session_id, create=False) as kernel:
+            if kernel is None:
+                raise ValueError(f"Variable '{var_name}' not found in session")
+            try:
+                return kernel.call("preview", timeout=settings.kernel_timeout,
+                                   name=var_name, offset=max(offset, 0), limit=max(limit, 0))
+            except KernelError as e:
+                raise ValueError(str(e))
+
+    def publish_variable(self, session_id: str, var_name: str, table_name: Optional[str] = None,
+                         materialize: bool = False):
         """
-        In a real scenario, this would register the dataframe to DuckDB.
-        For MVP, we will mock the 'Registration' by ensuring it's available 
-        for the ExecutionService to find (or just confirming existence).
+        Register a DataFrame variable with the SQL engine under `table_name`.
+        The frame is shipped once from the kernel process; SQL then reads it in
+        place (no further copy) or, with `materialize`, from a snapshot table.
+        Either way the table follows the variable when a later cell reassigns
+        it or changes its columns, shape or dtypes.
         """
         session = self._get_session(session_id)
-        if var_name not in session["globals"]:
-            raise ValueError(f"Variable '{var_name}' not found in session")
-        
-        df = session["globals"][var_name]
-        
-        if not isinstance(df, pd.DataFrame):
-            raise ValueError(f"Variable '{var_name}' is not a DataFrame")
+        with self.kernels.acquire(session_id, create=False) as kernel:
+            if kernel is None:
+                raise ValueError(f"Variable '{var_name}' not found in session")
+
+            fingerprints = kernel.call("fingerprints", timeout=settings.kernel_timeout, names=[var_name])
+            if var_name not in fingerprints:
+                raise ValueError(f"Variable '{var_name}' not found in session or is not a DataFrame")
+            with tracing.span("kernel_transfer"):
+                df = kernel.call("get_frame", timeout=settings.kernel_timeout, name=var_name)
+        tracing.count("rows", len(df))
 
         target_name = table_name or var_name
-        
-        # Here we would normally do: duckdb_conn.register(target_name, df)
-        # For now, we return success metadata so Frontend can 'show' it in the Workspace/Published list.
+        with tracing.span("publish"):
+            mode = execution_service.publish_frame(session_id, target_name, df, materialize=materialize)
+        session["published"][target_name] = {
+            "var": var_name,
+            "fingerprint": fingerprints[var_name],
+            "materialize": materialize,
+        }
+
         return {
             "published_name": target_name,
+            "mode": mode,
             "rows": len(df),
             "cols": len(df.columns)
         }
 
+    def _refresh_published(self, session_id: str, session: Dict[str, Any], kernel: Kernel):
+        """Re-publish tables whose variable was reassigned or modified by the last cell."""
+        if not session["published"]:
+            return
+        names = sorted({entry["var"] for entry in session["published"].values()})
+        fingerprints = kernel.call("fingerprints", timeout=settings.kernel_timeout, names=names)
+
+        for target_name, entry in session["published"].items():
+            fingerprint = fingerprints.get(entry["var"])
+            if fingerprint is None or fingerprint == entry["fingerprint"]:
+                continue # Unchanged, or deleted: keep serving the last published version
+            df = kernel.call("get_frame", timeout=settings.kernel_timeout, name=entry["var"])
+            execution_service.publish_frame(session_id, target_name, df, materialize=entry["materialize"])
+            entry["fingerprint"] = fingerprint
+
 python_service = PythonSessionService()
@@ -0,0 +1,152 @@
+"""
+Validated, prepared execution of templated SQL.
+
+Templates are SQL text with identifiers already validated and quoted and
+values left as `$n` placeholders. Each connection keeps its own LRU of
+PREPAREd statements keyed by that text, so running the same chart again
+only binds new values (EXECUTE) and skips parsing and planning. DuckDB's
+EXECUTE does not accept bound parameters, so values are rendered as typed
+literals by `literal`, which only accepts plain scalar types.
+"""
+import math
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Sequence
+
+import duckdb
+
+from app.services.result_cache import table_versions
+from app.services.sql_utils import is_numeric_type, quote_ident, quote_table
+
+# Prepared statements kept per connection
+MAX_PREPARED_STATEMENTS = 128
+
+
+def literal(value: Any) -> str:
+    """Render a bound value as a typed SQL literal for EXECUTE."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return f"{value}::BIGINT" if -2 ** 63 <= value < 2 ** 63 else f"{value}::HUGEINT"
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "'nan'::DOUBLE"
+        if math.isinf(value):
+            return "'inf'::DOUBLE" if value > 0 else "'-inf'::DOUBLE"
+        return f"{value!r}::DOUBLE"
+    if isinstance(value, Decimal):
+        return f"{float(value)!r}::DOUBLE"
+    if isinstance(value, datetime):
+        return f"'{value.isoformat()}'::TIMESTAMP"
+    if isinstance(value, date):
+        return f"'{value.isoformat()}'::DATE"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise TypeError(f"Cannot bind a {type(value).__name__} value")
+
+
+class QueryBuilder:
+    def __init__(self, max_statements: int = MAX_PREPARED_STATEMENTS):
+        self.max_statements = max_statements
+        # connection -> OrderedDict(sql text -> statement name)
+        self._prepared: "weakref.WeakKeyDictionary[Any, OrderedDict]" = weakref.WeakKeyDictionary()
+        # connection -> {table: (version, {column name: type})}; sessions see different TEMP views
+        self._columns: "weakref.WeakKeyDictionary[Any, Dict[str, tuple]]" = weakref.WeakKeyDictionary()
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.prepares = 0
+        self.executions = 0
+
+    def columns(self, conn, table_name: str) -> Dict[str, str]:
+        """Column name -> type of a table, cached until the table changes."""
+        version = table_versions.snapshot([table_name.split(".")[-1]])
+        with self._lock:
+            cached = self._columns.setdefault(conn, {}).get(table_name.lower())
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        columns = {row[0]: row[1] for row in conn.execute(f"DESCRIBE {quote_table(table_name)}").fetchall()}
+        with self._lock:
+            self._columns[conn][table_name.lower()] = (version, columns)
+        return columns
+
+    def forget(self, conn, table_name: str):
+        """Drop the cached columns of a table replaced outside the API (e.g. a scratch TEMP table)."""
+        with self._lock:
+            self._columns.get(conn, {}).pop(table_name.lower(), None)
+
+    def column(self, conn, table_name: str, column: str) -> str:
+        """Validate `column` against the table's catalog entry and return it quoted."""
+        if column not in self.columns(conn, table_name):
+            raise ValueError(f"Column '{column}' not found in '{table_name}'")
+        return quote_ident(column)
+
+    def numeric_column(self, conn, table_name: str, column: str) -> str:
+        """Like `column`, for analyses that compute on numbers: the column must also be numeric."""
+        col = self.column(conn, table_name, column)
+        if not is_numeric_type(self.columns(conn, table_name)[column]):
+            raise ValueError(f"Column '{column}' is not numeric")
+        return col
+
+    def execute(self, conn, sql: str, params: Optional[Sequence[Any]] = None):
+        """Run a `$n`-parameterized template on `conn` through its prepared statement; returns `conn`."""
+        args = ", ".join(literal(p) for p in params or ())
+        name, cached = self._statement(conn, sql)
+        self.executions += 1
+        try:
+            return conn.execute(f"EXECUTE {name}({args})" if params else f"EXECUTE {name}")
+        except duckdb.Error:
+            if not cached:
+                raise
+            # The statement may predate a change to the tables it reads: prepare it once more
+            self._discard(conn, sql)
+            name, _ = self._statement(conn, sql)
+            return conn.execute(f"EXECUTE {name}({args})" if params else f"EXECUTE {name}")
+
+    def _statement(self, conn, sql: str):
+        """(statement name, whether it was already prepared)."""
+        with self._lock:
+            statements = self._prepared.setdefault(conn, OrderedDict())
+            name = statements.get(sql)
+            if name is not None:
+                statements.move_to_end(sql)
+                return name, True
+            self._counter += 1
+            name = f"__ds_stmt_{self._counter}"
+
+        conn.execute(f"PREPARE {name} AS {sql}")
+        self.prepares += 1
+        with self._lock:
+            statements[sql] = name
+            while len(statements) > self.max_statements:
+                _, evicted = statements.popitem(last=False)
+                try:
+                    conn.execute(f"DEALLOCATE {evicted}")
+                except duckdb.Error:
+                    pass
+        return name, False
+
+    def _discard(self, conn, sql: str):
+        with self._lock:
+            name = self._prepared.get(conn, {}).pop(sql, None)
+        if name is not None:
+            try:
+                conn.execute(f"DEALLOCATE {name}")
+            except duckdb.Error:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connections": len(self._prepared),
+                "statements": sum(len(s) for s in self._prepared.values()),
+                "prepares": self.prepares,
+                "executions": self.executions,
+            }
+
+
+query_builder = QueryBuilder()
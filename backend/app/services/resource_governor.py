@@ -0,0 +1,312 @@
+"""
+Memory budget of the API process.
+
+The process holds the DuckDB buffer pool, every session's published
+DataFrames and the result cache at once. The governor keeps their sum within
+`memory_budget_mb`:
+
+* DuckDB gets a `memory_limit` (its share of the budget) and a per-process
+  `temp_directory`, so large joins, sorts and aggregates spill to disk
+  instead of growing without bound;
+* published frames are accounted per session. Frames of idle sessions, of a
+  session over `session_memory_mb`, or the least recently used ones when the
+  frames' share is exhausted are spilled to Parquet by the `spill` callback;
+  the session then reads them back lazily through a `read_parquet` view;
+* `admit` is called before a query runs and raises `MemoryBudgetExceeded`
+  (503 + Retry-After, see main.py) when the process is still over budget
+  after spilling what it could.
+"""
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+from app.config import settings
+from app.services.result_cache import result_cache
+
+MB = 1 << 20
+# Values sampled per object column to estimate the size of its Python objects
+OBJECT_SAMPLE_SIZE = 1000
+# Seconds a client whose query was refused should wait before retrying
+RETRY_AFTER = 5
+# Floor of DuckDB's share when the other shares are configured larger than the budget
+MIN_DUCKDB_MEMORY = 256 * MB
+# Admission reuses DuckDB's memory reading for this long (reading it costs ~0.5 ms)
+USAGE_SAMPLE_INTERVAL = 0.1
+
+_SIZE = re.compile(r"^\s*([\d.]+)\s*([KMGT]?i?B)?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "B": 1, "K": 1000, "M": 1000 ** 2, "G": 1000 ** 3, "T": 1000 ** 4}
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """The process is over its memory budget, or a query needed more memory than DuckDB may use."""
+
+    def __init__(self, message: str, retry_after: int = RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def physical_memory() -> int:
+    """Memory available to the process: physical RAM, or the cgroup limit if lower."""
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        total = 8 * 1024 * MB
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                limit = f.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit():
+            total = min(total, int(limit))
+    return total
+
+
+def parse_size(text: str) -> int:
+    """Bytes of a DuckDB size setting such as '3.1 GiB' or '500MB' (0 if unparseable)."""
+    match = _SIZE.match(text or "")
+    if match is None:
+        return 0
+    unit = (match.group(2) or "").upper()
+    base = 1024 ** ("KMGT".index(unit[0]) + 1) if "I" in unit else _SIZE_UNITS[unit[:1]]
+    return int(float(match.group(1)) * base)
+
+
+def process_rss(pid: Optional[int] = None) -> int:
+    """Resident set size of a process in bytes (0 where /proc is unavailable)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    """Estimated memory of a DataFrame; object columns are sampled instead of walked."""
+    nbytes = int(df.memory_usage(index=True, deep=False).sum())
+    for i, dtype in enumerate(df.dtypes):
+        if dtype == object and len(df):
+            column = df.iloc[:, i]
+            sample = column.iloc[::max(len(column) // OBJECT_SAMPLE_SIZE, 1)]
+            nbytes += int(sum(sys.getsizeof(v) for v in sample) / len(sample) * len(column))
+    return nbytes
+
+
+class ResourceGovernor:
+    """
+    Keeps the process within `budget_mb`. `spill(session_id, table_name)` moves
+    a published frame to disk and returns its size there, or None if the
+    session is busy and the frame has to stay in memory for now.
+    """
+
+    def __init__(self, budget_mb: int, published_mb: int, session_mb: int, idle_timeout: float,
+                 spill: Callable[[str, str], Optional[int]]):
+        self.budget = (budget_mb * MB) or physical_memory() * 3 // 4
+        self.published_budget = (published_mb * MB) or self.budget // 4
+        self.session_budget = session_mb * MB
+        self.idle_timeout = idle_timeout
+        self.spill = spill
+        self.spill_dir = os.path.join(settings.spill_dir, str(os.getpid()))
+        self.frames_dir = os.path.join(self.spill_dir, "frames")
+        self._db = None
+        # DuckDB's memory_limit in bytes, as set by `configure`
+        self.duckdb_limit = 0
+        # session_id -> {table name: {"bytes", "published_at", "disk_bytes" (once spilled)}}
+        self._frames: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._last_used: Dict[str, float] = {}
+        self._sampled = (0.0, 0) # (monotonic time, DuckDB memory bytes)
+        self._lock = threading.Lock()
+        # One thread spills at a time; the others go on with the memory they have
+        self._spill_lock = threading.Lock()
+        self.spills = 0
+        self.rejected = 0
+
+    def duckdb_share(self) -> int:
+        """DuckDB's share of the budget: what the frames and the result cache do not get."""
+        return max(self.budget - self.published_budget - result_cache.max_bytes, MIN_DUCKDB_MEMORY)
+
+    def configure(self, conn):
+        """Apply the memory limit and spill directory to the database behind `conn`."""
+        self._db = conn
+        self._remove_stale_spills()
+        os.makedirs(self.frames_dir, exist_ok=True)
+        # Before the first query: DuckDB cannot switch its temp directory once used
+        conn.execute(f"SET temp_directory = '{os.path.join(self.spill_dir, 'duckdb')}'")
+        if settings.spill_max_size:
+            conn.execute(f"SET max_temp_directory_size = '{settings.spill_max_size}'")
+        if not settings.duckdb_memory_limit:
+            conn.execute(f"SET memory_limit = '{self.duckdb_share() // MB}MB'")
+        limit = conn.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+        self.duckdb_limit = parse_size(limit)
+        print(f"Memory budget {self.budget // MB} MB: DuckDB {limit}, "
+              f"published frames {self.published_budget // MB} MB, spilling to {self.spill_dir}")
+
+    def close(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    @staticmethod
+    def _remove_stale_spills():
+        """Spill directories are per process: drop those left behind by processes that are gone."""
+        try:
+            names = os.listdir(settings.spill_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.isdigit():
+                continue
+            try:
+                os.kill(int(name), 0)
+            except ProcessLookupError:
+                shutil.rmtree(os.path.join(settings.spill_dir, name), ignore_errors=True)
+            except OSError:
+                pass # Alive, owned by another user
+
+    # ------------------------------------------------------------------
+    # Accounting
+    # ------------------------------------------------------------------
+
+    def track(self, session_id: str, table_name: str, nbytes: int):
+        """A frame was published (or republished) in memory."""
+        with self._lock:
+            self._frames.setdefault(session_id, {})[table_name] = {"bytes": nbytes, "published_at": time.monotonic()}
+            self._last_used[session_id] = time.monotonic()
+
+    def forget(self, session_id: str, table_name: str):
+        with self._lock:
+            frames = self._frames.get(session_id, {})
+            frames.pop(table_name, None)
+            if not frames:
+                self._frames.pop(session_id, None)
+                self._last_used.pop(session_id, None)
+
+    def touch(self, session_id: str):
+        # Only sessions with frames are tracked, everything else has nothing to spill
+        with self._lock:
+            if session_id in self._frames:
+                self._last_used[session_id] = time.monotonic()
+
+    def duckdb_usage(self) -> Dict[str, int]:
+        if self._db is None:
+            return {"memory": 0, "temporary": 0}
+        with self._db.cursor() as cur:
+            memory, temporary = cur.execute(
+                "SELECT COALESCE(SUM(memory_usage_bytes), 0), COALESCE(SUM(temporary_storage_bytes), 0) "
+                "FROM duckdb_memory()"
+            ).fetchone()
+        return {"memory": int(memory), "temporary": int(temporary)}
+
+    def _in_memory(self) -> int:
+        return sum(f["bytes"] for frames in self._frames.values() for f in frames.values() if "disk_bytes" not in f)
+
+    # ------------------------------------------------------------------
+    # Admission and spilling
+    # ------------------------------------------------------------------
+
+    def admit(self):
+        """Make room if needed before a query runs; raises MemoryBudgetExceeded if there is none."""
+        sampled_at, duckdb_memory = self._sampled
+        if time.monotonic() - sampled_at > USAGE_SAMPLE_INTERVAL:
+            duckdb_memory = self.duckdb_usage()["memory"]
+            self._sampled = (time.monotonic(), duckdb_memory)
+        cache = result_cache.stats()["bytes"]
+        self.rebalance(min(self.published_budget, max(self.budget - duckdb_memory - cache, 0)))
+        with self._lock:
+            used = duckdb_memory + cache + self._in_memory()
+        if used > self.budget:
+            self.rejected += 1
+            raise MemoryBudgetExceeded(
+                f"The server is over its memory budget ({used // MB} of {self.budget // MB} MB in use), retry shortly"
+            )
+
+    def rebalance(self, allowance: Optional[int] = None):
+        """
+        Spill idle sessions' frames, frames past their session's budget and then
+        the least recently used ones until the frames in memory fit `allowance`.
+        """
+        if not self._spill_lock.acquire(blocking=False):
+            return
+        try:
+            allowance = self.published_budget if allowance is None else allowance
+            idle_before = time.monotonic() - self.idle_timeout
+            with self._lock:
+                # Oldest session first, then oldest frame within it
+                candidates = sorted(
+                    ((self._last_used.get(s, 0.0), f["published_at"], s, t, f["bytes"])
+                     for s, frames in self._frames.items() for t, f in frames.items() if "disk_bytes" not in f),
+                )
+                per_session: Dict[str, int] = {}
+                for _, _, s, _, nbytes in candidates:
+                    per_session[s] = per_session.get(s, 0) + nbytes
+                in_memory = sum(per_session.values())
+
+            for last_used, _, session_id, table_name, nbytes in candidates:
+                over_session = self.session_budget and per_session[session_id] > self.session_budget
+                if not (last_used < idle_before or over_session or in_memory > allowance):
+                    continue
+                if self._spill(session_id, table_name):
+                    per_session[session_id] -= nbytes
+                    in_memory -= nbytes
+        finally:
+            self._spill_lock.release()
+
+    def _spill(self, session_id: str, table_name: str) -> bool:
+        try:
+            disk_bytes = self.spill(session_id, table_name)
+        except Exception as e:
+            print(f"Failed to spill '{table_name}' of session {session_id}: {e}")
+            return False
+        if disk_bytes is None:
+            return False
+        with self._lock:
+            frame = self._frames.get(session_id, {}).get(table_name)
+            if frame is not None:
+                frame["disk_bytes"] = disk_bytes
+        self.spills += 1
+        return True
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def sessions(self) -> Dict[str, Dict[str, Any]]:
+        """Published frames per session: bytes in memory, bytes spilled to disk, idle seconds."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                session_id: {
+                    "frames": len(frames),
+                    "memory_bytes": sum(f["bytes"] for f in frames.values() if "disk_bytes" not in f),
+                    "spilled_frames": sum(1 for f in frames.values() if "disk_bytes" in f),
+                    "disk_bytes": sum(f.get("disk_bytes", 0) for f in frames.values()),
+                    "idle_seconds": round(now - self._last_used.get(session_id, now), 1),
+                }
+                for session_id, frames in self._frames.items()
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        duckdb = self.duckdb_usage()
+        with self._lock:
+            frames = sum(len(f) for f in self._frames.values())
+            in_memory = self._in_memory()
+            spilled = [f["disk_bytes"] for fs in self._frames.values() for f in fs.values() if "disk_bytes" in f]
+        return {
+            "budget_bytes": self.budget,
+            "rss_bytes": process_rss(),
+            "duckdb_limit_bytes": self.duckdb_limit,
+            "duckdb_bytes": duckdb["memory"],
+            "duckdb_spill_bytes": duckdb["temporary"],
+            "frames": frames,
+            "frame_bytes": in_memory,
+            "frames_budget_bytes": self.published_budget,
+            "spilled_frames": len(spilled),
+            "spilled_frame_bytes": sum(spilled),
+            "result_cache_bytes": result_cache.stats()["bytes"],
+            "spills": self.spills,
+            "rejected": self.rejected,
+        }
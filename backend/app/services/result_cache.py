@@ -0,0 +1,122 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.config import settings
+
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_WHITESPACE = re.compile(r"\s+")
+# Results of these can change between two runs of the same text
+_VOLATILE = re.compile(r"\b(random|uuid|gen_random_uuid|now|current_\w+|today|setseed|nextval)\b", re.I)
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and trailing semicolons outside string literals."""
+    parts = _STRING_LITERAL.split(sql.strip().rstrip(";").strip())
+    return "".join(
+        part if i % 2 else _WHITESPACE.sub(" ", part)
+        for i, part in enumerate(parts)
+    )
+
+
+def is_volatile(sql: str) -> bool:
+    return bool(_VOLATILE.search(sql))
+
+
+class TableVersions:
+    """
+    Monotonic version counter per table name, bumped whenever the table is
+    created, written to, replaced or published. `epoch` is bumped for
+    statements whose target cannot be determined and invalidates everything.
+    `generation` counts every bump, so it changes whenever anything did.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def bump(self, table_name: str):
+        name = table_name.split(".")[-1].lower()
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self.generation += 1
+
+    def bump_all(self):
+        with self._lock:
+            self._epoch += 1
+            self.generation += 1
+
+    def get(self, table_name: str) -> int:
+        return self._versions.get(table_name.split(".")[-1].lower(), 0)
+
+    def snapshot(self, table_names: Iterable[str]) -> Tuple:
+        with self._lock:
+            return (self._epoch,) + tuple(sorted(
+                (name.lower(), self._versions.get(name.lower(), 0)) for name in table_names
+            ))
+
+
+class ResultCache:
+    """
+    LRU cache of computed results bounded by an (estimated) memory budget.
+    Keys embed the table versions they were computed from, so a write to a
+    table simply makes older entries unreachable until LRU drops them.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+table_versions = TableVersions()
+result_cache = ResultCache(settings.result_cache_mb * 1024 * 1024)
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Callable, Optional
+
+import duckdb
+
+
+class SessionPoolExhausted(RuntimeError):
+    """Every pooled connection is busy and none can be evicted."""
+
+
+class SessionBusy(RuntimeError):
+    """The session's connection is in use."""
+
+
+class _SessionConnection:
+    def __init__(self, cursor: duckdb.DuckDBPyConnection):
+        self.cursor = cursor
+        # Requests of one session run one at a time on its connection
+        self.lock = threading.Lock()
+        # Requests holding or waiting for the connection; only idle ones are evicted
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class SessionConnectionPool:
+    """
+    Hands each session its own DuckDB connection (a cursor on the shared
+    database), so sessions run concurrently and keep their TEMP objects private.
+
+    The pool is bounded: idle connections are closed after `idle_timeout`
+    seconds, and when the pool is full the least recently used idle session is
+    evicted to make room.
+    """
+
+    def __init__(self, db: duckdb.DuckDBPyConnection, max_sessions: int, idle_timeout: float,
+                 on_connect: Optional[Callable[[str, duckdb.DuckDBPyConnection], None]] = None):
+        self._db = db
+        # Called with (session_id, connection) whenever a session connection is (re)created
+        self.on_connect = on_connect
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._entries: "OrderedDict[str, _SessionConnection]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, session_id: str) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Borrow the session's connection for the duration of the block."""
+        entry = self._checkout(session_id)
+        try:
+            with entry.lock:
+                yield entry.cursor
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    @contextmanager
+    def acquire_idle(self, session_id: str) -> Iterator[Optional[duckdb.DuckDBPyConnection]]:
+        """
+        Borrow the session's connection for background work (e.g. spilling its
+        frames) without creating it or counting as activity: yields None if the
+        session has no connection, raises SessionBusy if it is in use.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                if entry.in_use or not entry.lock.acquire(blocking=False):
+                    raise SessionBusy(f"Session {session_id} is busy")
+                entry.in_use += 1
+        if entry is None:
+            yield None
+            return
+        try:
+            yield entry.cursor
+        finally:
+            entry.lock.release()
+            with self._lock:
+                entry.in_use -= 1
+
+    def _checkout(self, session_id: str) -> _SessionConnection:
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(session_id)
+            if entry is None:
+                if len(self._entries) >= self.max_sessions:
+                    self._evict_lru()
+                entry = _SessionConnection(self._db.cursor())
+                if self.on_connect is not None:
+                    self.on_connect(session_id, entry.cursor)
+                self._entries[session_id] = entry
+            else:
+                self._entries.move_to_end(session_id)
+            entry.in_use += 1
+            return entry
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.idle_timeout
+        for session_id, entry in list(self._entries.items()):
+            if entry.last_used < deadline and not entry.in_use:
+                self._close(session_id)
+
+    def _evict_lru(self):
+        for session_id, entry in self._entries.items():
+            if not entry.in_use:
+                self._close(session_id)
+                return
+        raise SessionPoolExhausted(
+            f"All {self.max_sessions} session connections are busy, retry shortly"
+        )
+
+    def _close(self, session_id: str):
+        entry = self._entries.pop(session_id)
+        try:
+            entry.cursor.close()
+        except Exception as e:
+            print(f"Failed to close session connection {session_id}: {e}")
+
+    def close_session(self, session_id: str):
+        with self._lock:
+            if session_id in self._entries:
+                self._close(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "busy": sum(1 for e in self._entries.values() if e.in_use),
+                "max_sessions": self.max_sessions,
+            }
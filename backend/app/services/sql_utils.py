@@ -0,0 +1,19 @@
+"""Identifier quoting and type helpers shared by the SQL services."""
+
+
+def quote_ident(name: str) -> str:
+    """Quote a table/column identifier for safe splicing into DuckDB SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def is_numeric_type(duck_type: str) -> bool:
+    """True for DuckDB integer/floating/decimal column types."""
+    duck_type = duck_type.upper()
+    if duck_type.startswith("INTERVAL"):
+        return False
+    return any(t in duck_type for t in ("INT", "DOUBLE", "FLOAT", "DECIMAL", "REAL", "NUMERIC"))
+
+
+def quote_table(name: str) -> str:
+    """Quote a possibly qualified table name (`db.schema.table`) part by part."""
+    return ".".join(quote_ident(part) for part in name.split("."))
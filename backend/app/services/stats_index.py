@@ -0,0 +1,324 @@
+"""
+Per-table column statistics index.
+
+For every column the index keeps mergeable summaries: row/null counts,
+min/max, mean and M2 (for the variance), a KMV distinct sketch (the
+STATS_KMV_K smallest distinct hashes), for numeric columns a fixed-bin
+histogram and, for columns with at most STATS_MAX_VALUES distinct values,
+the count of every value (the grid's set filter lists). Entries are built in the background when a table is
+created, ingested or published, and brought up to date on lookup:
+
+* if every write since the build was an INSERT/COPY (see `note_append`),
+  only rows past the last seen rowid are scanned and merged in;
+* any other write (or an unknown one) triggers a full rebuild.
+
+Header stats and the simple analysis charts are then a lookup.
+"""
+import threading
+from decimal import Decimal
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.result_cache import table_versions
+from app.services.sql_utils import is_numeric_type, quote_ident, quote_table
+
+STATS_BINS = 20
+STATS_KMV_K = 1024
+STATS_MAX_TABLES = 1024
+# Columns with up to this many distinct values keep a value -> count map
+STATS_MAX_VALUES = 1000
+
+_HASH_SPACE = 2 ** 64
+
+
+def distinct_estimate(kmv: List[int]) -> int:
+    """Distinct count from a KMV sketch (exact below STATS_KMV_K values)."""
+    if len(kmv) < STATS_KMV_K:
+        return len(kmv)
+    return round((STATS_KMV_K - 1) * _HASH_SPACE / (kmv[-1] + 1))
+
+
+def _is_scalar(duck_type: str) -> bool:
+    """Values of the type can be listed and compared (no LIST/STRUCT/MAP/UNION)."""
+    duck_type = duck_type.upper()
+    return not any(t in duck_type for t in ("[", "STRUCT", "MAP", "UNION"))
+
+
+class StatsIndex:
+    def __init__(self, max_tables: int = STATS_MAX_TABLES):
+        self.max_tables = max_tables
+        # (scope, table) -> entry; scope is the session for TEMP tables/published views
+        self._entries: "OrderedDict[Tuple[Optional[str], str], Dict[str, Any]]" = OrderedDict()
+        # table -> versions produced by appends (rows only added after the last rowid)
+        self._append_versions: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[Optional[str], str], threading.Lock] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stats-index")
+
+    # ------------------------------------------------------------------
+    # Write notifications
+    # ------------------------------------------------------------------
+
+    def note_append(self, table_name: str):
+        """Record that the table's current version only appended rows."""
+        name = table_name.split(".")[-1].lower()
+        with self._lock:
+            self._append_versions.setdefault(name, set()).add(table_versions.get(name))
+
+    def schedule_build(self, connect: Callable, table_name: str, session_id: Optional[str] = None):
+        """Build the entry in the background; `connect` yields a DuckDB connection (context manager)."""
+        def build():
+            try:
+                with connect() as conn:
+                    self.get(conn, table_name, session_id)
+            except Exception as e:
+                print(f"Stats index build failed for '{table_name}': {e}")
+
+        self._executor.submit(build)
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def get(self, conn, table_name: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Up-to-date entry for `table_name`: {"row_count", "columns": {name: stats}}."""
+        name = table_name.split(".")[-1].lower()
+        key = (self._scope(conn, table_name, session_id), name)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            version = (table_versions.snapshot([]), table_versions.get(name))
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+            if entry is not None and entry["version"] == version:
+                return entry
+
+            if entry is not None and self._appends_only(name, entry["version"], version):
+                entry = self._append(conn, table_name, entry)
+            else:
+                entry = self._build(conn, table_name)
+            entry["version"] = version
+
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_tables:
+                    self._entries.popitem(last=False)
+            return entry
+
+    def column_stats(self, entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Public view of an entry: derived mean/std/distinct, no sketches."""
+        out = []
+        for name, s in entry["columns"].items():
+            count = s["count"]
+            out.append({
+                "name": name,
+                "type": s["type"],
+                "count": count,
+                "nulls": entry["row_count"] - count,
+                "distinct": min(distinct_estimate(s["kmv"]), count),
+                "min": s["min"],
+                "max": s["max"],
+                "mean": s.get("mean"),
+                "std": (s["m2"] / (count - 1)) ** 0.5 if s.get("m2") is not None and count > 1 else None,
+                "histogram": s.get("histogram"),
+            })
+        return out
+
+    @staticmethod
+    def _scope(conn, table_name: str, session_id: Optional[str]) -> Optional[str]:
+        row = conn.execute(
+            "SELECT bool_or(table_catalog = 'temp') FROM information_schema.tables WHERE table_name = ?",
+            [table_name.split(".")[-1]],
+        ).fetchone()
+        return (session_id or "default") if row and row[0] else None
+
+    def _appends_only(self, name: str, built, current) -> bool:
+        (built_epoch, built_version), (epoch, version) = built, current
+        if built_epoch != epoch:
+            return False
+        with self._lock:
+            appends = self._append_versions.get(name, set())
+            return all(v in appends for v in range(built_version + 1, version + 1))
+
+    # ------------------------------------------------------------------
+    # Scans
+    # ------------------------------------------------------------------
+
+    def _build(self, conn, table_name: str) -> Dict[str, Any]:
+        table = quote_table(table_name)
+        schema = [(row[0], row[1]) for row in conn.execute(f"DESCRIBE {table}").fetchall()]
+        has_rowid = self._has_rowid(conn, table)
+        row_count, columns, next_rowid = self._scan(conn, table, schema, has_rowid)
+        self._histograms(conn, table, columns, [name for name, s in columns.items() if s["numeric"]])
+        self._value_counts(conn, table, columns, [
+            name for name, s in columns.items() if len(s["kmv"]) <= STATS_MAX_VALUES and _is_scalar(s["type"])
+        ])
+        return {"row_count": row_count, "columns": columns, "next_rowid": next_rowid, "schema": schema}
+
+    def _append(self, conn, table_name: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        table = quote_table(table_name)
+        schema = [(row[0], row[1]) for row in conn.execute(f"DESCRIBE {table}").fetchall()]
+        if schema != entry["schema"] or entry["next_rowid"] is None:
+            return self._build(conn, table_name)
+        row_count, delta, next_rowid = self._scan(conn, table, schema, True, since_rowid=entry["next_rowid"])
+
+        # New rows inside the existing bins are simply added; a wider range needs new bins
+        rebin, in_range = [], []
+        for name, s in entry["columns"].items():
+            d = delta[name]
+            if s["numeric"] and d["count"]:
+                hist = s["histogram"]
+                if hist is None or float(d["min"]) < hist["edges"][0] or float(d["max"]) > hist["edges"][-1]:
+                    rebin.append(name)
+                else:
+                    in_range.append(name)
+            self._merge(s, d)
+
+        if in_range:
+            edges = {name: entry["columns"][name]["histogram"] for name in in_range}
+            self._histograms(conn, table, delta, in_range, since_rowid=entry["next_rowid"], edges=edges)
+            for name in in_range:
+                hist = entry["columns"][name]["histogram"]
+                hist["counts"] = [a + b for a, b in zip(hist["counts"], delta[name]["histogram"]["counts"])]
+        if rebin:
+            self._histograms(conn, table, entry["columns"], rebin)
+
+        counted = [name for name, s in entry["columns"].items() if s.get("values") is not None and delta[name]["count"]]
+        self._value_counts(conn, table, delta, counted, since_rowid=entry["next_rowid"])
+        for name in counted:
+            values = entry["columns"][name]["values"]
+            for value, count in delta[name]["values"].items():
+                values[value] = values.get(value, 0) + count
+            if len(values) > STATS_MAX_VALUES:
+                entry["columns"][name]["values"] = None
+
+        entry["row_count"] += row_count
+        entry["next_rowid"] = max(entry["next_rowid"], next_rowid or 0)
+        return entry
+
+    @staticmethod
+    def _has_rowid(conn, table: str) -> bool:
+        try:
+            conn.execute(f"SELECT rowid FROM {table} LIMIT 0")
+            return True
+        except Exception:
+            return False  # Views and registered DataFrames
+
+    @staticmethod
+    def _scan(conn, table: str, schema: List[Tuple[str, str]], has_rowid: bool,
+              since_rowid: Optional[int] = None):
+        """One SELECT with every mergeable per-column aggregate (optionally only rows past a rowid)."""
+        exprs = ["COUNT(*)", "MAX(rowid)" if has_rowid else "NULL"]
+        for name, dtype in schema:
+            col = quote_ident(name)
+            exprs += [
+                f"COUNT({col})", f"MIN({col})", f"MAX({col})",
+                f"min(DISTINCT hash({col}), {STATS_KMV_K}) FILTER (WHERE {col} IS NOT NULL)",
+            ]
+            if is_numeric_type(dtype):
+                exprs += [f"AVG({col}::DOUBLE)", f"VAR_POP({col}::DOUBLE) * COUNT({col})"]
+        where = f" WHERE rowid >= {int(since_rowid)}" if since_rowid is not None else ""
+        row = conn.execute(f"SELECT {', '.join(exprs)} FROM {table}{where}").fetchone()
+
+        values = iter(row[2:])
+        columns = {}
+        for name, dtype in schema:
+            numeric = is_numeric_type(dtype)
+            s = {
+                "type": dtype, "numeric": numeric,
+                "count": next(values), "min": next(values), "max": next(values),
+                "kmv": list(next(values) or []),
+            }
+            if numeric:
+                # DECIMAL extremes as floats, like the rest of the numeric stats
+                s["min"], s["max"] = (float(v) if isinstance(v, Decimal) else v for v in (s["min"], s["max"]))
+                s["mean"], s["m2"] = next(values), next(values)
+                s["histogram"] = None
+            columns[name] = s
+        next_rowid = row[1] + 1 if row[1] is not None else since_rowid
+        return row[0], columns, next_rowid
+
+    @staticmethod
+    def _histograms(conn, table: str, columns: Dict[str, Dict[str, Any]], names: List[str],
+                    since_rowid: Optional[int] = None, edges: Optional[Dict[str, Dict]] = None):
+        """Fixed-bin histograms of `names` in one SELECT; bins from `edges` or the column's min/max."""
+        targets, exprs, params = [], [], []
+        for name in names:
+            if edges is not None:
+                hist = edges[name]
+                lo, n_bins = hist["edges"][0], len(hist["counts"])
+                step = (hist["edges"][-1] - lo) / n_bins
+            else:
+                s = columns[name]
+                if s["min"] is None:
+                    s["histogram"] = None
+                    continue
+                lo, hi = float(s["min"]), float(s["max"])
+                n_bins = STATS_BINS if hi > lo else 1
+                step = (hi - lo) / n_bins if hi > lo else 1.0
+            col = quote_ident(name)
+            exprs.append(
+                f"histogram(LEAST(FLOOR(({col}::DOUBLE - ?) / ?)::INTEGER, ?)) FILTER (WHERE {col} IS NOT NULL)"
+            )
+            params += [lo, step, n_bins - 1]
+            targets.append((name, lo, step, n_bins))
+        if not targets:
+            return
+
+        where = f" WHERE rowid >= {int(since_rowid)}" if since_rowid is not None else ""
+        row = conn.execute(f"SELECT {', '.join(exprs)} FROM {table}{where}", params).fetchone()
+        for (name, lo, step, n_bins), counts_by_bin in zip(targets, row):
+            counts_by_bin = counts_by_bin or {}
+            columns[name]["histogram"] = {
+                "edges": [lo + i * step for i in range(n_bins + 1)],
+                "counts": [counts_by_bin.get(i, 0) for i in range(n_bins)],
+            }
+
+    @staticmethod
+    def _value_counts(conn, table: str, columns: Dict[str, Dict[str, Any]], names: List[str],
+                      since_rowid: Optional[int] = None):
+        """Count of every non-null value of `names`, all columns in one GROUPING SETS scan."""
+        for name in columns:
+            columns[name].setdefault("values", None)
+        if not names:
+            return
+        cols = [quote_ident(name) for name in names]
+        where = f" WHERE rowid >= {int(since_rowid)}" if since_rowid is not None else ""
+        rows = conn.execute(
+            f"SELECT {', '.join(cols)}, {', '.join(f'GROUPING({c})' for c in cols)}, COUNT(*) "
+            f"FROM {table}{where} GROUP BY GROUPING SETS ({', '.join(f'({c})' for c in cols)})"
+        ).fetchall()
+        counts = {name: {} for name in names}
+        for row in rows:
+            # Exactly one column is grouped in each row (GROUPING() = 0)
+            i = row[len(names):-1].index(0)
+            if row[i] is not None:
+                counts[names[i]][row[i]] = row[-1]
+        for name in names:
+            columns[name]["values"] = counts[name]
+
+    @staticmethod
+    def _merge(s: Dict[str, Any], d: Dict[str, Any]):
+        """Fold the stats of appended rows `d` into `s` (Chan et al. for mean/M2)."""
+        if not d["count"]:
+            return
+        n_a, n_b = s["count"], d["count"]
+        if s["numeric"]:
+            if n_a:
+                delta = d["mean"] - s["mean"]
+                s["m2"] = s["m2"] + d["m2"] + delta * delta * n_a * n_b / (n_a + n_b)
+                s["mean"] = s["mean"] + delta * n_b / (n_a + n_b)
+            else:
+                s["mean"], s["m2"] = d["mean"], d["m2"]
+        s["min"] = d["min"] if s["min"] is None else min(s["min"], d["min"])
+        s["max"] = d["max"] if s["max"] is None else max(s["max"], d["max"])
+        s["kmv"] = sorted(set(s["kmv"]) | set(d["kmv"]))[:STATS_KMV_K]
+        s["count"] = n_a + n_b
+
+
+stats_index = StatsIndex()
@@ -0,0 +1,216 @@
+"""
+Per-request tracing and process metrics.
+
+The HTTP middleware (see main.py) opens a `Trace` for each request in a
+context variable; services time their hot-path phases with `span(name)` and
+count rows/bytes with `count(name, n)`. Context variables follow the work
+into executor threads (see executors.py), so phases run on a worker land in
+the request's trace. Every phase and count is also folded into process-wide
+Prometheus metrics, rendered by `metrics.render()` for `/metrics`.
+
+When profiling is on for a request, DuckDB's profiler (the same operator
+tree as EXPLAIN ANALYZE, without running the query twice) is captured for
+each query and kept in a bounded history under the request's trace id.
+"""
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+# Upper bounds of the latency histogram buckets, seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Trace:
+    def __init__(self, profile: bool = False):
+        self.id = uuid.uuid4().hex[:16]
+        self.profile = profile
+        self.started = time.perf_counter()
+        # phase -> [seconds, calls]
+        self.phases: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.profiles: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float):
+        with self._lock:
+            phase = self.phases.setdefault(name, [0.0, 0])
+            phase[0] += seconds
+            phase[1] += 1
+
+    def add_count(self, name: str, value: int):
+        with self._lock:
+            self.counts[name] += value
+
+    def server_timing(self) -> str:
+        """`Server-Timing` header value: phases in ms, counts as descriptions."""
+        with self._lock:
+            parts = [f"{name};dur={seconds * 1000:.2f}" for name, (seconds, _) in self.phases.items()]
+            parts += [f'{name};desc="{value}"' for name, value in self.counts.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def start(profile: bool = False) -> Tuple[Trace, contextvars.Token]:
+    trace = Trace(profile=profile or settings.profile_queries)
+    return trace, _current.set(trace)
+
+
+def finish(token: contextvars.Token):
+    _current.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """Time a phase of the current request (and of the process-wide metrics)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def record(name: str, seconds: float):
+    trace = _current.get()
+    if trace is not None:
+        trace.add_phase(name, seconds)
+    metrics.observe("datasnail_phase_duration_seconds", seconds, phase=name)
+
+
+def count(name: str, value: int):
+    trace = _current.get()
+    if trace is not None:
+        trace.add_count(name, value)
+    metrics.inc(f"datasnail_{name}_total", value)
+
+
+def profiling() -> bool:
+    trace = _current.get()
+    return trace is not None and trace.profile
+
+
+@contextmanager
+def profiled(conn):
+    """Capture DuckDB's profile of the queries run on `conn` inside the block, when profiling is on."""
+    if not profiling():
+        yield
+        return
+    conn.execute("SET enable_profiling = 'no_output'")
+    try:
+        yield
+        # Only the last query's profile is kept by DuckDB: the statement that produced the result
+        profiles.add(_current.get(), json.loads(conn.get_profiling_information(format="json")))
+    finally:
+        conn.execute("RESET enable_profiling")
+
+
+class ProfileStore:
+    """Most recent `max_traces` captured profiles, by trace id."""
+
+    def __init__(self, max_traces: int):
+        self.max_traces = max_traces
+        self._profiles: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace, profile: Dict[str, Any]):
+        trace.profiles.append(profile)
+        with self._lock:
+            self._profiles[trace.id] = trace.profiles
+            self._profiles.move_to_end(trace.id)
+            while len(self._profiles) > self.max_traces:
+                self._profiles.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            return self._profiles.get(trace_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"trace_id": trace_id, "queries": [p.get("query_name") for p in entries],
+                 "latency": sum(p.get("latency", 0) for p in entries)}
+                for trace_id, entries in reversed(self._profiles.items())
+            ]
+
+
+class Metrics:
+    """Counters and histograms in Prometheus text exposition format."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+        # (name, labels) -> [bucket counts..., sum, count]
+        self._histograms: Dict[Tuple[str, Tuple], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def render(self, gauges: Iterable[Tuple[str, Dict[str, Any], float]] = ()) -> str:
+        """Exposition text; `gauges` are (name, labels, value) read at scrape time."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+        for (name, labels), hist in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, bucket_count in zip(self.buckets, hist):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {hist[-2]:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {hist[-1]}")
+        for name, labels, value in gauges:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+profiles = ProfileStore(settings.profile_history)
@@ -0,0 +1,13 @@
+"""
+Benchmark and load-test suite for the backend services.
+
+    python -m benchmarks run --rows 10000 1000000 --output before.json
+    python -m benchmarks load --rows 1000000 --concurrency 16 --duration 30 --output load.json
+    python -m benchmarks compare before.json after.json
+
+`run` times the services directly (preview, SQL, every analysis type,
+profile, Python exec/publish) on synthetic loans-like tables; `load` drives
+the FastAPI app in-process with concurrent clients. Both write JSON results
+tagged with the commit they ran on; `compare` diffs two such files and exits
+non-zero on regressions. Run from `backend/`.
+"""
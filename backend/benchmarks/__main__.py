@@ -0,0 +1,61 @@
+import argparse
+import sys
+
+import benchmarks
+from benchmarks.harness import metadata, write_results
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def _sizes(values):
+    # Accept 1e6-style sizes as well as plain integers
+    return [int(float(v)) for v in values]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=benchmarks.__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Time each service operation sequentially")
+    run.add_argument("--rows", nargs="+", default=DEFAULT_SIZES, help="Table sizes (1e4 .. 1e8)")
+    run.add_argument("--repeat", type=int, default=5, help="Timed iterations per case")
+    run.add_argument("--warm", action="store_true", help="Keep the result cache between iterations")
+    run.add_argument("--python-max-rows", type=float, default=1e6, help="Largest size for the Python cases")
+    run.add_argument("--only", nargs="*", default=[], help="Case names to run (default: all)")
+    run.add_argument("--output", help="JSON result file (default: stdout)")
+
+    load = commands.add_parser("load", help="Concurrent clients against the FastAPI app")
+    load.add_argument("--rows", nargs="+", default=[100_000])
+    load.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    load.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    load.add_argument("--mix", nargs="+", default=["preview", "run", "analysis"],
+                      help="Request types sent round-robin: preview run analysis profile health")
+    load.add_argument("--warm", action="store_true", help="Do not clear the result cache first")
+    load.add_argument("--output", help="JSON result file (default: stdout)")
+
+    cmp = commands.add_parser("compare", help="Diff two result files")
+    cmp.add_argument("baseline")
+    cmp.add_argument("candidate")
+    cmp.add_argument("--metric", default="p50", choices=["mean", "p50", "p95", "p99", "max"])
+    cmp.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        from benchmarks.compare import compare
+        return 1 if compare(args.baseline, args.candidate, args.metric, args.threshold) else 0
+
+    args.rows = _sizes(args.rows)
+    options = {k: v for k, v in vars(args).items() if k not in ("command", "output")}
+    if args.command == "run":
+        from benchmarks.suite import run_suite
+        results = run_suite(args.rows, args.repeat, args.warm, int(args.python_max_rows), args.only)
+    else:
+        from benchmarks.load import run_load
+        results = run_load(args.rows, args.concurrency, args.duration, args.mix, args.warm)
+    write_results(args.output, metadata(args.command, options), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""Side-by-side diff of two result files (e.g. from two commits)."""
+import json
+from typing import Any, Dict, List, Tuple
+
+
+def _key(result: Dict[str, Any]) -> Tuple:
+    return (result["name"], result.get("rows"), result.get("concurrency"), result.get("warm"))
+
+
+def compare(baseline_path: str, candidate_path: str, metric: str, threshold: float) -> int:
+    """Print the `metric` latency ratio per case; returns the number of regressions past `threshold`."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+    before = {_key(r): r for r in baseline["results"]}
+
+    print(f"{baseline['meta'].get('commit')} -> {candidate['meta'].get('commit')} ({metric} latency, ms)")
+    regressions: List[str] = []
+    for result in candidate["results"]:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+        a, b = old["latency_ms"].get(metric), result["latency_ms"].get(metric)
+        if not a or b is None:
+            continue
+        ratio = b / a
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(result["name"])
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        label = f"{result['name']} rows={result.get('rows')}"
+        if result.get("concurrency"):
+            label += f" c={result['concurrency']}"
+        print(f"  {label:<48} {a:>10.3f} {b:>10.3f}  x{ratio:.2f}{flag}")
+    return len(regressions)
@@ -0,0 +1,56 @@
+"""Synthetic tables shaped like data/loans.csv (plus a 0/1 `defaulted` target), deterministic for a given row count."""
+from app.services.execution_service import execution_service
+
+
+def _uniform(k: int) -> str:
+    """Deterministic uniform [0, 1) per row; `k` picks an independent stream."""
+    return f"((hash(range, {k}) % 1000000) / 1000000.0)"
+
+
+def loans_sql(table_name: str, rows: int) -> str:
+    return f"""
+        CREATE OR REPLACE TABLE {table_name} AS
+        SELECT
+            range + 1 AS user_id,
+            (500 + floor({_uniform(1)} * 39500))::INTEGER AS loan_amount,
+            CASE WHEN {_uniform(2)} < 0.7 THEN '36 months' ELSE '60 months' END AS term,
+            round(5 + {_uniform(3)} * 25, 2) AS int_rate,
+            chr(65 + floor({_uniform(4)} * 7)::INTEGER) AS grade,
+            CASE WHEN {_uniform(5)} < 0.02 THEN NULL
+                 ELSE (10000 + floor({_uniform(6)} * 190000))::INTEGER END AS annual_inc,
+            CASE WHEN {_uniform(7)} < 0.8 THEN 'Fully Paid' ELSE 'Charged Off' END AS loan_status,
+            ({_uniform(7)} >= 0.8)::INTEGER AS defaulted
+        FROM range({int(rows)})
+    """
+
+
+def table_name(rows: int) -> str:
+    return f"bench_loans_{rows}"
+
+
+def create_loans(rows: int) -> str:
+    """Create (or replace) the benchmark table for `rows` in the engine; returns its name."""
+    name = table_name(rows)
+    execution_service.run_sql(loans_sql(name, rows))
+    return name
+
+
+def drop_loans(rows: int):
+    execution_service.run_sql(f"DROP TABLE IF EXISTS {table_name(rows)}")
+
+
+def frame_code(var_name: str, rows: int) -> str:
+    """Python cell building the same shape of table as a DataFrame in a kernel."""
+    return f"""
+import numpy as np
+import pandas as pd
+_rng = np.random.default_rng(42)
+{var_name} = pd.DataFrame({{
+    "user_id": np.arange(1, {int(rows)} + 1),
+    "loan_amount": _rng.integers(500, 40000, {int(rows)}),
+    "term": np.where(_rng.random({int(rows)}) < 0.7, "36 months", "60 months"),
+    "int_rate": np.round(5 + _rng.random({int(rows)}) * 25, 2),
+    "grade": _rng.choice(list("ABCDEFG"), {int(rows)}),
+    "annual_inc": _rng.integers(10000, 200000, {int(rows)}),
+}})
+"""
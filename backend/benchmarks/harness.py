@@ -0,0 +1,162 @@
+"""Timing, peak-RSS sampling and the JSON result format shared by the suites."""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import duckdb
+
+RSS_SAMPLE_INTERVAL = 0.01 # Seconds
+
+
+def _rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _children(pid: int) -> List[int]:
+    pids = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    return pids
+
+
+def process_tree_rss() -> int:
+    """RSS of this process and its descendants (Python kernels) in bytes."""
+    total, stack = 0, [os.getpid()]
+    while stack:
+        pid = stack.pop()
+        try:
+            total += _rss_bytes(pid)
+        except OSError:
+            continue # Exited meanwhile
+        stack += _children(pid)
+    return total
+
+
+class PeakRSS:
+    """Highest process-tree RSS seen while the block runs (ru_maxrss where /proc is missing)."""
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._proc = os.path.exists("/proc/self/status")
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, process_tree_rss())
+
+    def __enter__(self):
+        if self._proc:
+            self.peak = process_tree_rss()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._proc:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, process_tree_rss())
+        else:
+            # Lifetime maximum: KiB on Linux, bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """Mean and nearest-rank percentiles in milliseconds."""
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))] * 1000
+
+    return {
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50": round(pct(50), 3),
+        "p95": round(pct(95), 3),
+        "p99": round(pct(99), 3),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+def measure(name: str, fn: Callable[[int], Any], repeat: int, warmup: int = 1,
+            before: Optional[Callable[[], None]] = None, **tags) -> Dict[str, Any]:
+    """
+    Call `fn(i)` `warmup` + `repeat` times (`before` runs untimed ahead of each
+    call) and report latency, sequential throughput and peak RSS.
+    """
+    for i in range(warmup):
+        if before:
+            before()
+        fn(i)
+    latencies = []
+    with PeakRSS() as rss:
+        for i in range(repeat):
+            if before:
+                before()
+            start = time.perf_counter()
+            fn(i)
+            latencies.append(time.perf_counter() - start)
+    busy = sum(latencies)
+    return {
+        "name": name,
+        **tags,
+        "iterations": repeat,
+        "latency_ms": latency_summary(latencies),
+        "throughput_ops": round(repeat / busy, 3) if busy else None,
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(suite: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "suite": suite,
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": args,
+    }
+
+
+def write_results(path: Optional[str], meta: Dict[str, Any], results: List[Dict[str, Any]]):
+    document = {"meta": meta, "results": results}
+    if path:
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2, default=str)
+        print(f"Wrote {len(results)} results to {path}")
+    else:
+        print(json.dumps(document, indent=2, default=str))
+
+
+def print_row(result: Dict[str, Any]):
+    lat = result.get("latency_ms", {})
+    print(f"  {result['name']:<28} rows={result.get('rows', '-'):<10} p50={lat.get('p50', '-')}ms "
+          f"p95={lat.get('p95', '-')}ms ops/s={result.get('throughput_ops')} rss={result.get('peak_rss_mb')}MB",
+          file=sys.stderr)
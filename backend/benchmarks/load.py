@@ -0,0 +1,96 @@
+"""Concurrent load driver against the FastAPI app, in-process through the ASGI transport."""
+import asyncio
+import itertools
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+import httpx
+
+from app.main import app
+from app.services.result_cache import result_cache
+
+from benchmarks import datasets
+from benchmarks.harness import PeakRSS, latency_summary, print_row
+
+PREVIEW_LIMIT = 100
+
+
+def _requests(table: str, rows: int) -> Dict[str, Any]:
+    """name -> fn(i) returning (method, path, json body)."""
+    return {
+        "preview": lambda i: ("POST", "/api/query/preview", {
+            "table_name": table, "limit": PREVIEW_LIMIT,
+            "offset": (i * 7919 * PREVIEW_LIMIT) % max(rows - PREVIEW_LIMIT, 1)}),
+        "run": lambda i: ("POST", "/api/query/run", {
+            "sql": f"SELECT grade, COUNT(*) AS n, AVG(int_rate) AS rate FROM {table} "
+                   f"WHERE loan_amount > {i % 30000} GROUP BY grade ORDER BY grade"}),
+        "analysis": lambda i: ("POST", "/api/analysis/analyze/stats", {
+            "table_name": table, "column": "loan_amount",
+            "type": ("distribution", "missing", "outlier")[i % 3]}),
+        "profile": lambda i: ("POST", "/api/analysis/profile", {"table_name": table}),
+        "health": lambda i: ("GET", "/health", None),
+    }
+
+
+async def _drive(mix: List[str], table: str, rows: int, concurrency: int, duration: float):
+    requests = _requests(table, rows)
+    unknown = set(mix) - set(requests)
+    if unknown:
+        raise SystemExit(f"Unknown request types: {', '.join(sorted(unknown))} (known: {', '.join(requests)})")
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    async def client(c: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            i = next(counter)
+            name = mix[i % len(mix)]
+            method, path, body = requests[name](i)
+            start = time.perf_counter()
+            response = await c.request(method, path, json=body)
+            latencies[name].append(time.perf_counter() - start)
+            statuses[name][response.status_code] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as c:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(c) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def run_load(sizes: List[int], concurrency: List[int], duration: float, mix: List[str],
+             warm: bool) -> List[Dict[str, Any]]:
+    results = []
+    for rows in sizes:
+        print(f"Generating {rows:,} rows...", file=sys.stderr)
+        table = datasets.create_loans(rows)
+        try:
+            for clients in concurrency:
+                if not warm:
+                    result_cache.clear()
+                with PeakRSS() as rss:
+                    latencies, statuses, elapsed = asyncio.run(_drive(mix, table, rows, clients, duration))
+                for name in mix:
+                    ok = statuses[name].get(200, 0)
+                    result = {
+                        "name": f"load_{name}",
+                        "rows": rows,
+                        "concurrency": clients,
+                        "warm": warm,
+                        "iterations": len(latencies[name]),
+                        "latency_ms": latency_summary(latencies[name]),
+                        # Completed (2xx) requests per second of wall time
+                        "throughput_ops": round(ok / elapsed, 3),
+                        "status_codes": {str(k): v for k, v in sorted(statuses[name].items())},
+                        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+                    }
+                    print_row(result)
+                    results.append(result)
+        finally:
+            datasets.drop_loans(rows)
+    return results
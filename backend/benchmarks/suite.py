@@ -0,0 +1,90 @@
+"""Service-level benchmarks: one case per backend operation and table size."""
+import sys
+from typing import Any, Dict, List
+
+from app.schemas.analysis import AnalysisRequest, ProfileRequest
+from app.schemas.preview import PreviewRequest
+from app.services.analysis_service import analysis_service
+from app.services.execution_service import execution_service
+from app.services.profile_service import profile_service
+from app.services.python_service import python_service
+from app.services.result_cache import result_cache
+
+from benchmarks import datasets
+from benchmarks.harness import measure, print_row
+
+ANALYSIS_TYPES = ("distribution", "missing", "outlier", "dupes", "correlation", "binning", "woe", "psi")
+BENCH_SESSION = "bench"
+PREVIEW_LIMIT = 100
+
+
+def _cases(table: str, rows: int) -> Dict[str, Any]:
+    """name -> fn(iteration) for the engine-side operations."""
+    cases = {
+        # Pages spread over the table so the window does not always start at row 0
+        "preview": lambda i: execution_service.preview_table(PreviewRequest(
+            table_name=table, limit=PREVIEW_LIMIT, offset=(i * 7919 * PREVIEW_LIMIT) % max(rows - PREVIEW_LIMIT, 1))),
+        "preview_filtered": lambda i: execution_service.preview_table(PreviewRequest(
+            table_name=table, limit=PREVIEW_LIMIT, filter=f"grade = '{'ABCDEFG'[i % 7]}' AND int_rate > 20")),
+        "run_aggregate": lambda i: execution_service.run_sql(
+            f"SELECT grade, term, COUNT(*) AS n, AVG(int_rate) AS rate, SUM(loan_amount) AS amount "
+            f"FROM {table} GROUP BY ALL ORDER BY ALL", limit=1000),
+        "run_scan": lambda i: execution_service.run_sql(
+            f"SELECT * FROM {table} WHERE annual_inc > {100000 + i} ORDER BY int_rate DESC", limit=1000),
+        "profile": lambda i: profile_service.profile(ProfileRequest(table_name=table)),
+        "column_stats": lambda i: analysis_service.column_stats(table),
+    }
+    # Request fields beyond `column`: WOE/IV needs a binary target, PSI two periods (halves of the table)
+    params = {
+        "dupes": {"column": "*"},
+        "woe": {"target": "defaulted"},
+        "psi": {"period_column": "user_id", "baseline": [1, rows // 2 + 1], "current": [rows // 2 + 1, None]},
+    }
+    for kind in ANALYSIS_TYPES:
+        fields = dict({"column": "loan_amount"}, **params.get(kind, {}))
+        cases[f"analysis_{kind}"] = (lambda kind, fields: lambda i: analysis_service.analyze_stats(
+            AnalysisRequest(table_name=table, type=kind, **fields)))(kind, fields)
+    cases["analysis_distribution_approx"] = lambda i: analysis_service.analyze_stats(AnalysisRequest(
+        table_name=table, type="distribution", column="loan_amount", mode="approximate"))
+    return cases
+
+
+def run_suite(sizes: List[int], repeat: int, warm: bool, python_max_rows: int,
+              only: List[str]) -> List[Dict[str, Any]]:
+    # Cold by default: every timed call computes instead of hitting the result cache
+    before = None if warm else result_cache.clear
+    results = []
+    for rows in sizes:
+        print(f"Generating {rows:,} rows...", file=sys.stderr)
+        table = datasets.create_loans(rows)
+        try:
+            for name, fn in _cases(table, rows).items():
+                if only and name not in only:
+                    continue
+                result = measure(name, fn, repeat, before=before, rows=rows, warm=warm)
+                print_row(result)
+                results.append(result)
+        finally:
+            datasets.drop_loans(rows)
+
+        if rows <= python_max_rows and (not only or {"python_exec", "python_publish"} & set(only)):
+            results += _python_cases(rows, repeat)
+    return results
+
+
+def _python_cases(rows: int, repeat: int) -> List[Dict[str, Any]]:
+    """Building a frame in the session's kernel, then publishing it to SQL (kernel RSS included)."""
+    code = datasets.frame_code("bench_df", rows)
+    results = []
+    try:
+        for name, fn in (
+            ("python_exec", lambda i: python_service.execute_script(BENCH_SESSION, code)),
+            ("python_publish", lambda i: python_service.publish_variable(
+                BENCH_SESSION, "bench_df", table_name=f"bench_pub_{rows}")),
+        ):
+            result = measure(name, fn, repeat, rows=rows)
+            print_row(result)
+            results.append(result)
+    finally:
+        python_service.restart(BENCH_SESSION)
+    return results